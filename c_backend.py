@@ -0,0 +1,300 @@
+import hashlib
+import os
+import subprocess
+import sys
+import time
+
+import compiler
+import interpreter
+import python_backend
+from compiler import Token
+
+# Translates the abstract syntax trees of compiler.py to C99 and compiles the
+# result with the C compiler of the system, with the 32-bit integer semantics
+# of the JVM. Run a program on stdin with
+#     python3 c_backend.py program < input
+# Options:
+#     --source      print the generated C source instead
+#     --cc CC       C compiler to use (default cc)
+#     --cache DIR   directory of the binary cache
+#     --no-cache    compile without the cache
+#     --stats       report compile and run time to stderr
+
+# Variables are int32_t. Signed overflow is undefined in C, so addition,
+# subtraction and multiplication are done on uint32_t, where they wrap around,
+# and the result is converted back to int32_t where its value matters: when it
+# is assigned or written, compared, or divided. This conversion is
+# implementation-defined in C99 for values above INT32_MAX; gcc and clang
+# reduce modulo 2**32 as the JVM does.
+# While statements and conditions are lowered to conditional jumps with goto
+# in the same way as by While_AST.code() and Boolean_AST.code().
+
+# Runtime of the generated program. read_int() and write_int() behave like
+# read()I and write(I)V of the generated class: input is read in blocks of
+# input_buffer_size bytes, output collected in a buffer of
+# output_buffer_size bytes, and division by zero and reading beyond the end of
+# the input stop the program with the exception that Java would report, as
+# does an integer in the input that does not fit in 32 bits.
+runtime = '''#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+static signed char input[INPUT_BUFFER_SIZE];
+static size_t position, length;
+static char buffer[OUTPUT_BUFFER_SIZE];
+static size_t count;
+
+static void flush(void) {
+    fwrite(buffer, 1, count, stdout);
+    fflush(stdout);
+    count = 0;
+}
+
+static void fail(const char *exception) {
+    flush();
+    fprintf(stderr, "Exception in thread \\"main\\" %s\\n", exception);
+    exit(1);
+}
+
+/* Returns the next byte of the input, which is negative at the end of the
+   input or for bytes above 127, as baload sign-extends them. */
+static int next(void) {
+    if (position >= length) {
+        length = fread(input, 1, sizeof input, stdin);
+        if (length == 0)
+            return -1;
+        position = 0;
+    }
+    return input[position++];
+}
+
+/* Skips everything up to the next digit, or minus sign followed by a digit,
+   and parses the integer there. */
+static int32_t read_int(void) {
+    int c = next(), negative;
+    uint64_t value = 0;
+    for (;;) {
+        if (c < 0)
+            fail("java.util.NoSuchElementException");
+        negative = c == '-';
+        if (negative)
+            c = next();
+        if (c >= '0' && c <= '9')
+            break;
+        /* a minus sign without a digit after it separates numbers, and the
+           character after it is looked at again */
+        if (!negative)
+            c = next();
+    }
+    while (c >= '0' && c <= '9') {
+        value = value * 10 + (c - '0');
+        if (value > (negative ? 2147483648u : 2147483647u))
+            fail("java.util.InputMismatchException");
+        c = next();
+    }
+    return (int32_t)(negative ? 0u - (uint32_t)value : (uint32_t)value);
+}
+
+static void write_int(int32_t value) {
+    char digits[12];
+    int i = sizeof digits;
+    uint32_t magnitude = value < 0 ? 0u - (uint32_t)value : (uint32_t)value;
+    if (count > sizeof buffer - sizeof digits)
+        flush();
+    do {
+        digits[--i] = '0' + magnitude % 10;
+        magnitude /= 10;
+    } while (magnitude != 0);
+    if (value < 0)
+        digits[--i] = '-';
+    memcpy(buffer + count, digits + i, sizeof digits - i);
+    count += sizeof digits - i;
+    buffer[count++] = '\\n';
+}
+
+/* Division rounds towards zero in C99 as on the JVM. INT32_MIN / -1
+   overflows, which the JVM defines to give INT32_MIN. */
+static int32_t divide(int32_t a, int32_t b) {
+    if (b == 0)
+        fail("java.lang.ArithmeticException: / by zero");
+    if (b == -1)
+        return (int32_t)(0u - (uint32_t)a);
+    return a / b;
+}
+
+'''
+
+class Translator:
+    '''The interface comprises the constructor and the method source.'''
+
+    def __init__(self, tree):
+        '''tree is a Program_AST.'''
+        self.tree = tree
+        self.label_generator = compiler.Label()
+
+    def source(self):
+        '''Returns the C source of the program.'''
+        names = []
+        for node in compiler.walk(self.tree):
+            if isinstance(node, compiler.Identifier_AST) and \
+               'v_' + node.identifier not in names:
+                names.append('v_' + node.identifier)
+        result = runtime.replace('INPUT_BUFFER_SIZE',
+                                 str(compiler.input_buffer_size)) \
+                        .replace('OUTPUT_BUFFER_SIZE',
+                                 str(compiler.output_buffer_size)) + \
+                 'int main(void) {\n'
+        if names:
+            result += compiler.indent('int32_t ' + ' = 0, '.join(names) +
+                                      ' = 0;', 1)
+        return result + \
+               self.statements(self.tree.program) + \
+               compiler.indent('flush();', 1) + \
+               compiler.indent('return 0;', 1) + \
+               '}\n'
+
+    def statements(self, tree):
+        '''Returns the C source of Statements_AST tree.'''
+        result = ''
+        for st in tree.statements:
+            if isinstance(st, compiler.Assign_AST):
+                result += compiler.indent('v_' + st.identifier.identifier +
+                                          ' = ' + exact(st.expression) + ';',
+                                          1)
+            elif isinstance(st, compiler.Write_AST):
+                result += compiler.indent('write_int(' + exact(st.expression) +
+                                          ');', 1)
+            elif isinstance(st, compiler.Read_AST):
+                result += compiler.indent('v_' + st.identifier.identifier +
+                                          ' = read_int();', 1)
+            elif isinstance(st, compiler.While_AST):
+                # The loop is inverted as in While_AST.code().
+                l1 = self.label_generator.next()
+                l2 = self.label_generator.next()
+                result += self.jump(st.condition, False, l2) + \
+                          l1 + ':\n' + \
+                          self.statements(st.body) + \
+                          self.jump(st.condition, True, l1) + \
+                          l2 + ': ;\n'
+            else: # If_AST or If_Else_AST
+                l1 = self.label_generator.next()
+                result += self.jump(st.condition, False, l1) + \
+                          self.statements(st.then)
+                if isinstance(st, compiler.If_Else_AST):
+                    l2 = self.label_generator.next()
+                    result += compiler.indent('goto ' + l2 + ';', 1) + \
+                              l1 + ': ;\n' + \
+                              self.statements(st.again)
+                    l1 = l2
+                result += l1 + ': ;\n'
+        return result
+
+    def jump(self, tree, outcome, label):
+        '''Returns C source that jumps to label if condition tree evaluates
+           to outcome and falls through otherwise.'''
+        if isinstance(tree, compiler.Comparison_AST):
+            op = { '<':'<', '=':'==', '>':'>', '<=':'<=', '!=':'!=', '>=':'>=' }
+            negated = { '<':'>=', '=':'!=', '>':'<=', '<=':'>', '!=':'==',
+                        '>=':'<' }
+            return compiler.indent('if (' + exact(tree.left) + ' ' +
+                                   (op if outcome else negated)[tree.op] +
+                                   ' ' + exact(tree.right) + ') goto ' +
+                                   label + ';', 1)
+        elif tree.op == Token.NOT:
+            return self.jump(tree.left, not outcome, label)
+        elif (tree.op == Token.AND) == outcome:
+            # and jumping if true, or jumping if false: the left operand
+            # decides only if it has the other outcome
+            skip = self.label_generator.next()
+            return self.jump(tree.left, not outcome, skip) + \
+                   self.jump(tree.right, outcome, label) + \
+                   skip + ': ;\n'
+        return self.jump(tree.left, outcome, label) + \
+               self.jump(tree.right, outcome, label)
+
+def exact(tree):
+    '''Returns the C source of expression tree as int32_t.'''
+    if isinstance(tree, compiler.Number_AST):
+        value = interpreter.wrap(int(tree.number))
+        # -2147483648 would be the negation of a constant that does not fit
+        return '(-2147483647 - 1)' if value == -2147483648 else str(value)
+    elif isinstance(tree, compiler.Identifier_AST):
+        return 'v_' + tree.identifier
+    elif tree.op == '/':
+        return 'divide(' + exact(tree.left) + ', ' + exact(tree.right) + ')'
+    return '(int32_t)' + loose(tree)
+
+def loose(tree):
+    '''Returns the C source of expression tree as uint32_t.'''
+    if isinstance(tree, compiler.Number_AST):
+        return str(int(tree.number) & 0xFFFFFFFF) + 'u'
+    elif isinstance(tree, compiler.Identifier_AST) or tree.op == '/':
+        return '(uint32_t)' + exact(tree)
+    return '(' + loose(tree.left) + ' ' + tree.op + ' ' + loose(tree.right) + ')'
+
+def translate(tree):
+    '''Returns the C source of the Program_AST tree.'''
+    return Translator(tree).source()
+
+def build(source, directory, cc='cc'):
+    '''Compiles the C source with cc -O2 and returns the name of the binary.
+       Binaries are kept in directory, named by a hash of source and cc, and
+       are reused if they are already there.'''
+    key = hashlib.sha256((cc + '\n' + source).encode()).hexdigest()
+    binary = os.path.join(directory, key)
+    if os.path.exists(binary):
+        return binary
+    os.makedirs(directory, exist_ok=True)
+    # compile to files of our own first, so that no process can run a
+    # partially written binary
+    temporary = binary + '.' + str(os.getpid())
+    with open(temporary + '.c', 'w') as source_file:
+        source_file.write(source)
+    try:
+        subprocess.run([cc, '-O2', '-std=c99', '-o', temporary,
+                        temporary + '.c'], check=True)
+        os.replace(temporary, binary)
+    finally:
+        os.remove(temporary + '.c')
+    return binary
+
+if __name__ == '__main__':
+    import argparse
+    import tempfile
+    arguments = argparse.ArgumentParser(
+        description='Runs a program on stdin by translating it to C.')
+    arguments.add_argument('program', help='file with the program')
+    arguments.add_argument('--source', action='store_true',
+                           help='print the generated C source instead')
+    arguments.add_argument('--cc', default='cc',
+                           help='C compiler to use (default %(default)s)')
+    arguments.add_argument('--cache', default=python_backend.cache_directory,
+                           metavar='DIR', help='directory of the binary cache '
+                           '(default %(default)s)')
+    arguments.add_argument('--no-cache', action='store_true',
+                           help='compile without the cache')
+    arguments.add_argument('--stats', action='store_true',
+                           help='report compile and run time to stderr')
+    options = arguments.parse_args()
+
+    with open(options.program) as program_file:
+        source = translate(compiler.parse(program_file))
+    if options.source:
+        print(source, end='')
+        sys.exit()
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as temporary:
+        try:
+            binary = build(source, temporary if options.no_cache
+                           else options.cache, options.cc)
+        except (OSError, subprocess.CalledProcessError) as error:
+            sys.exit('c_backend.py: compiling failed: ' + str(error))
+        built = time.perf_counter()
+        status = subprocess.run([binary]).returncode
+        finished = time.perf_counter()
+    if options.stats:
+        print('compiled in ' + '%.3f' % (built - start) + ' s, ' +
+              'ran in ' + '%.3f' % (finished - built) + ' s',
+              file=sys.stderr)
+    sys.exit(status)
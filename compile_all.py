@@ -0,0 +1,180 @@
+import concurrent.futures
+import contextlib
+import glob
+import io
+import os
+import sys
+import time
+
+import compiler
+
+# Compiles many programs with a pool of worker processes. Each program is
+# compiled to Jasmin assembler in a file next to it, with the extension .j
+# instead of its own. Run with
+#     python3 compile_all.py path ...
+# where a path is a program, a directory, whose .prog files are compiled, or
+# a glob pattern. Failures are reported per program on stderr, as are
+# programs that would overwrite the .j file of another, such as a.prog and
+# a.txt, which are not compiled.
+# Options:
+#     --workers N   number of worker processes (default: number of CPUs)
+#     --unroll N    unroll loops with a constant trip count N times
+#     --cache DIR   reuse the code of earlier compilations from the cache of
+#                   compile_cache.py in DIR
+#     --stats       report programs per second to stderr
+#     --scaling     compile everything with 1, 2, 4, ... workers up to
+#                   --workers and report programs per second for each
+
+# The extension of the programs in directories.
+extension = '.prog'
+
+# Files matching a pattern that have these extensions are not programs.
+skipped = ['.j', '.class', '.in', '.out']
+
+def programs(paths):
+    '''Returns the sorted names of the programs that paths denote.'''
+    result = set()
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, subdirectories, files in os.walk(path):
+                result.update(os.path.join(directory, name) for name in files
+                              if os.path.splitext(name)[1] == extension)
+        elif os.path.exists(path):
+            result.add(path)
+        else:
+            result.update(name for name in glob.glob(path, recursive=True)
+                          if os.path.isfile(name) and
+                          os.path.splitext(name)[1] not in skipped)
+    return sorted(result)
+
+def collisions(names):
+    '''Returns a dictionary that maps each of names whose code would be
+       written to the same .j file as that of an earlier one of names to the
+       earlier one.'''
+    first = {}
+    result = {}
+    for name in names:
+        output = os.path.normpath(os.path.splitext(name)[0] + '.j')
+        if output in first:
+            result[name] = first[output]
+        else:
+            first[output] = name
+    return result
+
+cache = None # compile_cache.Cache used by compile_file, if any
+
+def warm(unroll_factor, cache_directory=None):
+    '''Prepares a worker: sets the options of the compiler and the cache and
+       compiles a small program, so that the first real program does not pay
+       for loading the code of the compiler.'''
+    global cache
+    compiler.unroll_factor = unroll_factor
+    if cache_directory != None:
+        import compile_cache # which imports this module
+        cache = compile_cache.Cache(cache_directory)
+    compile_source('x := 0; while x < 2 do read y; write x + y end')
+
+def compile_source(source):
+    '''Returns the Jasmin code of the program source.'''
+    compiler.reset()
+    with io.StringIO(source) as input_file:
+        return compiler.parse(input_file).code()
+
+def diagnosed(source, tree=False):
+    '''Returns a pair of the Jasmin code of the program source, or its
+       abstract syntax tree if tree is set, and None. Returns a pair of None
+       and the error message if the program cannot be compiled.'''
+    output = io.StringIO()
+    try:
+        # The compiler prints syntax errors to stdout and exits.
+        with contextlib.redirect_stdout(output):
+            if tree:
+                compiler.reset()
+                with io.StringIO(source) as input_file:
+                    return compiler.parse(input_file).indented(0), None
+            return compile_source(source), None
+    except SystemExit:
+        return None, output.getvalue().strip() or 'compilation stopped'
+    except Exception as error:
+        return None, output.getvalue().strip() or \
+               type(error).__name__ + ': ' + str(error)
+
+def compile_file(name):
+    '''Compiles the program in the file name to name.j, without the
+       extension of name. Returns None or the error message.'''
+    try:
+        with open(name) as input_file:
+            source = input_file.read()
+        code, error = cache.compile(source) if cache != None \
+                      else diagnosed(source)
+        if code != None:
+            with open(os.path.splitext(name)[0] + '.j', 'w') as output_file:
+                output_file.write(code)
+        return error
+    except OSError as error:
+        return str(error)
+
+def compile_all(names, workers, unroll_factor=compiler.unroll_factor,
+                cache_directory=None):
+    '''Compiles the programs in the files names with workers processes,
+       using the cache in cache_directory if given. Returns a list of the
+       results of compile_file in the order of names.'''
+    with concurrent.futures.ProcessPoolExecutor(
+            workers, initializer=warm,
+            initargs=(unroll_factor, cache_directory)) as pool:
+        # chunks amortise the communication with the workers, while still
+        # leaving several chunks per worker to balance the load
+        chunk = max(1, len(names) // (4 * workers))
+        return list(pool.map(compile_file, names, chunksize=chunk))
+
+if __name__ == '__main__':
+    import argparse
+    arguments = argparse.ArgumentParser(
+        description='Compiles programs to Jasmin assembler in parallel.')
+    arguments.add_argument('paths', nargs='+', metavar='path',
+                           help='program, directory or glob pattern')
+    arguments.add_argument('--workers', type=int, default=os.cpu_count(),
+                           metavar='N', help='number of worker processes '
+                           '(default %(default)s)')
+    arguments.add_argument('--unroll', type=int,
+                           default=compiler.unroll_factor, metavar='N',
+                           help='unroll loops with a constant trip count N '
+                           'times (default %(default)s)')
+    arguments.add_argument('--cache', metavar='DIR',
+                           help='reuse the code of earlier compilations from '
+                           'the cache of compile_cache.py in DIR')
+    arguments.add_argument('--stats', action='store_true',
+                           help='report programs per second to stderr')
+    arguments.add_argument('--scaling', action='store_true',
+                           help='compile with 1, 2, 4, ... workers up to '
+                           '--workers and report programs per second')
+    options = arguments.parse_args()
+    if options.workers < 1:
+        arguments.error('--workers must be at least 1')
+
+    names = programs(options.paths)
+    clashes = collisions(names)
+    names = [name for name in names if name not in clashes]
+    counts = [options.workers]
+    if options.scaling:
+        counts = [2 ** k for k in range(options.workers.bit_length())
+                  if 2 ** k < options.workers] + [options.workers]
+    for workers in counts:
+        start = time.perf_counter()
+        errors = compile_all(names, workers, options.unroll, options.cache)
+        elapsed = time.perf_counter() - start
+        if options.stats or options.scaling:
+            print(str(len(names)) + ' programs with ' + str(workers) +
+                  ' workers in ' + '%.3f' % elapsed + ' s, ' +
+                  '%.0f' % (len(names) / max(elapsed, 1e-9)) +
+                  ' programs/s', file=sys.stderr)
+    failed = 0
+    for name, earlier in clashes.items():
+        print(name + ': would overwrite the code of ' + earlier,
+              file=sys.stderr)
+        failed += 1
+    for name, error in zip(names, errors):
+        if error != None:
+            print(name + ': ' + error, file=sys.stderr)
+            failed += 1
+    sys.exit(1 if failed else 0)
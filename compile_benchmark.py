@@ -0,0 +1,185 @@
+import json
+import math
+import os
+import subprocess
+import sys
+
+import generator
+
+# Measures how the time of the scanners, the parsers and the code generator
+# grows with the size of programs of the shapes of generator.py, and compares
+# the results with a stored baseline:
+#     python3 compile_benchmark.py
+# Each stage is timed by the --profile option of its tool, as the CPU time of
+# one phase, without tracing memory, which would slow down the phases. For
+# each stage and shape the exponent k of time ~ size ** k is fitted to the
+# times at all sizes, so that an exponent near 2 shows a stage that is
+# quadratic in the size of the program. The exponents, unlike the times,
+# hardly depend on the machine, so only they are checked. The exit status is
+# 1 if an exponent exceeds --max-exponent, unless the stage and shape is
+# allowed by --allow, and then if it exceeds the exponent in the baseline by
+# more than 0.25. The times are reported for information.
+# Options:
+#     --sizes N ...      sizes of the programs (default 250 500 1000 2000)
+#     --shapes NAME ...  shapes of the programs (default all)
+#     --stages NAME ...  stages to measure (default all)
+#     --seed N           seed of the programs
+#     --repeat N         runs per measurement, of which the fastest counts
+#     --baseline FILE    baseline to compare with (default
+#                        benchmarks/compile_baseline.json)
+#     --max-exponent K   exponents above K are a regression (default 1.3)
+#     --allow KEY ...    stage/shape results, such as scanner/deep, whose
+#                        exponent may exceed K as long as it does not exceed
+#                        that in the baseline by more than 0.25
+#     --update           store the results as the baseline instead
+
+directory = os.path.dirname(os.path.abspath(__file__))
+baseline_file = os.path.join(directory, 'benchmarks', 'compile_baseline.json')
+
+# stage: (tool, phase of its --profile output)
+stages = {
+    'scanner':          ('scanner.py',    'scan'),
+    'parser':           ('parser.py',     'parse'),
+    'ply_parser':       ('ply_parser.py', 'parse'),
+    'compiler_scanner': ('compiler.py',   'scan'),
+    'compiler_parser':  ('compiler.py',   'parse'),
+    'code_generator':   ('compiler.py',   'code'),
+}
+
+# Only these tools accept and, or and not, which the boolean shape uses.
+boolean_tools = ['scanner.py', 'compiler.py']
+
+def profile(tool, source):
+    '''Runs tool with --profile on the program source and returns a
+       dictionary of the CPU time of each of its phases.'''
+    result = subprocess.run([sys.executable, os.path.join(directory, tool),
+                             '--profile'], input=source, cwd=directory,
+                            capture_output=True, text=True,
+                            env=dict(os.environ, PROFILE_MEMORY='0'))
+    try:
+        measurements = json.loads(result.stderr.splitlines()[-1])
+    except (IndexError, ValueError):
+        raise RuntimeError(tool + ' failed: ' +
+                           (result.stderr or result.stdout).strip())
+    return { phase['name']:phase['cpu_s']
+             for phase in measurements['phases'] }
+
+def fit(sizes, times):
+    '''Returns the exponent k of the power law time ~ size ** k that fits
+       the times at the sizes best, by least squares on a log-log scale.'''
+    xs = [math.log(size) for size in sizes]
+    ys = [math.log(max(time, 1e-6)) for time in times]
+    mean_x, mean_y = sum(xs) / len(xs), sum(ys) / len(ys)
+    variance = sum((x - mean_x) ** 2 for x in xs)
+    if variance == 0:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y)
+               for x, y in zip(xs, ys)) / variance
+
+def measure(names, shapes, sizes, seed=0, repeat=3):
+    '''Returns a dictionary that maps 'stage/shape' for the stages names
+       and the shapes to a dictionary of the sizes, the fastest time in
+       seconds at each size and the fitted exponent.'''
+    results = {}
+    for shape in shapes:
+        tools = sorted(set(stages[name][0] for name in names
+                           if shape != 'boolean' or
+                           stages[name][0] in boolean_tools))
+        times = { tool:[] for tool in tools } # phase times per size
+        for size in sizes:
+            source = generator.program(seed, **generator.shapes[shape](size))
+            for tool in tools:
+                runs = [profile(tool, source) for i in range(repeat)]
+                times[tool].append({ phase:min(run[phase] for run in runs)
+                                     for phase in runs[0] })
+        for name in names:
+            tool, phase = stages[name]
+            if tool in tools:
+                seconds = [phases[phase] for phases in times[tool]]
+                results[name + '/' + shape] = {
+                    'sizes':list(sizes), 'seconds':seconds,
+                    'exponent':round(fit(sizes, seconds), 3) }
+    return results
+
+def regressions(results, baseline, max_exponent=1.3, allowed=()):
+    '''Returns a dictionary that maps the keys of the results that regress
+       to the reason: those whose exponent exceeds max_exponent, unless they
+       are in allowed, and those in allowed whose exponent also exceeds that
+       in baseline by more than 0.25.'''
+    found = {}
+    for key, result in results.items():
+        exponent = result['exponent']
+        if exponent <= max_exponent:
+            continue
+        if key not in allowed:
+            found[key] = 'exponent %.2f above %.2f' % (exponent, max_exponent)
+        elif key in baseline and \
+             exponent > baseline[key]['exponent'] + 0.25:
+            found[key] = 'exponent %.2f, baseline %.2f' % \
+                         (exponent, baseline[key]['exponent'])
+    return found
+
+if __name__ == '__main__':
+    import argparse
+    arguments = argparse.ArgumentParser(
+        description='Measures the scaling of compile time with the size of '
+        'generated programs.')
+    arguments.add_argument('--sizes', type=int, nargs='+',
+                           default=[250, 500, 1000, 2000], metavar='N',
+                           help='sizes of the programs (default %(default)s)')
+    arguments.add_argument('--shapes', nargs='+',
+                           default=list(generator.shapes),
+                           choices=list(generator.shapes), metavar='NAME',
+                           help='shapes of the programs (default all)')
+    arguments.add_argument('--stages', nargs='+', default=list(stages),
+                           choices=list(stages), metavar='NAME',
+                           help='stages to measure (default all)')
+    arguments.add_argument('--seed', type=int, default=0, metavar='N',
+                           help='seed of the programs (default %(default)s)')
+    arguments.add_argument('--repeat', type=int, default=3, metavar='N',
+                           help='runs per measurement, of which the fastest '
+                           'counts (default %(default)s)')
+    arguments.add_argument('--baseline', default=baseline_file,
+                           metavar='FILE', help='baseline to compare with '
+                           '(default %(default)s)')
+    arguments.add_argument('--max-exponent', type=float, default=1.3,
+                           metavar='K', help='exponents above K are a '
+                           'regression (default %(default)s)')
+    arguments.add_argument('--allow', nargs='+', default=[], metavar='KEY',
+                           help='stage/shape results whose exponent may '
+                           'exceed K as long as it does not exceed that in '
+                           'the baseline by more than 0.25')
+    arguments.add_argument('--update', action='store_true',
+                           help='store the results as the baseline instead')
+    options = arguments.parse_args()
+
+    results = measure(options.stages, options.shapes, sorted(options.sizes),
+                      options.seed, options.repeat)
+    if options.update:
+        os.makedirs(os.path.dirname(os.path.abspath(options.baseline)),
+                    exist_ok=True)
+        with open(options.baseline, 'w') as baseline_output:
+            json.dump(results, baseline_output, indent=1, sort_keys=True)
+            baseline_output.write('\n')
+        baseline = results
+    else:
+        try:
+            with open(options.baseline) as baseline_input:
+                baseline = json.load(baseline_input)
+        except OSError:
+            baseline = {}
+    found = regressions(results, baseline, options.max_exponent,
+                        options.allow)
+    print('%-30s %8s %9s %10s' % ('stage/shape', 'exponent', 'baseline',
+                                  'seconds'))
+    for key, result in results.items():
+        base = baseline.get(key)
+        print('%-30s %8.2f %9s %10.4f' % (
+            key, result['exponent'],
+            '%.2f' % base['exponent'] if base else '-',
+            result['seconds'][-1]) +
+              ('  REGRESSION: ' + found[key] if key in found else
+               '  allowed' if key in options.allow and
+                              result['exponent'] > options.max_exponent
+               else ''))
+    sys.exit(1 if found else 0)
@@ -0,0 +1,216 @@
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import sys
+
+import compile_all
+import compiler
+import python_backend
+
+# A cache of the Jasmin code that compiler.py generates, which can replace it:
+#     python3 compile_cache.py < program > Program.j
+# Entries are keyed by a hash of the program, the source of the compiler and
+# the options that affect code generation, so that changing any of them
+# misses. When the entries exceed the size limit, the least recently used ones
+# are removed. Several processes can use the same cache at once.
+# Options:
+#     --cache DIR   directory of the cache
+#     --limit MB    size limit of the cache in megabytes
+#     --unroll N    unroll loops with a constant trip count N times
+#     --stats       print the number of hits, misses and evicted entries and
+#                   the size of the cache instead
+#     --clear       remove all entries instead
+
+cache_directory = os.path.join(python_backend.cache_directory, 'jasmin')
+size_limit = 256 * 1024 * 1024 # bytes of cached code
+
+def compiler_version():
+    '''Returns a hash of the source of the compiler.'''
+    with open(compiler.__file__, 'rb') as compiler_file:
+        return hashlib.sha256(compiler_file.read()).hexdigest()
+
+class Cache:
+    '''The interface comprises the constructor and the methods compile, get,
+       put, stats and clear. The code of an entry is stored in the file
+       named by its key in the directory entries. The time an entry was last
+       used is the modification time of its file. The file stats.json holds
+       the counters and the total size of the entries. It is only changed
+       while the file lock is locked exclusively, like the set of entries.
+       Lookups lock it shared and count themselves by appending a byte to
+       the file hits or misses, which the next change adds to stats.json,
+       so that they need not wait for each other to rewrite it.'''
+
+    def __init__(self, directory=cache_directory, limit=size_limit):
+        self.directory = directory
+        self.limit = limit
+        self.entries = os.path.join(directory, 'entries')
+        os.makedirs(self.entries, exist_ok=True)
+        self.version = compiler_version()
+
+    def key(self, source):
+        '''Returns the key of the program source under the current options
+           of the compiler.'''
+        options = [compiler.unroll_factor, compiler.switch_threshold,
+                   compiler.output_buffer_size, compiler.input_buffer_size,
+                   compiler.method_size_limit]
+        return hashlib.sha256((self.version + '\n' + repr(options) + '\n' +
+                               source).encode()).hexdigest()
+
+    @contextlib.contextmanager
+    def locked(self, operation):
+        '''Holds the file lock during the with statement, shared if operation
+           is fcntl.LOCK_SH and exclusively if it is fcntl.LOCK_EX.'''
+        with open(os.path.join(self.directory, 'lock'), 'a') as lock:
+            fcntl.flock(lock, operation)
+            yield
+
+    def update(self, change):
+        '''Calls change with the dictionary of counters, while the lock is
+           held exclusively, and writes it back to stats.json.'''
+        with self.locked(fcntl.LOCK_EX):
+            counters = self.counters()
+            change(counters)
+            path = os.path.join(self.directory, 'stats.json')
+            with open(path + '.' + str(os.getpid()), 'w') as stats_file:
+                json.dump(counters, stats_file)
+            os.replace(path + '.' + str(os.getpid()), path)
+            for name in ['hits', 'misses']:
+                open(os.path.join(self.directory, name), 'w').close()
+
+    def counters(self):
+        '''Returns the dictionary of stats.json with the lookups counted in
+           the files hits and misses added. The lock must be held.'''
+        try:
+            with open(os.path.join(self.directory, 'stats.json')) as stats_file:
+                result = json.load(stats_file)
+        except (OSError, ValueError):
+            result = { 'hits':0, 'misses':0, 'evicted':0, 'bytes':0 }
+        for name in ['hits', 'misses']:
+            try:
+                result[name] += os.path.getsize(os.path.join(self.directory,
+                                                             name))
+            except OSError:
+                pass
+        return result
+
+    def get(self, source):
+        '''Returns the cached code of the program source, or None.'''
+        path = os.path.join(self.entries, self.key(source))
+        with self.locked(fcntl.LOCK_SH):
+            try:
+                with open(path) as code_file:
+                    code = code_file.read()
+                os.utime(path)
+            except OSError:
+                code = None
+            # A single write appends all of its bytes at once.
+            count = os.open(os.path.join(self.directory,
+                                         'misses' if code == None else 'hits'),
+                            os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+            os.write(count, b'.')
+            os.close(count)
+        return code
+
+    def put(self, source, code):
+        '''Enters code as the code of the program source.'''
+        path = os.path.join(self.entries, self.key(source))
+        # The file is completed under a name of its own and then renamed, so
+        # that no process can read a partially written entry.
+        temporary = path + '.' + str(os.getpid())
+        with open(temporary, 'w') as code_file:
+            code_file.write(code)
+        size = os.path.getsize(temporary)
+        def enter(counters):
+            if os.path.exists(path): # entered by another process meanwhile
+                os.remove(temporary)
+                return
+            os.replace(temporary, path)
+            counters['bytes'] += size
+            if counters['bytes'] > self.limit:
+                self.evict(counters)
+        self.update(enter)
+
+    def evict(self, counters):
+        '''Removes the least recently used entries until the entries take at
+           most 90 percent of the limit, which leaves room for new entries
+           before the next eviction.'''
+        entries = sorted((entry.stat().st_mtime, entry.stat().st_size,
+                          entry.path) for entry in os.scandir(self.entries)
+                         if '.' not in entry.name)
+        counters['bytes'] = sum(size for time, size, path in entries)
+        for time, size, path in entries:
+            if counters['bytes'] <= 0.9 * self.limit:
+                break
+            os.remove(path)
+            counters['bytes'] -= size
+            counters['evicted'] += 1
+
+    def compile(self, source):
+        '''Returns the same as compile_all.diagnosed(source), using the
+           cache. Programs that fail to compile are not cached.'''
+        code = self.get(source)
+        if code != None:
+            return code, None
+        code, error = compile_all.diagnosed(source)
+        if code != None:
+            self.put(source, code)
+        return code, error
+
+    def stats(self):
+        '''Returns a dictionary of the counters, the number of entries and
+           the limit.'''
+        with self.locked(fcntl.LOCK_SH):
+            result = self.counters()
+            result['entries'] = sum(1 for entry in os.scandir(self.entries)
+                                    if '.' not in entry.name)
+        result['limit'] = self.limit
+        return result
+
+    def clear(self):
+        '''Removes all entries and resets the counters. The files that are
+           still being written by put are left to it.'''
+        def remove(counters):
+            for entry in os.scandir(self.entries):
+                if '.' not in entry.name:
+                    os.remove(entry.path)
+            counters.update(hits=0, misses=0, evicted=0, bytes=0)
+        self.update(remove)
+
+if __name__ == '__main__':
+    import argparse
+    arguments = argparse.ArgumentParser(
+        description='Compiles the program on stdin to Jasmin assembler, '
+        'reusing the code of earlier compilations.')
+    arguments.add_argument('--cache', default=cache_directory, metavar='DIR',
+                           help='directory of the cache (default %(default)s)')
+    arguments.add_argument('--limit', type=float,
+                           default=size_limit / 1024 / 1024, metavar='MB',
+                           help='size limit of the cache in megabytes '
+                           '(default %(default)s)')
+    arguments.add_argument('--unroll', type=int,
+                           default=compiler.unroll_factor, metavar='N',
+                           help='unroll loops with a constant trip count N '
+                           'times (default %(default)s)')
+    arguments.add_argument('--stats', action='store_true',
+                           help='print the number of hits, misses and evicted '
+                           'entries and the size of the cache instead')
+    arguments.add_argument('--clear', action='store_true',
+                           help='remove all entries instead')
+    options = arguments.parse_args()
+    compiler.unroll_factor = options.unroll
+
+    cache = Cache(options.cache, int(options.limit * 1024 * 1024))
+    if options.stats:
+        for key, value in cache.stats().items():
+            print(key + ' ' + str(value))
+    elif options.clear:
+        cache.clear()
+    else:
+        code, error = cache.compile(sys.stdin.read())
+        # Like compiler.py, errors are printed to stdout.
+        if error != None:
+            print(error)
+        else:
+            print(code, end='')
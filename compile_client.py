@@ -0,0 +1,100 @@
+import json
+import os
+import socket
+import sys
+
+# A client of compile_server.py that compiles a program on stdin like
+# compiler.py, with the options below only:
+#     python3 compile_client.py < program > Program.j
+# It imports nothing of the compiler and leaves compiling to the server, which
+# has the compiler loaded already. If no server is listening, it compiles the
+# program itself.
+# Options:
+#     --socket PATH   Unix domain socket of the server
+#     --unroll N      unroll loops with a constant trip count N times
+#     --ast           print the abstract syntax tree instead
+#     --stats         print the statistics of the server instead
+
+# Requests and responses are JSON objects, each sent as a frame: the length
+# of its UTF-8 encoding as 4-byte big-endian integer, followed by the
+# encoding. A request has the members
+#     kind     'jasmin', 'ast' or 'stats'
+#     source   the program, unless kind is 'stats'
+#     unroll   the unroll factor, an integer, optional
+# and the response to a compilation has the members
+#     output   the Jasmin code or abstract syntax tree, or None on failure
+#     error    None or the error message of the compiler
+# The response to 'stats' has the members of Server.stats().
+
+# tempfile.gettempdir() would find the same directory, but importing tempfile
+# adds to the start-up time of the client.
+socket_path = os.path.join(os.environ.get('TMPDIR', '/tmp'),
+                           'python_compiler-' + str(os.getuid()) + '.sock')
+
+def frame(message):
+    '''Returns the frame of the JSON object message.'''
+    data = json.dumps(message).encode()
+    return len(data).to_bytes(4, 'big') + data
+
+def receive_exactly(connection, count):
+    data = b''
+    while len(data) < count:
+        chunk = connection.recv(count - len(data))
+        if not chunk:
+            raise ConnectionError('connection closed by the server')
+        data += chunk
+    return data
+
+def request(message, path=socket_path):
+    '''Sends message to the server listening at path and returns its
+       response. Raises OSError if there is no server.'''
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(path)
+        connection.sendall(frame(message))
+        length = int.from_bytes(receive_exactly(connection, 4), 'big')
+        return json.loads(receive_exactly(connection, length))
+
+if __name__ == '__main__':
+    import argparse
+    arguments = argparse.ArgumentParser(
+        description='Compiles the program on stdin to Jasmin assembler with '
+        'the compile server.')
+    arguments.add_argument('--socket', default=socket_path, metavar='PATH',
+                           help='Unix domain socket of the server '
+                           '(default %(default)s)')
+    arguments.add_argument('--unroll', type=int, metavar='N',
+                           help='unroll loops with a constant trip count N '
+                           'times')
+    arguments.add_argument('--ast', action='store_true',
+                           help='print the abstract syntax tree instead')
+    arguments.add_argument('--stats', action='store_true',
+                           help='print the statistics of the server instead')
+    options = arguments.parse_args()
+
+    if options.stats:
+        try:
+            stats = request({ 'kind':'stats' }, options.socket)
+        except OSError:
+            sys.exit('compile_client.py: no server is listening at ' +
+                     options.socket)
+        for key, value in stats.items():
+            print(key + ' ' + str(value))
+        sys.exit()
+    message = { 'kind':'ast' if options.ast else 'jasmin',
+                'source':sys.stdin.read() }
+    if options.unroll != None:
+        message['unroll'] = options.unroll
+    try:
+        response = request(message, options.socket)
+    except OSError:
+        import compile_all
+        import compiler
+        if options.unroll != None:
+            compiler.unroll_factor = options.unroll
+        output, error = compile_all.diagnosed(message['source'], options.ast)
+        response = { 'output':output, 'error':error }
+    # Like compiler.py, errors are printed to stdout.
+    if response['error'] != None:
+        print(response['error'])
+    else:
+        print(response['output'], end='')
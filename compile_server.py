@@ -0,0 +1,176 @@
+import asyncio
+import collections
+import concurrent.futures
+import json
+import os
+import signal
+import socket
+import sys
+import time
+
+import compile_all
+import compile_client
+import compiler
+
+# A compile server that keeps the compiler loaded in a pool of worker
+# processes and answers requests of compile_client.py over a Unix domain
+# socket, so that compiling a program does not pay for starting Python and
+# loading the compiler. Start it with
+#     python3 compile_server.py &
+# The protocol is described in compile_client.py.
+# Options:
+#     --socket PATH   Unix domain socket to listen on
+#     --workers N     number of worker processes
+#     --queue N       requests waiting for a worker before the server stops
+#                     reading from its clients
+#     --unroll N      default unroll factor of the requests
+
+# Requests larger than this many bytes are refused.
+maximum_request = 16 * 1024 * 1024
+
+def compile_request(kind, source, unroll_factor):
+    '''Runs in a worker: returns the response to a compilation request.'''
+    compiler.unroll_factor = unroll_factor
+    output, error = compile_all.diagnosed(source, kind == 'ast')
+    return { 'output':output, 'error':error }
+
+class Server:
+    '''The interface comprises the constructor and the methods serve and
+       stats. At most workers + queue requests are accepted at a time. A
+       connection whose next request would exceed this is not read from,
+       so that its client blocks once the socket buffers are full.'''
+
+    def __init__(self, path, workers, queue, unroll_factor):
+        self.path = path
+        self.workers = workers
+        self.unroll_factor = unroll_factor
+        self.pool = concurrent.futures.ProcessPoolExecutor(
+            workers, initializer=compile_all.warm, initargs=(unroll_factor,))
+        self.slots = asyncio.Semaphore(workers + queue)
+        self.latencies = collections.deque(maxlen=100000) # seconds
+        self.requests = 0
+        self.failures = 0
+        self.started = time.time()
+
+    def stats(self):
+        '''Returns a dictionary of the number of requests and failed
+           compilations and of percentiles of the latency of the most recent
+           requests in milliseconds, from reading a request to sending the
+           response.'''
+        latencies = sorted(self.latencies)
+        result = { 'uptime':round(time.time() - self.started),
+                   'workers':self.workers,
+                   'requests':self.requests, 'failures':self.failures }
+        for name, fraction in [('p50', 0.5), ('p90', 0.9), ('p99', 0.99),
+                               ('max', 1.0)]:
+            result[name + '_ms'] = round(
+                latencies[int(fraction * (len(latencies) - 1))] * 1000, 3) \
+                if latencies else None
+        return result
+
+    async def respond(self, message):
+        if message.get('kind') == 'stats':
+            return self.stats()
+        unroll = message.get('unroll', self.unroll_factor)
+        if message.get('kind') not in ['jasmin', 'ast'] or \
+           not isinstance(message.get('source'), str) or \
+           type(unroll) != int:
+            return { 'output':None, 'error':'invalid request' }
+        self.requests += 1
+        try:
+            response = await asyncio.get_running_loop().run_in_executor(
+                self.pool, compile_request, message['kind'],
+                message['source'], unroll)
+        except Exception as error:
+            response = { 'output':None,
+                         'error':type(error).__name__ + ': ' + str(error) }
+        if response['error'] != None:
+            self.failures += 1
+        return response
+
+    async def connection(self, reader, writer):
+        '''Answers the requests of a client until it closes the
+           connection.'''
+        try:
+            while True:
+                try:
+                    length = int.from_bytes(await reader.readexactly(4), 'big')
+                except asyncio.IncompleteReadError:
+                    break
+                if length > maximum_request:
+                    writer.write(compile_client.frame(
+                        { 'output':None, 'error':'request too large' }))
+                    await writer.drain()
+                    break
+                async with self.slots:
+                    message = await reader.readexactly(length)
+                    start = time.perf_counter()
+                    try:
+                        message = json.loads(message)
+                    except ValueError:
+                        message = None
+                    if isinstance(message, dict):
+                        response = await self.respond(message)
+                    else:
+                        response = { 'output':None, 'error':'invalid request' }
+                    writer.write(compile_client.frame(response))
+                    await writer.drain()
+                    self.latencies.append(time.perf_counter() - start)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self):
+        '''Listens on the socket until SIGINT or SIGTERM.'''
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for number in [signal.SIGINT, signal.SIGTERM]:
+            loop.add_signal_handler(number, stop.set)
+        server = await asyncio.start_unix_server(self.connection, self.path)
+        try:
+            await stop.wait()
+        finally:
+            server.close()
+            await server.wait_closed()
+            os.remove(self.path)
+            self.pool.shutdown()
+
+def in_use(path):
+    '''Returns whether a server is listening at path. Removes the socket
+       file left behind by a server that is no longer running.'''
+    if not os.path.exists(path):
+        return False
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        try:
+            connection.connect(path)
+            return True
+        except ConnectionRefusedError:
+            os.remove(path)
+            return False
+
+if __name__ == '__main__':
+    import argparse
+    arguments = argparse.ArgumentParser(
+        description='Serves compile requests over a Unix domain socket.')
+    arguments.add_argument('--socket', default=compile_client.socket_path,
+                           metavar='PATH', help='Unix domain socket to listen '
+                           'on (default %(default)s)')
+    arguments.add_argument('--workers', type=int, default=os.cpu_count(),
+                           metavar='N', help='number of worker processes '
+                           '(default %(default)s)')
+    arguments.add_argument('--queue', type=int, default=64, metavar='N',
+                           help='requests waiting for a worker before the '
+                           'server stops reading (default %(default)s)')
+    arguments.add_argument('--unroll', type=int,
+                           default=compiler.unroll_factor, metavar='N',
+                           help='default unroll factor of the requests '
+                           '(default %(default)s)')
+    options = arguments.parse_args()
+
+    if in_use(options.socket):
+        sys.exit('compile_server.py: a server is already listening at ' +
+                 options.socket)
+    server = Server(options.socket, options.workers, options.queue,
+                    options.unroll)
+    asyncio.run(server.serve())
@@ -1,3 +1,8 @@
+import bisect
+import concurrent.futures
+import contextlib
+import io
+import multiprocessing
 import re
 import sys
 
@@ -5,7 +10,6 @@ import sys
 # Integer constants must be short.
 # Stack size must not exceed 1024.
 # Integer is the only type.
-# Logical operators cannot be nested.
 
 class Scanner:
     '''The interface comprises the methods lookahead and consume.
@@ -23,6 +27,10 @@ class Scanner:
         self.current_char_index = 0
         # a pair (most recently read token, matched substring of input_string)
         self.current_token = self.get_token()
+        # indices where the lines of input_string start, found when needed
+        self.line_starts = None
+        # ends of left parentheses mapped to whether they enclose a condition
+        self.parentheses = {}
 
     def skip_white_space(self):
         '''Consumes all characters in input_string up to the next
@@ -49,9 +57,9 @@ class Scanner:
         self.skip_white_space()
         # find the longest prefix of input_string that matches a token
         token, longest = None, ''
-        for (t, r) in Token.token_regexp:
-            match = re.match(r, self.input_string[self.current_char_index:])
-            if match and match.end() > len(longest):
+        for (t, r) in Token.token_patterns:
+            match = r.match(self.input_string, self.current_char_index)
+            if match and len(match.group()) > len(longest):
                 token, longest = t, match.group()
         if token == None and longest == '':
             if self.current_char_index < len(self.input_string) - 1:
@@ -65,6 +73,53 @@ class Scanner:
            Returns None if there is no next token.'''
         return self.current_token[0]
 
+    def position(self):
+        '''Returns the line and column, both counted from 1, where the next
+           token starts.'''
+        if self.line_starts == None:
+            self.line_starts = [0] + [match.end() for match in
+                                      re.finditer('\n', self.input_string)]
+        # current_char_index is just past the next token, which get_token
+        # has consumed already
+        index = self.current_char_index - len(self.current_token[1])
+        line = bisect.bisect_right(self.line_starts, index)
+        return line, index - self.line_starts[line - 1] + 1
+
+    def condition_in_parentheses(self):
+        '''Returns True if the next token is a left parenthesis that encloses
+           a condition rather than an expression, which is the case if a
+           comparison or logical operator occurs before the matching right
+           parenthesis. No input is consumed. The answers for the
+           parentheses nested in this one are recorded on the way, so that
+           nested conditions are scanned once rather than once per level.'''
+        if self.current_char_index in self.parentheses:
+            return self.parentheses[self.current_char_index]
+        current_char_index = self.current_char_index
+        current_token = self.current_token
+        conditional = [Token.AND, Token.OR, Token.NOT,
+                       Token.LESS, Token.EQ, Token.GRTR,
+                       Token.LEQ, Token.NEQ, Token.GEQ]
+        unclosed = [] # ends of the left parentheses not yet matched
+        result = False
+        token = self.current_token[0]
+        while token != None:
+            if token == Token.LPAR:
+                unclosed.append(self.current_char_index)
+            elif token == Token.RPAR:
+                self.parentheses[unclosed.pop()] = False
+                if not unclosed:
+                    break
+            elif token in conditional:
+                for index in unclosed:
+                    self.parentheses[index] = True
+                result = True
+                break
+            self.current_token = self.get_token()
+            token = self.current_token[0]
+        self.current_char_index = current_char_index
+        self.current_token = current_token
+        return result
+
     def unexpected_token(self, found_token, expected_tokens):
         '''Stop execution because an unexpected token was found.
            found_token contains just the token, not its value.
@@ -88,7 +143,7 @@ class Scanner:
             else:
                 return token
         else:
-            raise Exception(self.unexpected_token(token, *expected_tokens))
+            self.unexpected_token(token, expected_tokens)
         
 
 class Token:
@@ -156,6 +211,10 @@ class Token:
         (ID,    '[a-z]+'),
     ]
 
+    # The regular expressions are compiled once, so that they can be matched
+    # at the current position of the input without copying its remainder.
+    token_patterns = [(t, re.compile(r)) for (t, r) in token_regexp]
+
 class Symbol_Table:
     '''A symbol table maps identifiers to locations.'''
     def __init__(self):
@@ -172,6 +231,11 @@ class Symbol_Table:
         index = len(self.symbol_table)
         self.symbol_table[identifier] = index
         return index
+    def temporary(self):
+        '''Returns a new location that is not bound to any identifier of the
+           program. The key cannot clash with identifiers, which are made of
+           lower case letters only.'''
+        return self.location('$' + str(len(self.symbol_table)))
 
 class Label:
     def __init__(self):
@@ -184,11 +248,441 @@ class Label:
 def indent(s, level):
     return '    '*level + s + '\n'
 
+def push(value):
+    '''Returns the shortest instruction that pushes the constant value.'''
+    if value == -1:
+        return 'iconst_m1\n'
+    elif 0 <= value <= 5:
+        return 'iconst_' + str(value) + '\n'
+    elif -128 <= value <= 127:
+        return 'bipush ' + str(value) + '\n'
+    elif -32768 <= value <= 32767:
+        return 'sipush ' + str(value) + '\n'
+    else:
+        return 'ldc ' + str(value) + '\n'
+
+def increment(loc, step):
+    '''Returns code that adds the constant step to the local variable loc.'''
+    if loc < 256 and -128 <= step <= 127:
+        return 'iinc ' + str(loc) + ' ' + str(step) + '\n'
+    return 'iload ' + str(loc) + '\n' + \
+           push(step) + \
+           'iadd\n' + \
+           'istore ' + str(loc) + '\n'
+
+def power_of_two(tree):
+    '''Returns k if tree is the constant 2**k for k > 0, None otherwise.'''
+    if isinstance(tree, Number_AST):
+        value = int(tree.number)
+        if value > 1 and value & (value - 1) == 0:
+            return value.bit_length() - 1
+    return None
+
+# Sizes in bytes of the instructions that are not three bytes long.
+instruction_size = {
+    'iconst_m1':1, 'iconst_0':1, 'iconst_1':1, 'iconst_2':1, 'iconst_3':1,
+    'iconst_4':1, 'iconst_5':1, 'bipush':2, 'ldc':2,
+    'iload':2, 'istore':2, 'aload':2, 'astore':2, 'aload_0':1,
+    'iadd':1, 'isub':1, 'imul':1, 'idiv':1, 'ishl':1, 'ishr':1, 'iushr':1,
+    'iaload':1, 'iastore':1, 'dup':1, 'return':1, 'tableswitch':12,
+    'lookupswitch':8,
+}
+
+def code_size(code):
+    '''Returns an estimate of the number of bytes of JVM bytecode that the
+       instructions in code assemble to. Labels take no space. The indented
+       lines following a tableswitch or lookupswitch are its jump table.
+       Local variables from 256 on need a wide prefix and two byte
+       operands.'''
+    return code_part(code)[1]
+
+def report(message):
+    '''Writes an optimisation report to stderr if reports are enabled.'''
+    if reports:
+        print(message, file=sys.stderr)
+
+def equality(condition):
+    '''Returns (x, c) if condition is x = c or c = x for an identifier x and
+       a constant c, None otherwise.'''
+    if isinstance(condition, Comparison_AST) and condition.op == '=':
+        left, right = condition.left, condition.right
+        if isinstance(left, Number_AST):
+            left, right = right, left
+        if isinstance(left, Identifier_AST) and isinstance(right, Number_AST):
+            return left.identifier, int(right.number)
+    return None
+
+def switch_code(identifier, cases, default):
+    '''Returns code that dispatches on the value of identifier with a single
+       tableswitch or lookupswitch instruction. cases and default are as
+       returned by If_Else_AST.cases(). The choice between the two
+       instructions follows the cost model of javac: a tableswitch is used
+       unless the range of constants is so sparse that the table takes
+       more space than the lookupswitch saves in time.'''
+    values = sorted(value for value, statements in cases)
+    low, high = values[0], values[-1]
+    labels = {}
+    for value, statements in cases:
+        labels[value] = label_generator.next()
+    l1 = label_generator.next()
+    l2 = label_generator.next()
+    table_space_cost, table_time_cost = 4 + (high - low + 1), 3
+    lookup_space_cost, lookup_time_cost = 3 + 2 * len(values), len(values)
+    if table_space_cost + 3 * table_time_cost <= \
+       lookup_space_cost + 3 * lookup_time_cost:
+        result = 'tableswitch ' + str(low) + ' ' + str(high) + '\n'
+        for value in range(low, high + 1):
+            result += '    ' + labels.get(value, l1) + '\n'
+    else:
+        result = 'lookupswitch\n'
+        for value in values:
+            result += '    ' + str(value) + ' : ' + labels[value] + '\n'
+    result = Identifier_AST(identifier).code() + \
+             result + \
+             '    default : ' + l1 + '\n'
+    for value, statements in cases:
+        result += labels[value] + ':\n' + \
+                  statements.code() + \
+                  'goto ' + l2 + '\n'
+    result += l1 + ':\n'
+    if default != None:
+        result += default.code()
+    return result + l2 + ':\n'
+
+def thread_jumps(code):
+    '''Returns code in which jumps to a label that is directly followed by a
+       goto are redirected to the target of that goto, and in which gotos
+       to the immediately following label are removed.'''
+    lines = code.split('\n')
+    target = {}
+    labels = []
+    for line in lines:
+        if line.endswith(':'):
+            labels.append(line[:-1])
+        else:
+            if line.startswith('goto '):
+                for label in labels:
+                    target[label] = line[5:]
+            labels = []
+    def final(label):
+        seen = set()
+        while label in target and label not in seen:
+            seen.add(label)
+            label = target[label]
+        return label
+    result = []
+    for line in lines:
+        parts = line.split(' ')
+        if parts[0] == 'goto' or parts[0].startswith('if'):
+            line = parts[0] + ' ' + final(parts[1])
+        elif line.startswith(' '): # entry of a switch jump table
+            line = ' '.join(parts[:-1]) + ' ' + final(parts[-1])
+        result.append(line)
+    lines, result = result, []
+    for i, line in enumerate(lines):
+        if line.startswith('goto '):
+            j = i + 1
+            while j < len(lines) and lines[j].endswith(':') and \
+                  lines[j] != line[5:] + ':':
+                j += 1
+            if j < len(lines) and lines[j] == line[5:] + ':':
+                continue
+        result.append(line)
+    return '\n'.join(result)
+
+def load_location(loc):
+    '''Returns code that copies the location loc from the static array
+       Program/v to its local variable.'''
+    return 'getstatic Program/v [I\n' + \
+           push(loc) + \
+           'iaload\n' + \
+           'istore ' + str(loc) + '\n'
+
+def store_location(loc):
+    '''Returns code that copies the local variable of the location loc to
+       the static array Program/v.'''
+    return 'getstatic Program/v [I\n' + \
+           push(loc) + \
+           'iload ' + str(loc) + '\n' + \
+           'iastore\n'
+
+def transfer_size(loc):
+    '''Returns the size of the code that copies the location loc between
+       Program/v and its local variable, in either direction: getstatic,
+       the push of loc, iaload or iastore and iload or istore. The push is
+       counted as a sipush, the longest, so that the size changes with loc
+       only where that of iload and istore does.'''
+    return 3 + 3 + 1 + (2 if loc < 256 else 4)
+
+def split_call(line):
+    '''Returns the pair in split_sets of the split method that the
+       instruction line calls, None if it does not call one.'''
+    if line.startswith('invokestatic Program/'):
+        return split_sets.get(line[21:].split('(')[0])
+    return None
+
+def find_lines(code, lines):
+    '''Returns the index of the first occurrence of lines in code that starts
+       at the start of a line, -1 if there is none.'''
+    i = code.find(lines)
+    while i > 0 and code[i - 1] != '\n':
+        i = code.find(lines, i + 1)
+    return i
+
+def code_part(code, known=()):
+    '''Returns the tuple of code, its code_size, the set of locations that
+       its instructions use, the set of those they assign, and the list of
+       the pairs in split_sets of the split methods that it calls. known
+       are the tuples of codes that code may contain whole lines of, which
+       are not scanned again.'''
+    size = 0
+    used, assigned, calls = set(), set(), []
+    rest = code
+    for part in known:
+        i = find_lines(rest, part[0])
+        if i >= 0:
+            rest = rest[:i] + rest[i + len(part[0]):]
+            size += part[1]
+            used |= part[2]
+            assigned |= part[3]
+            calls.extend(part[4])
+    for line in rest.split('\n'):
+        if line.startswith(' '):
+            size += 8 if ' : ' in line and 'default' not in line else 4
+        elif line and not line.endswith(':'):
+            parts = line.split()
+            size += instruction_size.get(parts[0], 3)
+            if parts[0] in ['iload', 'istore', 'iinc']:
+                loc = int(parts[1])
+                used.add(loc)
+                if parts[0] != 'iload':
+                    assigned.add(loc)
+                if loc > 255:
+                    size += 3 if parts[0] == 'iinc' else 2
+            elif parts[0] == 'invokestatic':
+                callee = split_call(line)
+                if callee != None:
+                    calls.append(callee)
+    return code, size, used, assigned, calls
+
+def call_transfers(code, cached):
+    '''Returns code in which each call of a split method first copies the
+       locations in cached that the method uses to Program/v and afterwards
+       copies those that it assigns back.'''
+    result = ''
+    for line in code.splitlines(True):
+        callee = split_call(line)
+        if callee == None:
+            result += line
+            continue
+        used, assigned = callee
+        for loc in sorted(cached & used):
+            result += store_location(loc)
+        result += line
+        for loc in sorted(cached & assigned):
+            result += load_location(loc)
+    return result
+
+class Split_Run:
+    '''Consecutive codes of statements that are moved to one split method,
+       and the size of that method. Methods do not share local variables,
+       so the locations of symbol_table live in the static array Program/v
+       between them. A method keeps the locations that its own instructions
+       use in the local variables of the same numbers: it copies them from
+       Program/v on entry and copies those that it assigns back on exit.
+       Around each call of another split method it copies those that the
+       callee uses to Program/v, and afterwards those that the callee
+       assigns back, as call_transfers does.'''
+    def __init__(self):
+        self.codes = []
+        self.used = set()
+        self.assigned = set()
+        self.calls = [] # the pairs in split_sets of the methods called
+        self.size = 1 # the return instruction
+    def grown(self, part):
+        '''Returns the size of the method if part, a code_part, is appended
+           to the run.'''
+        code, size, used, assigned, calls = part
+        new = used - self.used
+        cached = self.used | used
+        size += self.size + \
+                sum(transfer_size(loc) for loc in new) + \
+                sum(transfer_size(loc) for loc in assigned - self.assigned)
+        for callee_used, callee_assigned in self.calls:
+            size += sum(transfer_size(loc) for loc in new & callee_used) + \
+                    sum(transfer_size(loc) for loc in new & callee_assigned)
+        for callee_used, callee_assigned in calls:
+            size += sum(transfer_size(loc) for loc in cached & callee_used) + \
+                    sum(transfer_size(loc) for loc in cached & callee_assigned)
+        return size
+    def append(self, part):
+        '''Appends part, as described for grown, to the run.'''
+        self.size = self.grown(part)
+        code, size, used, assigned, calls = part
+        self.codes.append(code)
+        self.used |= used
+        self.assigned |= assigned
+        self.calls.extend(calls)
+
+def split_method(run):
+    '''Moves the codes of run, a Split_Run, into a new static method of the
+       generated class and returns the code that calls it. The calls of
+       split methods in the codes are surrounded by call_transfers when the
+       method that contains them is complete.'''
+    name = 'm' + str(len(split_methods) + 1)
+    code = ''
+    for loc in sorted(run.used):
+        code += load_location(loc)
+    code += call_transfers(''.join(run.codes), run.used)
+    for loc in sorted(run.assigned):
+        code += store_location(loc)
+    split_methods.append((name, code))
+    used, assigned = set(run.used), set(run.assigned)
+    for callee_used, callee_assigned in run.calls:
+        used |= callee_used
+        assigned |= callee_assigned
+    split_sets[name] = used, assigned
+    return 'invokestatic Program/' + name + '()V\n'
+
+class Statement_Symbol_Table(Symbol_Table):
+    '''The symbol table of a worker of parallel_code for one top-level
+       statement. first maps the identifiers of the program to the first
+       statement that uses them, and bounds holds for each statement a
+       lower bound of the locations of the identifiers it uses first. The
+       identifiers whose location is 256 or more by these bounds are
+       numbered from 256, the others from 0, so that increment chooses the
+       same instructions for most of them as for their locations.'''
+    def __init__(self, first, bounds, statement):
+        Symbol_Table.__init__(self)
+        self.first = first
+        self.bounds = bounds
+        self.statement = statement
+        self.new = 0 # identifiers and temporaries first used by statement
+        self.low = 0 # numbers below 256
+    def location(self, identifier):
+        if identifier in self.symbol_table:
+            return self.symbol_table[identifier]
+        statement = self.first.get(identifier, self.statement)
+        if statement < self.statement:
+            high = self.bounds[statement] >= 256
+        else:
+            high = self.bounds[statement] + self.new >= 256
+            self.new += 1
+        if high or self.low == 256:
+            index = 256 + len(self.symbol_table) - self.low
+        else:
+            index = self.low
+            self.low += 1
+        self.symbol_table[identifier] = index
+        return index
+
+def statement_code(index, entry):
+    '''Runs in a worker process of parallel_code: returns the code of the
+       top-level statement index, generated as if it were the whole
+       program, the optimisation reports it writes, the number of labels
+       it uses, the pairs of key and number of the locations it uses, in
+       the order of their first use, and whether it splits off methods.'''
+    global symbol_table, label_generator
+    statements, first, bounds = forked
+    symbol_table = Statement_Symbol_Table(first, bounds, index)
+    label_generator = Label()
+    generated.clear()
+    split = len(split_methods)
+    st = statements.statements[index]
+    with contextlib.redirect_stderr(io.StringIO()) as messages:
+        code = statements.fitted(st, entry)[0]
+    return code, messages.getvalue(), label_generator.current_label, \
+           list(symbol_table.symbol_table.items()), len(split_methods) > split
+
+def parallel_code(statements, workers):
+    '''Returns the code of statements, a Statements_AST, like its method
+       code, but generates the code of each statement in one of workers
+       processes forked from this one, which inherit the tree and the
+       options. Their code numbers labels from the start and locations as
+       described for Statement_Symbol_Table. A sequential merge in the
+       order of the statements then gives each statement the next range of
+       labels, and each location the number it gets when it is first used
+       in this order, and renumbers the code accordingly, so that it is the
+       same as that of code. The merge generates the code of a statement
+       itself where this is not guaranteed: if the statement splits off
+       methods, which are numbered in the order they are split off, or if
+       increment may have chosen other instructions for the number of a
+       location than for the location, or code_part and Split_Run may have
+       sized them differently. Returns None if processes cannot be
+       forked.'''
+    global forked
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        return None
+    # The code of each statement uses all identifiers in it, so the
+    # identifiers of earlier statements come first in symbol_table.
+    first = {}
+    bounds = []
+    for index, st in enumerate(statements.statements):
+        bounds.append(symbol_table.size() + len(first))
+        for node in walk(st):
+            if isinstance(node, Identifier_AST):
+                first.setdefault(node.identifier, index)
+    forked = statements, first, bounds
+    entries = statements.entries()
+    with concurrent.futures.ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context('fork')) as pool:
+        chunk = max(1, len(entries) // (4 * workers))
+        results = list(pool.map(statement_code, range(len(entries)), entries,
+                                chunksize=chunk))
+    forked = None
+    parts = []
+    for st, entry, (code, messages, labels, keys, split) in \
+        zip(statements.statements, entries, results):
+        table = symbol_table.symbol_table
+        added = {} # keys first used by the statement
+        locations = {} # numbers of the statement mapped to locations
+        for key, number in keys:
+            if key.startswith('$'): # temporary
+                key = '$' + str(len(table) + len(added))
+            if key in table:
+                locations[number] = table[key]
+            else:
+                locations[number] = added.setdefault(key,
+                                                     len(table) + len(added))
+        # increment chooses instructions by whether a number is below 256
+        if split or any((number < 256) != (location < 256)
+                        for number, location in locations.items()):
+            parts.append(statements.fitted(st, entry))
+            continue
+        table.update(added)
+        base = label_generator.current_label
+        label_generator.current_label += labels
+        label = lambda match: 'l' + str(int(match.group(1)) + base)
+        code = re.sub(r'\bl(\d+)\b', label, code)
+        code = re.sub(r'^(iload|istore|iinc) (\d+)',
+                      lambda match: match.group(1) + ' ' +
+                                    str(locations[int(match.group(2))]),
+                      code, flags=re.M)
+        parts.append(code_part(code))
+        sys.stderr.write(re.sub(r'\bl(\d+)\b', label, messages))
+    return statements.joined(parts)
+
+def walk(tree):
+    '''Returns all nodes of tree in preorder.'''
+    result = []
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        result.append(node)
+        stack.extend(reversed(node.children()))
+    return result
+
 # Each of the following classes is a kind of node in the abstract syntax tree.
 # indented(level) returns a string that shows the tree levels by indentation.
 # code() returns a string with JVM bytecode implementing the tree fragment.
 # true_code/false_code(label) jumps to label if the condition is/is not true.
 # Execution of the generated code leaves the value of expressions on the stack.
+# children() returns the direct subtrees of a node.
+# assigned() returns the set of identifiers a statement may assign to.
+# invariants(assigned, found) appends to found the maximal subexpressions of a
+# statement or condition that do not depend on any identifier in assigned.
+# invariant(assigned, found) does the same for an expression and returns
+# whether the whole expression is invariant.
 
 class Program_AST:
     def __init__(self, program):
@@ -197,32 +691,478 @@ class Program_AST:
         return repr(self.program)
     def indented(self, level):
         return self.program.indented(level)
+    def children(self):
+        return [self.program]
     def code(self):
-        program = self.program.code()
+        return class_code(self.method('main([Ljava/lang/String;)V'), [self])
+    def method(self, signature):
+        '''Returns the static method with the given signature that runs the
+           program, followed by the methods split off from it.'''
+        global method_size_limit
+        nodes = walk(self)
+        reads = any(isinstance(node, Read_AST) for node in nodes)
+        writes = any(isinstance(node, Write_AST) for node in nodes)
+        inputs, outputs = '', ''
+        if reads:
+            inputs = push(input_buffer_size) + \
+                     'newarray byte\n' + \
+                     'putstatic Program/input [B\n' + \
+                     'iconst_0\n' + \
+                     'putstatic Program/position I\n' + \
+                     'iconst_0\n' + \
+                     'putstatic Program/length I\n'
+        if writes:
+            outputs = push(output_buffer_size) + \
+                      'newarray byte\n' + \
+                      'putstatic Program/buffer [B\n' + \
+                      'iconst_0\n' + \
+                      'putstatic Program/count I\n' + \
+                      push(12) + \
+                      'newarray byte\n' + \
+                      'putstatic Program/digits [B\n'
+        # The program is joined within what the limit leaves besides the
+        # buffers, the creation of Program/v and the flushes and returns.
+        limit = method_size_limit
+        method_size_limit -= code_size(inputs + outputs) + 9 + \
+                             (10 if writes else 1)
+        first = len(split_methods)
+        program = None
+        if code_workers > 1:
+            program = parallel_code(self.program, code_workers)
+        if program == None:
+            program = self.program.code()
+        method_size_limit = limit
+        program = thread_jumps(program)
         local = symbol_table.size()
-        java_scanner = symbol_table.location('Java Scanner')
-        return '.class public Program\n' + \
-               '.super java/lang/Object\n' + \
-               '.method public <init>()V\n' + \
-               'aload_0\n' + \
-               'invokenonvirtual java/lang/Object/<init>()V\n' + \
-               'return\n' + \
-               '.end method\n' + \
-               '.method public static main([Ljava/lang/String;)V\n' + \
-               '.limit locals ' + str(local) + '\n' + \
-               '.limit stack 1024\n' + \
-               'new java/util/Scanner\n' + \
-               'dup\n' + \
-               'getstatic java/lang/System.in Ljava/io/InputStream;\n' + \
-               'invokespecial java/util/Scanner.<init>(Ljava/io/InputStream;)V\n' + \
-               'astore ' + str(java_scanner) + '\n' + \
-               program + \
-               'return\n' + \
-               '.end method\n'
+        result = '.method public static ' + signature + '\n' + \
+                 '.limit locals ' + str(local) + '\n' + \
+                 '.limit stack 1024\n'
+        result += inputs
+        if len(split_methods) > first:
+            # The locations start as zero in Program/v and in the local
+            # variables that the method keeps them in, as for Split_Run.
+            used = code_part(program)[2]
+            result += push(local) + \
+                      'newarray int\n' + \
+                      'putstatic Program/v [I\n'
+            for loc in sorted(used):
+                result += 'iconst_0\n' + \
+                          'istore ' + str(loc) + '\n'
+            program = call_transfers(program, used)
+        if not writes:
+            result += program + \
+                      'return\n' + \
+                      '.end method\n'
+        else:
+            # The output buffer is also flushed if the program terminates
+            # with an exception, which is then thrown on.
+            l1 = label_generator.next()
+            l2 = label_generator.next()
+            l3 = label_generator.next()
+            result += outputs + \
+                      l1 + ':\n' + \
+                      program + \
+                      l2 + ':\n' + \
+                      'invokestatic Program/flush()V\n' + \
+                      'return\n' + \
+                      l3 + ':\n' + \
+                      'invokestatic Program/flush()V\n' + \
+                      'athrow\n' + \
+                      '.catch java/lang/Throwable from ' + l1 + ' to ' + \
+                      l2 + ' using ' + l3 + '\n' + \
+                      '.end method\n'
+        for name, code in split_methods[first:]:
+            result += '.method private static ' + name + '()V\n' + \
+                      '.limit locals ' + str(local) + '\n' + \
+                      '.limit stack 1024\n' + \
+                      thread_jumps(code) + \
+                      'return\n' + \
+                      '.end method\n'
+        return result
+
+def class_code(methods, programs, batch=False):
+    '''Returns the class Program with the given methods, together with the
+       fields and runtime methods that the programs need. batch adds the
+       runtime methods of batch_code().'''
+    nodes = [node for tree in programs for node in walk(tree)]
+    reads = any(isinstance(node, Read_AST) for node in nodes)
+    writes = any(isinstance(node, Write_AST) for node in nodes)
+    result = '.class public Program\n' + \
+             '.super java/lang/Object\n'
+    if reads:
+        result += '.field private static input [B\n' + \
+                  '.field private static position I\n' + \
+                  '.field private static length I\n'
+    if writes:
+        result += '.field private static buffer [B\n' + \
+                  '.field private static count I\n' + \
+                  '.field private static digits [B\n'
+    if batch:
+        result += '.field private static stdin Ljava/io/InputStream;\n' + \
+                  '.field private static stdout Ljava/io/PrintStream;\n'
+    if split_methods:
+        result += '.field private static v [I\n'
+    result += '.method public <init>()V\n' + \
+              'aload_0\n' + \
+              'invokenonvirtual java/lang/Object/<init>()V\n' + \
+              'return\n' + \
+              '.end method\n' + \
+              methods
+    if writes:
+        result += output_methods
+    if reads:
+        result += input_methods
+    if batch:
+        result += batch_methods
+    return result
+
+def batch_code(programs):
+    '''Returns the class Program that comprises programs, a list of pairs of
+       a name and a Program_AST, as static methods p1, p2, ... Each program
+       is compiled with its own symbol table and label generator.
+       main runs the program whose index (from 1) is given as argument on
+       stdin and stdout. Without argument it runs all programs in order.
+       Each of them reads from the file name.in if it has read statements
+       and writes to the file name.out if it has write statements. If a
+       program throws an exception, the exception is reported on stderr and
+       the next program is run.'''
+    global symbol_table, label_generator
+    result = ''
+    for i, (name, tree) in enumerate(programs):
+        symbol_table = Symbol_Table()
+        symbol_table.location('Arguments') # unused, as in main
+        label_generator = Label()
+        generated.clear() # the code of shared expressions uses the locations
+                          # of the previous program
+        result += tree.method('p' + str(i + 1) + '()V')
+    label_generator = Label()
+    # main calls run(IZ)V, which selects the dispatch method for the chunk
+    # of batch_chunk_size programs that contains the index.
+    l1 = label_generator.next()
+    l2 = label_generator.next()
+    result += '.method public static main([Ljava/lang/String;)V\n' + \
+              '.limit locals 2\n' + \
+              '.limit stack 3\n' + \
+              'aload 0\n' + \
+              'arraylength\n' + \
+              'ifeq ' + l1 + '\n' + \
+              'aload 0\n' + \
+              'iconst_0\n' + \
+              'aaload\n' + \
+              'invokestatic java/lang/Integer/parseInt(Ljava/lang/String;)I\n' + \
+              'iconst_0\n' + \
+              'invokestatic Program/run(IZ)V\n' + \
+              'return\n' + \
+              l1 + ':\n' + \
+              'getstatic java/lang/System/in Ljava/io/InputStream;\n' + \
+              'putstatic Program/stdin Ljava/io/InputStream;\n' + \
+              'getstatic java/lang/System/out Ljava/io/PrintStream;\n' + \
+              'putstatic Program/stdout Ljava/io/PrintStream;\n' + \
+              'iconst_1\n' + \
+              'istore 1\n' + \
+              l2 + ':\n' + \
+              'iload 1\n' + \
+              'iconst_1\n' + \
+              'invokestatic Program/run(IZ)V\n' + \
+              'iinc 1 1\n' + \
+              'iload 1\n' + \
+              push(len(programs)) + \
+              'if_icmple ' + l2 + '\n' + \
+              'return\n' + \
+              '.end method\n'
+    chunks = (len(programs) + batch_chunk_size - 1) // batch_chunk_size
+    l1 = label_generator.next()
+    l2 = label_generator.next()
+    l3 = label_generator.next()
+    l4 = label_generator.next()
+    l5 = label_generator.next()
+    l6 = label_generator.next()
+    labels = [label_generator.next() for k in range(chunks)]
+    result += '.method private static run(IZ)V\n' + \
+              '.limit locals 2\n' + \
+              '.limit stack 4\n' + \
+              l1 + ':\n' + \
+              'iload 0\n' + \
+              'iload 1\n' + \
+              'iload 0\n' + \
+              'iconst_1\n' + \
+              'isub\n' + \
+              push(batch_chunk_size) + \
+              'idiv\n' + \
+              'tableswitch 0 ' + str(chunks - 1) + '\n'
+    for label in labels:
+        result += '    ' + label + '\n'
+    result += '    default : ' + l5 + '\n'
+    for k, label in enumerate(labels):
+        result += label + ':\n' + \
+                  'invokestatic Program/d' + str(k + 1) + '(IZ)V\n' + \
+                  'goto ' + l2 + '\n'
+    result += l5 + ':\n' + \
+              'pop2\n' + \
+              l2 + ':\n' + \
+              'iload 1\n' + \
+              'ifeq ' + l4 + '\n' + \
+              'invokestatic Program/restore()V\n' + \
+              l4 + ':\n' + \
+              'return\n' + \
+              l3 + ':\n' + \
+              'iload 1\n' + \
+              'ifne ' + l6 + '\n' + \
+              'athrow\n' + \
+              l6 + ':\n' + \
+              'invokevirtual java/lang/Throwable/printStackTrace()V\n' + \
+              'invokestatic Program/restore()V\n' + \
+              'return\n' + \
+              '.catch java/lang/Throwable from ' + l1 + ' to ' + l2 + \
+              ' using ' + l3 + '\n' + \
+              '.end method\n'
+    for k in range(chunks):
+        low = k * batch_chunk_size + 1
+        high = min(len(programs), low + batch_chunk_size - 1)
+        l1 = label_generator.next()
+        labels = [label_generator.next() for i in range(low, high + 1)]
+        skips = [label_generator.next() for i in range(low, high + 1)]
+        result += '.method private static d' + str(k + 1) + '(IZ)V\n' + \
+                  '.limit locals 2\n' + \
+                  '.limit stack 3\n' + \
+                  'iload 0\n' + \
+                  'tableswitch ' + str(low) + ' ' + str(high) + '\n'
+        for label in labels:
+            result += '    ' + label + '\n'
+        result += '    default : ' + l1 + '\n'
+        for i, label, skip in zip(range(low, high + 1), labels, skips):
+            name, tree = programs[i - 1]
+            nodes = walk(tree)
+            reads = any(isinstance(node, Read_AST) for node in nodes)
+            writes = any(isinstance(node, Write_AST) for node in nodes)
+            name = name.replace('\\', '\\\\').replace('"', '\\"')
+            result += label + ':\n' + \
+                      'iload 1\n' + \
+                      'ifeq ' + skip + '\n' + \
+                      'ldc "' + name + '"\n' + \
+                      push(int(reads)) + \
+                      push(int(writes)) + \
+                      'invokestatic Program/redirect(Ljava/lang/String;ZZ)V\n' + \
+                      skip + ':\n' + \
+                      'invokestatic Program/p' + str(i) + '()V\n' + \
+                      'return\n'
+        result += l1 + ':\n' + \
+                  'return\n' + \
+                  '.end method\n'
+    return class_code(result, [tree for name, tree in programs], True)
+
+# Static methods of the generated class that read the input of read
+# statements. next()I returns the next byte of System.in, or -1 at the end
+# of the input, refilling the byte array input when it is used up. read()I
+# skips everything up to the next digit, or minus sign followed by a digit,
+# and parses the integer there. A minus sign without a digit after it
+# separates numbers like any other character. Like the value written by
+# write(I)V, the integer is accumulated negated, so that -2147483648 needs
+# no special case. At the end of the input it throws a
+# NoSuchElementException and for an integer that does not fit in 32 bits an
+# InputMismatchException, like Scanner.nextInt().
+input_methods = \
+    '.method private static next()I\n' + \
+    '.limit stack 4\n' + \
+    'getstatic Program/position I\n' + \
+    'getstatic Program/length I\n' + \
+    'if_icmplt n2\n' + \
+    'getstatic java/lang/System/in Ljava/io/InputStream;\n' + \
+    'getstatic Program/input [B\n' + \
+    'invokevirtual java/io/InputStream/read([B)I\n' + \
+    'dup\n' + \
+    'putstatic Program/length I\n' + \
+    'ifgt n1\n' + \
+    'iconst_m1\n' + \
+    'ireturn\n' + \
+    'n1:\n' + \
+    'iconst_0\n' + \
+    'putstatic Program/position I\n' + \
+    'n2:\n' + \
+    'getstatic Program/input [B\n' + \
+    'getstatic Program/position I\n' + \
+    'dup\n' + \
+    'iconst_1\n' + \
+    'iadd\n' + \
+    'putstatic Program/position I\n' + \
+    'baload\n' + \
+    'ireturn\n' + \
+    '.end method\n' + \
+    '.method private static read()I\n' + \
+    '.limit locals 3\n' + \
+    '.limit stack 3\n' + \
+    'r1:\n' + \
+    'invokestatic Program/next()I\n' + \
+    'istore 0\n' + \
+    'r2:\n' + \
+    'iload 0\n' + \
+    'iflt r8\n' + \
+    'iload 0\n' + \
+    'bipush 45\n' + \
+    'if_icmpeq r3\n' + \
+    'iload 0\n' + \
+    'bipush 48\n' + \
+    'if_icmplt r1\n' + \
+    'iload 0\n' + \
+    'bipush 57\n' + \
+    'if_icmpgt r1\n' + \
+    'iconst_0\n' + \
+    'istore 1\n' + \
+    'goto r4\n' + \
+    'r3:\n' + \
+    'iconst_1\n' + \
+    'istore 1\n' + \
+    'invokestatic Program/next()I\n' + \
+    'istore 0\n' + \
+    'iload 0\n' + \
+    'bipush 48\n' + \
+    'if_icmplt r2\n' + \
+    'iload 0\n' + \
+    'bipush 57\n' + \
+    'if_icmpgt r2\n' + \
+    'r4:\n' + \
+    'iconst_0\n' + \
+    'istore 2\n' + \
+    'r5:\n' + \
+    'iload 0\n' + \
+    'bipush 48\n' + \
+    'if_icmplt r6\n' + \
+    'iload 0\n' + \
+    'bipush 57\n' + \
+    'if_icmpgt r6\n' + \
+    'iload 2\n' + \
+    'ldc -214748364\n' + \
+    'if_icmplt r9\n' + \
+    'iload 2\n' + \
+    'bipush 10\n' + \
+    'imul\n' + \
+    'bipush 48\n' + \
+    'iadd\n' + \
+    'iload 0\n' + \
+    'isub\n' + \
+    'dup\n' + \
+    'istore 2\n' + \
+    'ifgt r9\n' + \
+    'invokestatic Program/next()I\n' + \
+    'istore 0\n' + \
+    'goto r5\n' + \
+    'r6:\n' + \
+    'iload 1\n' + \
+    'ifne r7\n' + \
+    'iload 2\n' + \
+    'ineg\n' + \
+    'dup\n' + \
+    'istore 2\n' + \
+    'iflt r9\n' + \
+    'r7:\n' + \
+    'iload 2\n' + \
+    'ireturn\n' + \
+    'r8:\n' + \
+    'new java/util/NoSuchElementException\n' + \
+    'dup\n' + \
+    'invokespecial java/util/NoSuchElementException/<init>()V\n' + \
+    'athrow\n' + \
+    'r9:\n' + \
+    'new java/util/InputMismatchException\n' + \
+    'dup\n' + \
+    'invokespecial java/util/InputMismatchException/<init>()V\n' + \
+    'athrow\n' + \
+    '.end method\n'
+
+# Static methods of the generated class that buffer the output of write
+# statements. write(I)V formats its argument into the byte array digits
+# without allocating a String, from the last digit backwards, and copies it
+# with a newline to buffer. The digits are taken from the negated value so
+# that -2147483648 needs no special case. flush()V hands the buffer over to
+# System.out; it is called when the buffer is full and at exit.
+output_methods = \
+    '.method private static write(I)V\n' + \
+    '.limit locals 3\n' + \
+    '.limit stack 5\n' + \
+    'getstatic Program/count I\n' + \
+    'getstatic Program/buffer [B\n' + \
+    'arraylength\n' + \
+    'bipush 12\n' + \
+    'isub\n' + \
+    'if_icmple w1\n' + \
+    'invokestatic Program/flush()V\n' + \
+    'w1:\n' + \
+    'iload 0\n' + \
+    'istore 2\n' + \
+    'iload 0\n' + \
+    'ifle w2\n' + \
+    'iload 0\n' + \
+    'ineg\n' + \
+    'istore 0\n' + \
+    'w2:\n' + \
+    'bipush 12\n' + \
+    'istore 1\n' + \
+    'w3:\n' + \
+    'iinc 1 -1\n' + \
+    'getstatic Program/digits [B\n' + \
+    'iload 1\n' + \
+    'bipush 48\n' + \
+    'iload 0\n' + \
+    'bipush 10\n' + \
+    'irem\n' + \
+    'isub\n' + \
+    'bastore\n' + \
+    'iload 0\n' + \
+    'bipush 10\n' + \
+    'idiv\n' + \
+    'dup\n' + \
+    'istore 0\n' + \
+    'ifne w3\n' + \
+    'iload 2\n' + \
+    'ifge w4\n' + \
+    'iinc 1 -1\n' + \
+    'getstatic Program/digits [B\n' + \
+    'iload 1\n' + \
+    'bipush 45\n' + \
+    'bastore\n' + \
+    'w4:\n' + \
+    'getstatic Program/digits [B\n' + \
+    'iload 1\n' + \
+    'getstatic Program/buffer [B\n' + \
+    'getstatic Program/count I\n' + \
+    'bipush 12\n' + \
+    'iload 1\n' + \
+    'isub\n' + \
+    'invokestatic java/lang/System/arraycopy(Ljava/lang/Object;ILjava/lang/Object;II)V\n' + \
+    'getstatic Program/count I\n' + \
+    'bipush 12\n' + \
+    'iadd\n' + \
+    'iload 1\n' + \
+    'isub\n' + \
+    'istore 1\n' + \
+    'getstatic Program/buffer [B\n' + \
+    'iload 1\n' + \
+    'bipush 10\n' + \
+    'bastore\n' + \
+    'iload 1\n' + \
+    'iconst_1\n' + \
+    'iadd\n' + \
+    'putstatic Program/count I\n' + \
+    'return\n' + \
+    '.end method\n' + \
+    '.method private static flush()V\n' + \
+    '.limit stack 4\n' + \
+    'getstatic java/lang/System/out Ljava/io/PrintStream;\n' + \
+    'getstatic Program/buffer [B\n' + \
+    'iconst_0\n' + \
+    'getstatic Program/count I\n' + \
+    'invokevirtual java/io/PrintStream/write([BII)V\n' + \
+    'getstatic java/lang/System/out Ljava/io/PrintStream;\n' + \
+    'invokevirtual java/io/PrintStream/flush()V\n' + \
+    'iconst_0\n' + \
+    'putstatic Program/count I\n' + \
+    'return\n' + \
+    '.end method\n'
 
 class Statements_AST:
     def __init__(self, statements):
         self.statements = statements
+        self.part = None # the code_part of the last code
     def __repr__(self):
         result = repr(self.statements[0])
         for st in self.statements[1:]:
@@ -233,11 +1173,136 @@ class Statements_AST:
         for st in self.statements:
             result += st.indented(level+1)
         return result
+    def children(self):
+        return self.statements
     def code(self):
-        result = ''
+        return self.joined([self.fitted(st, entry)
+                            for st, entry in zip(self.statements,
+                                                 self.entries())])
+    def entries(self):
+        '''Returns for each statement that is a loop the identifiers known
+           to hold a constant value on entry to it, mapped to the value, and
+           None for the other statements.'''
+        result = []
+        constants = {}
+        for st in self.statements:
+            result.append(dict(constants) if isinstance(st, While_AST)
+                          else None)
+            for identifier in st.assigned():
+                constants.pop(identifier, None)
+            if isinstance(st, Assign_AST) and \
+               isinstance(st.expression, Number_AST):
+                constants[st.identifier.identifier] = int(st.expression.number)
+        return result
+    def fitted(self, st, entry):
+        '''Returns the code_part of the code of the statement st, given its
+           entry of entries(). If a method with that code alone, as sized by
+           Split_Run, is larger than method_size_limit, the statement lists
+           in st may fit in a method each but not together with the code
+           around them. The code is then generated once more with the limit
+           lowered by the excess for them, and without generating the
+           statements in them again in turn, and the smaller code is kept.
+           The optimisation reports of the discarded code are dropped.'''
+        global method_size_limit, refitting
+        first = len(split_methods)
+        with contextlib.redirect_stderr(io.StringIO()) as messages:
+            code = st.code() if entry == None else st.code(entry)
+        part = code_part(code, self.nested(st))
+        size = Split_Run().grown(part)
+        excess = size - method_size_limit
+        if excess > 0 and not refitting and excess < method_size_limit and \
+           any(isinstance(node, Statements_AST) for node in st.children()):
+            methods = split_methods[first:]
+            sets = dict((name, split_sets.pop(name))
+                        for name, unused in methods)
+            del split_methods[first:]
+            limit = method_size_limit
+            method_size_limit -= excess
+            refitting = True
+            with contextlib.redirect_stderr(io.StringIO()) as retry_messages:
+                retry = st.code() if entry == None else st.code(entry)
+            method_size_limit = limit
+            refitting = False
+            retry = code_part(retry, self.nested(st))
+            if Split_Run().grown(retry) < size:
+                part, messages = retry, retry_messages
+            else:
+                for name, unused in split_methods[first:]:
+                    del split_sets[name]
+                split_methods[first:] = methods
+                split_sets.update(sets)
+        if Split_Run().grown(part) > method_size_limit:
+            part = self.moved(st, part)
+        sys.stderr.write(messages.getvalue())
+        return part
+    def moved(self, st, part):
+        '''Returns part, the code_part of the code of the statement st, with
+           the code of each statement list in st moved to a split method of
+           its own, if that makes a method with it smaller. The locations
+           that the method of st caches are then copied once around the
+           single call of each list instead of around each of its calls.'''
+        first = len(split_methods)
+        code = part[0]
+        for nested in self.nested(st):
+            i = find_lines(code, nested[0]) if nested[0] else -1
+            if i >= 0:
+                run = Split_Run()
+                run.append(nested)
+                code = code[:i] + split_method(run) + \
+                       code[i + len(nested[0]):]
+        result = code_part(code)
+        if Split_Run().grown(result) < Split_Run().grown(part):
+            return result
+        for name, unused in split_methods[first:]:
+            del split_sets[name]
+        del split_methods[first:]
+        return part
+    def nested(self, st):
+        '''Returns the code_part of the last code of each statement list
+           that is a child of st.'''
+        return [node.part for node in st.children()
+                if isinstance(node, Statements_AST) and node.part != None]
+    def joined(self, parts):
+        '''Returns the codes of the statements, given as their code_part,
+           one after the other, and keeps the code_part of the result in
+           self.part. If a method with them, as sized by Split_Run, is
+           larger than method_size_limit, they are split into consecutive
+           runs of statements that are moved to separate methods, and the
+           calls of these are joined in the same way. A statement that is
+           larger than the limit by itself, as left by fitted, makes a
+           method of its own.'''
+        whole = Split_Run()
+        for part in parts:
+            whole.append(part)
+            if whole.size > method_size_limit:
+                break
+        else:
+            code = ''.join(part[0] for part in parts)
+            self.part = code, sum(part[1] for part in parts), whole.used, \
+                        whole.assigned, whole.calls
+            return code
+        calls = []
+        run = Split_Run()
+        for part in parts:
+            if run.codes and run.grown(part) > method_size_limit:
+                calls.append(split_method(run))
+                run = Split_Run()
+            run.append(part)
+        calls.append(split_method(run))
+        # The calls are joined in turn as long as a method holds two.
+        if len(calls) > 1 and \
+           Split_Run().grown(code_part(calls[0] * 2)) <= method_size_limit:
+            return self.joined([code_part(call) for call in calls])
+        self.part = code_part(''.join(calls))
+        return self.part[0]
+    def assigned(self):
+        result = set()
         for st in self.statements:
-            result += st.code()
+            result |= st.assigned()
         return result
+    def invariants(self, assigned, found):
+        for st in self.statements:
+            st.invariants(assigned, found)
 
 class If_AST:
     def __init__(self, condition, then):
@@ -250,11 +1315,18 @@ class If_AST:
         return indent('If', level) + \
                self.condition.indented(level+1) + \
                self.then.indented(level+1)
+    def children(self):
+        return [self.condition, self.then]
     def code(self):
         l1 = label_generator.next()
         return self.condition.false_code(l1) + \
                self.then.code() + \
                l1 + ':\n'
+    def assigned(self):
+        return self.then.assigned()
+    def invariants(self, assigned, found):
+        self.condition.invariants(assigned, found)
+        self.then.invariants(assigned, found)
     
 class If_Else_AST:
     def __init__(self, condition, then, again):
@@ -270,15 +1342,67 @@ class If_Else_AST:
                self.condition.indented(level+1) + \
                self.then.indented(level+1) + \
                self.again.indented(level+1)
+    def children(self):
+        return [self.condition, self.then, self.again]
     def code(self):
+        chain = self.cases()
+        if chain != None and len(chain[1]) >= switch_threshold:
+            return switch_code(*chain)
         l1 = label_generator.next()
         l2 = label_generator.next()
+        outcomes = branch_profile.get(self.condition)
+        if outcomes != None and outcomes[1] > outcomes[0]:
+            # The branch laid out first ends with a goto over the other one.
+            # The then branch is the likelier successor, so it goes last,
+            # which leaves a single jump on its path.
+            report('if at ' + site(self.condition) + ' laid out with the ' +
+                   'then branch last: ' + str(outcomes[0]) + ' false, ' +
+                   str(outcomes[1]) + ' true')
+            return self.condition.true_code(l1) + \
+                   self.again.code() + \
+                   'goto ' + l2 + '\n' + \
+                   l1 + ':\n' + \
+                   self.then.code() + \
+                   l2 + ':\n'
         return self.condition.false_code(l1) + \
                self.then.code() + \
                'goto ' + l2 + '\n' + \
                l1 + ':\n' + \
                self.again.code() + \
                l2 + ':\n'
+    def cases(self):
+        '''Returns a triple (x, cases, default) if the statement is a chain
+           if x = c1 then s1 else if x = c2 then s2 ... end end that
+           compares one identifier x with distinct constants. cases is the
+           list of pairs (ci, si) and default holds the statements of the
+           final else branch, or is None if there is none.
+           Returns None if the condition is not of the form x = c.'''
+        test = equality(self.condition)
+        if test == None:
+            return None
+        identifier, value = test
+        cases = []
+        tree = self
+        while True:
+            cases.append((value, tree.then))
+            if isinstance(tree, If_AST):
+                return identifier, cases, None
+            nested = tree.again.statements[0]
+            if len(tree.again.statements) == 1 and \
+               isinstance(nested, (If_AST, If_Else_AST)):
+                test = equality(nested.condition)
+            else:
+                test = None
+            if test == None or test[0] != identifier or \
+               test[1] in [c for c, st in cases]:
+                return identifier, cases, tree.again
+            tree, value = nested, test[1]
+    def assigned(self):
+        return self.then.assigned() | self.again.assigned()
+    def invariants(self, assigned, found):
+        self.condition.invariants(assigned, found)
+        self.then.invariants(assigned, found)
+        self.again.invariants(assigned, found)
 
 class While_AST:
     def __init__(self, condition, body):
@@ -291,14 +1415,175 @@ class While_AST:
         return indent('While', level) + \
                self.condition.indented(level+1) + \
                self.body.indented(level+1)
-    def code(self):
+    def children(self):
+        return [self.condition, self.body]
+    def code(self, entry={}):
+        '''The loop is inverted: the condition is tested once on entry and
+           then at the bottom of the body, so every iteration takes a single
+           conditional back-edge. Subexpressions that do not depend on the
+           identifiers assigned in the loop are computed into temporaries
+           once after the entry test, where they are read inside the loop,
+           as long as this preheader, with the copies of the temporaries to
+           Program/v of split methods, takes at most a quarter of
+           method_size_limit.
+           Products of an induction variable and a constant are kept in
+           temporaries that are updated along with the induction variable.
+           entry maps identifiers to their constant values on entry to the
+           loop. If they determine the trip count, the loop is unrolled.'''
         l1 = label_generator.next()
         l2 = label_generator.next()
-        return l1 + ':\n' + \
-               self.condition.false_code(l2) + \
-               self.body.code() + \
-               'goto ' + l1 + '\n' + \
-               l2 + ':\n'
+        # the entry test runs before the preheader and cannot use its results
+        test = self.condition.false_code(l2)
+        found = []
+        self.invariants(self.body.assigned(), found)
+        inductions = self.inductions()
+        preheader = ''
+        preheader_size = 0
+        temporaries = {}
+        loop_hoisted = {} # expressions hoisted out of this loop
+        loop_updates = {}
+        for expression in found + self.products(inductions):
+            if expression in hoisted or expression in loop_hoisted:
+                continue # already hoisted out of an enclosing loop or this
+                         # loop, as a shared node occurs in several places
+            key = repr(expression)
+            if key not in temporaries:
+                computation = expression.code()
+                # The preheader stays in the method of the loop when the body
+                # is split, so it must leave room for the calls of the body,
+                # around which the temporary is copied to Program/v, as it is
+                # on exit.
+                preheader_size += code_size(computation) + 4 + \
+                                  2 * transfer_size(256)
+                if preheader_size > method_size_limit // 4:
+                    break
+                temporaries[key] = symbol_table.temporary()
+                preheader += computation + \
+                             'istore ' + str(temporaries[key]) + '\n'
+                if expression.induction() in inductions: # strength reduced
+                    assign, step = inductions[expression.induction()]
+                    factor = expression.factor()
+                    loop_updates.setdefault(assign, []).append(
+                        (temporaries[key], factor * step))
+            loop_hoisted[expression] = temporaries[key]
+        hoisted.update(loop_hoisted)
+        hoist_changed()
+        for assign, updates in loop_updates.items():
+            induction_updates[assign] = updates
+        trips = self.trip_count(inductions, entry)
+        if trips == None or unroll_factor <= 1 or \
+           any(isinstance(node, While_AST) for node in walk(self.body)):
+            result = test + \
+                     preheader + \
+                     l1 + ':\n' + \
+                     self.body.code() + \
+                     self.condition.true_code(l1) + \
+                     l2 + ':\n'
+        else:
+            result = self.unrolled_code(trips, test, preheader, l1, l2)
+        for expression in loop_hoisted:
+            del hoisted[expression]
+        hoist_changed()
+        for assign in loop_updates:
+            del induction_updates[assign]
+        return result
+    def unrolled_code(self, trips, test, preheader, l1, l2):
+        '''Returns the code of a loop that is known to run trips times.
+           Loops with at most unroll_factor iterations are unrolled
+           completely. Otherwise the body is repeated unroll_factor times
+           per iteration, after a prologue that runs the remaining
+           iterations, and the entry test is dropped. The loop is not
+           unrolled if that would make it larger than method_size_limit.'''
+        body = self.body.code()
+        rolled = test + \
+                 preheader + \
+                 l1 + ':\n' + \
+                 body + \
+                 self.condition.true_code(l1) + \
+                 l2 + ':\n'
+        if trips == 0:
+            result = ''
+        elif trips <= unroll_factor:
+            result = preheader + body
+            for i in range(trips - 1):
+                result += self.body.code()
+        else:
+            result = preheader
+            for i in range(trips % unroll_factor):
+                result += self.body.code()
+            result += l1 + ':\n' + body
+            for i in range(unroll_factor - 1):
+                result += self.body.code()
+            result += self.condition.true_code(l1)
+        report('loop ' + l1 + ' with ' + str(trips) + ' iterations' +
+               ' unrolled by ' + str(min(trips, unroll_factor)) + ': ' +
+               str(code_size(rolled)) + ' -> ' +
+               str(code_size(result)) + ' bytes of code')
+        if code_size(result) > method_size_limit:
+            report('loop ' + l1 + ' is too large to unroll')
+            return rolled
+        return result
+    def inductions(self):
+        '''Returns the basic induction variables of the loop, mapped to a
+           pair of the assignment that updates them and the step. A basic
+           induction variable is assigned exactly once in the body, by a
+           top-level statement that adds or subtracts a constant.'''
+        result = {}
+        others = set()
+        for st in self.body.statements:
+            step = st.step() if isinstance(st, Assign_AST) else None
+            if step != None and st.identifier.identifier not in result:
+                result[st.identifier.identifier] = (st, step)
+            else:
+                others |= st.assigned()
+        for identifier in list(result):
+            if identifier in others:
+                del result[identifier]
+        return result
+    def products(self, inductions):
+        '''Returns the products of an induction variable and a constant that
+           occur in the loop.'''
+        result = []
+        for node in walk(self):
+            if isinstance(node, Expression_AST) and \
+               node.induction() in inductions:
+                result.append(node)
+        return result
+    def trip_count(self, inductions, entry):
+        '''Returns the number of iterations if the condition compares a
+           basic induction variable with a known entry value to a constant,
+           None otherwise.'''
+        condition = self.condition
+        if not isinstance(condition, Comparison_AST):
+            return None
+        left, op, right = condition.left, condition.op, condition.right
+        if isinstance(left, Number_AST) and isinstance(right, Identifier_AST):
+            swap = { '<':'>', '=':'=', '>':'<', '<=':'>=', '!=':'!=', '>=':'<=' }
+            left, op, right = right, swap[op], left
+        if not isinstance(left, Identifier_AST) or \
+           not isinstance(right, Number_AST) or \
+           left.identifier not in inductions or \
+           left.identifier not in entry:
+            return None
+        start, step = entry[left.identifier], inductions[left.identifier][1]
+        limit = int(right.number)
+        if op == '<=':
+            op, limit = '<', limit + 1
+        elif op == '>=':
+            op, limit = '>', limit - 1
+        if op == '<' and step > 0:
+            return max(0, -((start - limit) // step))
+        elif op == '>' and step < 0:
+            return max(0, -((limit - start) // -step))
+        elif op == '!=' and step != 0 and (limit - start) % step == 0 and \
+             (limit - start) // step >= 0:
+            return (limit - start) // step
+        return None
+    def assigned(self):
+        return self.body.assigned()
+    def invariants(self, assigned, found):
+        self.condition.invariants(assigned, found)
+        self.body.invariants(assigned, found)
 
 class Assign_AST:
     def __init__(self, identifier, expression):
@@ -310,10 +1595,38 @@ class Assign_AST:
         return indent('Assign', level) + \
                self.identifier.indented(level+1) + \
                self.expression.indented(level+1)
+    def children(self):
+        return [self.identifier, self.expression]
     def code(self):
         loc = symbol_table.location(self.identifier.identifier)
-        return self.expression.code() + \
-               'istore ' + str(loc) + '\n'
+        step = self.step()
+        if step != None:
+            result = increment(loc, step)
+        else:
+            result = self.expression.code() + \
+                     'istore ' + str(loc) + '\n'
+        # keep strength reduced products of an induction variable up to date
+        for temporary, step in induction_updates.get(self, []):
+            result += increment(temporary, step)
+        return result
+    def step(self):
+        '''Returns c if the assignment is x := x + c or x := x - c for a
+           constant c, None otherwise.'''
+        expression = self.expression
+        if not isinstance(expression, Expression_AST):
+            return None
+        left, op, right = expression.left, expression.op, expression.right
+        if op == '+' and isinstance(left, Number_AST):
+            left, right = right, left
+        if op in ['+', '-'] and isinstance(left, Identifier_AST) and \
+           left.identifier == self.identifier.identifier and \
+           isinstance(right, Number_AST):
+            return int(right.number) if op == '+' else -int(right.number)
+        return None
+    def assigned(self):
+        return {self.identifier.identifier}
+    def invariants(self, assigned, found):
+        hoist(self.expression, assigned, found)
 
 class Write_AST:
     def __init__(self, expression):
@@ -322,11 +1635,15 @@ class Write_AST:
         return 'write ' + repr(self.expression)
     def indented(self, level):
         return indent('Write', level) + self.expression.indented(level+1)
+    def children(self):
+        return [self.expression]
     def code(self):
-        return 'getstatic java/lang/System/out Ljava/io/PrintStream;\n' + \
-               self.expression.code() + \
-               'invokestatic java/lang/String/valueOf(I)Ljava/lang/String;\n' + \
-               'invokevirtual java/io/PrintStream/println(Ljava/lang/String;)V\n'
+        return self.expression.code() + \
+               'invokestatic Program/write(I)V\n'
+    def assigned(self):
+        return set()
+    def invariants(self, assigned, found):
+        hoist(self.expression, assigned, found)
 
 class Read_AST:
     def __init__(self, identifier):
@@ -335,12 +1652,16 @@ class Read_AST:
         return 'read ' + repr(self.identifier)
     def indented(self, level):
         return indent('Read', level) + self.identifier.indented(level+1)
+    def children(self):
+        return [self.identifier]
     def code(self):
-        java_scanner = symbol_table.location('Java Scanner')
         loc = symbol_table.location(self.identifier.identifier)
-        return 'aload ' + str(java_scanner) + '\n' + \
-               'invokevirtual java/util/Scanner.nextInt()I\n' + \
+        return 'invokestatic Program/read()I\n' + \
                'istore ' + str(loc) + '\n'
+    def assigned(self):
+        return {self.identifier.identifier}
+    def invariants(self, assigned, found):
+        pass
 
 class Comparison_AST:
     def __init__(self, left, op, right):
@@ -353,6 +1674,8 @@ class Comparison_AST:
         return indent(self.op, level) + \
                self.left.indented(level+1) + \
                self.right.indented(level+1)
+    def children(self):
+        return [self.left, self.right]
     def true_code(self, label):
         op = { '<':'if_icmplt', '=':'if_icmpeq', '>':'if_icmpgt',
                '<=':'if_icmple', '!=':'if_icmpne', '>=':'if_icmpge' }
@@ -366,6 +1689,9 @@ class Comparison_AST:
         return self.left.code() + \
                self.right.code() + \
                op[self.op] + ' ' + label + '\n'
+    def invariants(self, assigned, found):
+        hoist(self.left, assigned, found)
+        hoist(self.right, assigned, found)
 
 class Expression_AST:
     def __init__(self, left, op, right):
@@ -378,11 +1704,75 @@ class Expression_AST:
         return indent(self.op, level) + \
                self.left.indented(level+1) + \
                self.right.indented(level+1)
+    def children(self):
+        return [self.left, self.right]
     def code(self):
+        '''The code of an expression that the parser shares is generated
+           once and reused for as long as hoisted does not change.'''
+        if self in hoisted:
+            return 'iload ' + str(hoisted[self]) + '\n'
+        if self not in repeated:
+            return self.computation()
+        reused = generated.get(self)
+        if reused == None or reused[1] != hoisted_version:
+            reused = generated[self] = (self.computation(), hoisted_version)
+        return reused[0]
+    def computation(self):
+        if self.op == '*' and power_of_two(self.left) != None:
+            return self.right.code() + \
+                   push(power_of_two(self.left)) + \
+                   'ishl\n'
+        if self.op == '*' and power_of_two(self.right) != None:
+            return self.left.code() + \
+                   push(power_of_two(self.right)) + \
+                   'ishl\n'
+        if self.op == '/' and power_of_two(self.right) != None:
+            # An arithmetic shift rounds towards minus infinity, but idiv
+            # rounds towards zero. Adding 2**k-1 to negative dividends first
+            # makes the shift round towards zero as well.
+            k = power_of_two(self.right)
+            return self.left.code() + \
+                   'dup\n' + \
+                   push(31) + \
+                   'ishr\n' + \
+                   push(32 - k) + \
+                   'iushr\n' + \
+                   'iadd\n' + \
+                   push(k) + \
+                   'ishr\n'
         op = { '+':'iadd', '-':'isub', '*':'imul', '/':'idiv' }
         return self.left.code() + \
                self.right.code() + \
                op[self.op] + '\n'
+    def induction(self):
+        '''Returns the identifier x if the expression is x * c or c * x for
+           a constant c, None otherwise.'''
+        if self.op == '*' and isinstance(self.right, Number_AST) and \
+           isinstance(self.left, Identifier_AST):
+            return self.left.identifier
+        if self.op == '*' and isinstance(self.left, Number_AST) and \
+           isinstance(self.right, Identifier_AST):
+            return self.right.identifier
+        return None
+    def factor(self):
+        '''Returns the constant c of a product x * c or c * x.'''
+        if isinstance(self.right, Number_AST):
+            return int(self.right.number)
+        return int(self.left.number)
+    def may_trap(self):
+        '''Division may throw unless the divisor is a non-zero constant.'''
+        return self.op == '/' and not (isinstance(self.right, Number_AST) and
+                                       int(self.right.number) != 0)
+    def invariant(self, assigned, found):
+        left = self.left.invariant(assigned, found)
+        right = self.right.invariant(assigned, found)
+        if left and right and not self.may_trap():
+            return True
+        # only the invariant operands are hoisted
+        for operand, invariant in ((self.left, left), (self.right, right)):
+            if invariant and isinstance(operand, Expression_AST):
+                found.append(operand)
+        return False
 
 class Number_AST:
     def __init__(self, number):
@@ -391,8 +1781,12 @@ class Number_AST:
         return self.number
     def indented(self, level):
         return indent(self.number, level)
+    def children(self):
+        return []
     def code(self): # works only for short numbers
         return 'sipush ' + self.number + '\n'
+    def invariant(self, assigned, found):
+        return True
 
 class Identifier_AST:
     def __init__(self, identifier):
@@ -401,9 +1795,13 @@ class Identifier_AST:
         return self.identifier
     def indented(self, level):
         return indent(self.identifier, level)
+    def children(self):
+        return []
     def code(self):
         loc = symbol_table.location(self.identifier)
         return 'iload ' + str(loc) + '\n'
+    def invariant(self, assigned, found):
+        return self.identifier not in assigned
     
 class Boolean_AST:
     def __init__(self, left, op, right = None):
@@ -413,9 +1811,12 @@ class Boolean_AST:
         
     def __repr__(self):
         op = { Token.AND:'and', Token.OR:'or', Token.NOT:'not' }
-        return repr(self.left) + self.op + repr(self.right)
+        if self.right == None:
+            return op[self.op] + ' ' + repr(self.left)
+        return '(' + repr(self.left) + ' ' + op[self.op] + ' ' + \
+               repr(self.right) + ')'
     
-    def indented(self, leve):
+    def indented(self, level):
         if self.right == None:
             return indent(self.op, level) + \
                    self.left.indented(level + 1)
@@ -424,34 +1825,161 @@ class Boolean_AST:
                    self.left.indented(level + 1) + \
                    self.right.indented(level + 1)
     
+    def children(self):
+        if self.right == None:
+            return [self.left]
+        return [self.left, self.right]
+
+    # The operands are evaluated in order and only as far as needed. A new
+    # label is only allocated where the false (true) outcome of the left
+    # operand of and (or) has to skip the right operand. A negation costs
+    # no code: it swaps the roles of true_code and false_code, so that it
+    # ends up inverting the jump instruction of the comparisons below it.
+
     def true_code(self, label):
-        l1 = label_generator.next()
-        op = { Token.AND:'and', Token.OR:'or', Token.NOT:'not' }
         if self.op == Token.AND:
-            return self.left.false_code(l1) + \
-                   self.right.true_code(label) + \
+            first, second = self.operands()
+            l1 = label_generator.next()
+            return first.false_code(l1) + \
+                   second.true_code(label) + \
                    l1 + ':\n'
         elif self.op == Token.OR:
-            return self.left.true_code(label) + \
-                   self.right.true_code(label)
+            first, second = self.operands()
+            return first.true_code(label) + \
+                   second.true_code(label)
         elif self.op == Token.NOT:
             return self.left.false_code(label)
     
     def false_code(self, label):
-        l1 = label_generator.next()
-        op = { Token.AND:'and', Token.OR:'or', Token.NOT:'not' }
         if self.op == Token.AND:
-            return self.left.false_code(label) + \
-                   self.right.false_code(label)
+            first, second = self.operands()
+            return first.false_code(label) + \
+                   second.false_code(label)
         elif self.op == Token.OR:
-            return self.left.true_code(l1) + \
-                   self.right.false_code(label) + \
+            first, second = self.operands()
+            l1 = label_generator.next()
+            return first.true_code(l1) + \
+                   second.false_code(label) + \
                    l1 + ':\n'
         elif self.op == Token.NOT:
             return self.left.true_code(label)
 
+    def operands(self):
+        '''Returns the operands of and or or in the order they are tested.
+           With a branch profile, the operand that decides the outcome more
+           often per node, by being false for and or true for or, is tested
+           first. Operands that divide keep their order, so that division by
+           zero happens exactly as in the program.'''
+        left, right = branch_profile.get(self.left), \
+                      branch_profile.get(self.right)
+        if left == None or right == None or \
+           divides(self.left) or divides(self.right):
+            return self.left, self.right
+        deciding = 0 if self.op == Token.AND else 1
+        def rank(tree, outcomes):
+            return outcomes[deciding] / max(sum(outcomes), 1) / \
+                   len(walk(tree))
+        if rank(self.right, right) > rank(self.left, left):
+            report(self.op.lower() + ' at ' + site(self) + ' tests ' +
+                   repr(self.right) + ' first')
+            return self.right, self.left
+        return self.left, self.right
+
+    def invariants(self, assigned, found):
+        self.left.invariants(assigned, found)
+        if self.right != None:
+            self.right.invariants(assigned, found)
+
+def hoist_changed():
+    '''Invalidates the code of shared expressions, which may read hoisted
+       expressions from temporaries.'''
+    global hoisted_version
+    hoisted_version += 1
+
+def divides(tree):
+    '''Returns whether tree contains a division, which may fail.'''
+    return any(isinstance(node, Expression_AST) and node.op == '/'
+               for node in walk(tree))
+
+def site(condition):
+    '''Returns the key of condition in branch profiles: the line and column
+       of its operator.'''
+    return '%d:%d' % positions[condition]
+
+def load_branch_profile(file_name, tree):
+    '''Sets branch_profile to the outcomes of the conditions of tree in the
+       branch profile in file_name, which profiler.py writes. The profile is
+       a JSON object that maps the sites of conditions to their text and
+       the numbers of their false and true outcomes:
+           { "format": 1,
+             "sites": { "7:11": { "condition": "prime=1",
+                                  "outcomes": [17737, 301276] }, ... } }
+       Sites whose condition differs from the condition of tree at the same
+       site, because the program has changed since it was profiled, and
+       sites whose outcomes are not two counts are ignored. Returns the
+       numbers of sites used and ignored, or None if the file is not a
+       branch profile.'''
+    import json
+    branch_profile.clear()
+    try:
+        with open(file_name) as profile_file:
+            profile = json.load(profile_file)
+        if profile['format'] != 1:
+            return None
+        sites = dict(profile['sites'])
+    except (OSError, ValueError, TypeError, KeyError):
+        return None
+    used = 0
+    for node in walk(tree):
+        if node in positions and isinstance(node, (Comparison_AST,
+                                                   Boolean_AST)):
+            entry = sites.get(site(node))
+            if isinstance(entry, dict) and \
+               entry.get('condition') == repr(node):
+                outcomes = entry.get('outcomes')
+                if isinstance(outcomes, list) and len(outcomes) == 2 and \
+                   all(type(count) == int and count >= 0
+                       for count in outcomes):
+                    branch_profile[node] = outcomes
+                    used += 1
+    return used, len(sites) - used
+
+def hoist(expression, assigned, found):
+    '''Appends expression to found if it is an invariant computation worth
+       hoisting out of a loop, or else its maximal invariant subexpressions.'''
+    if expression.invariant(assigned, found) and \
+       isinstance(expression, Expression_AST):
+        found.append(expression)
+
 # The following methods comprise the recursive-descent parser.
 
+def make(kind, *fields):
+    '''Returns the expression node kind(*fields), or the identical node made
+       before. Expressions are never changed after parsing, so identical
+       ones can be one node shared by all the places they occur in, which
+       turns the abstract syntax tree into a directed acyclic graph.'''
+    key = (kind,) + fields
+    node = interned.get(key)
+    if node == None:
+        node = interned[key] = kind(*fields)
+    else:
+        repeated.add(node)
+    return node
+
+def parse(input_file, name=None):
+    '''Returns the Program_AST of the program in input_file. Stops execution
+       if there is input left after the program. name is the name of the
+       input file used in the message, if any.'''
+    global scanner
+    scanner = Scanner(input_file)
+    result = program()
+    if scanner.lookahead() != None:
+        print((name + ': ' if name else '') +
+              'syntax error: end of input expected but token ' +
+              repr(scanner.lookahead()) + ' found')
+        sys.exit()
+    return result
+
 def program():
     sts = statements()
     return Program_AST(sts)
@@ -465,18 +1993,21 @@ def statements():
     return Statements_AST(result)
 
 def statement():
+    position = scanner.position()
     if scanner.lookahead() == Token.READ:
-        return read()
+        result = read()
     elif scanner.lookahead() == Token.WRITE:
-        return write()
+        result = write()
     elif scanner.lookahead() == Token.IF:
-        return if_statement()
+        result = if_statement()
     elif scanner.lookahead() == Token.WHILE:
-        return while_statement()
+        result = while_statement()
     elif scanner.lookahead() == Token.ID:
-        return assignment()
+        result = assignment()
     else: # error
         return scanner.consume(Token.IF, Token.WHILE, Token.ID)
+    positions[result] = position
+    return result
 
 def if_statement():
     scanner.consume(Token.IF)
@@ -522,17 +2053,20 @@ operator = { Token.LESS:'<', Token.EQ:'=', Token.GRTR:'>',
 
 def comparison():
     left = expression()
+    position = scanner.position()
     op = scanner.consume(Token.LESS, Token.EQ, Token.GRTR,
                          Token.LEQ, Token.NEQ, Token.GEQ)
     right = expression()
-    return Comparison_AST(left, operator[op], right)
+    result = Comparison_AST(left, operator[op], right)
+    positions[result] = position
+    return result
 
 def expression():
     result = term()
     while scanner.lookahead() in [Token.ADD, Token.SUB]:
         op = scanner.consume(Token.ADD, Token.SUB)
         tree = term()
-        result = Expression_AST(result, operator[op], tree)
+        result = make(Expression_AST, result, operator[op], tree)
     return result
 
 def term():
@@ -540,7 +2074,7 @@ def term():
     while scanner.lookahead() in [Token.MUL, Token.DIV]:
         op = scanner.consume(Token.MUL, Token.DIV)
         tree = factor()
-        result = Expression_AST(result, operator[op], tree)
+        result = make(Expression_AST, result, operator[op], tree)
     return result
 
 def factor():
@@ -551,7 +2085,7 @@ def factor():
         return result
     elif scanner.lookahead() == Token.NUM:
         value = scanner.consume(Token.NUM)[1]
-        return Number_AST(value)
+        return make(Number_AST, value)
     elif scanner.lookahead() == Token.ID:
         return identifier()
     else: # error
@@ -559,70 +2093,261 @@ def factor():
 
 def identifier():
     value = scanner.consume(Token.ID)[1]
-    return Identifier_AST(value)
+    return make(Identifier_AST, value)
 
 def boolean_expression():
     result = boolean_term()
     while scanner.lookahead() == Token.OR:
+        position = scanner.position()
         op = scanner.consume(Token.OR)
         boolTerm = boolean_term()
-        result = Boolean_AST(result, operator[op], boolTerm)
+        result = Boolean_AST(result, op, boolTerm)
+        positions[result] = position
     return result
 
 def boolean_term():
     result = boolean_factor()
     while scanner.lookahead() == Token.AND:
+        position = scanner.position()
         op = scanner.consume(Token.AND)
         boolFactor = boolean_factor()
-        result = Boolean_AST(result, oprator[op], boolFactor)
+        result = Boolean_AST(result, op, boolFactor)
+        positions[result] = position
     return result
 
 def boolean_factor():
-    if scanner.lookahead() != Token.NOT:
-        result = comparison()
+    if scanner.lookahead() == Token.NOT:
+        position = scanner.position()
+        op = scanner.consume(Token.NOT)
+        boolFactor = boolean_factor()
+        result = Boolean_AST(boolFactor, op)
+        positions[result] = position
+        return result
+    elif scanner.lookahead() == Token.LPAR and \
+         scanner.condition_in_parentheses():
+        scanner.consume(Token.LPAR)
+        result = boolean_expression()
+        scanner.consume(Token.RPAR)
         return result
     else:
-        op = scanner.consume(Token.NOT)
-        boolFactor = boolean_Factor()
-        return Boolean_AST(boolFactor, operator[op])
+        result = comparison()
+        return result
 
-# Initialise scanner, symbol table and label generator.
+# Static methods of the generated class of batch_code(). redirect(String, Z,
+# Z)V replaces stdin by the file name.in if the first flag is set and stdout
+# by the file name.out if the second flag is set. restore()V closes these
+# files and brings back the original streams.
+batch_methods = \
+    '.method private static redirect(Ljava/lang/String;ZZ)V\n' + \
+    '.limit locals 3\n' + \
+    '.limit stack 6\n' + \
+    'iload 1\n' + \
+    'ifeq b1\n' + \
+    'new java/io/FileInputStream\n' + \
+    'dup\n' + \
+    'aload 0\n' + \
+    'ldc ".in"\n' + \
+    'invokevirtual java/lang/String/concat(Ljava/lang/String;)Ljava/lang/String;\n' + \
+    'invokespecial java/io/FileInputStream/<init>(Ljava/lang/String;)V\n' + \
+    'invokestatic java/lang/System/setIn(Ljava/io/InputStream;)V\n' + \
+    'b1:\n' + \
+    'iload 2\n' + \
+    'ifeq b2\n' + \
+    'new java/io/PrintStream\n' + \
+    'dup\n' + \
+    'new java/io/FileOutputStream\n' + \
+    'dup\n' + \
+    'aload 0\n' + \
+    'ldc ".out"\n' + \
+    'invokevirtual java/lang/String/concat(Ljava/lang/String;)Ljava/lang/String;\n' + \
+    'invokespecial java/io/FileOutputStream/<init>(Ljava/lang/String;)V\n' + \
+    'invokespecial java/io/PrintStream/<init>(Ljava/io/OutputStream;)V\n' + \
+    'invokestatic java/lang/System/setOut(Ljava/io/PrintStream;)V\n' + \
+    'b2:\n' + \
+    'return\n' + \
+    '.end method\n' + \
+    '.method private static restore()V\n' + \
+    '.limit stack 2\n' + \
+    'getstatic java/lang/System/in Ljava/io/InputStream;\n' + \
+    'getstatic Program/stdin Ljava/io/InputStream;\n' + \
+    'if_acmpeq b1\n' + \
+    'getstatic java/lang/System/in Ljava/io/InputStream;\n' + \
+    'invokevirtual java/io/InputStream/close()V\n' + \
+    'getstatic Program/stdin Ljava/io/InputStream;\n' + \
+    'invokestatic java/lang/System/setIn(Ljava/io/InputStream;)V\n' + \
+    'b1:\n' + \
+    'getstatic java/lang/System/out Ljava/io/PrintStream;\n' + \
+    'getstatic Program/stdout Ljava/io/PrintStream;\n' + \
+    'if_acmpeq b2\n' + \
+    'getstatic java/lang/System/out Ljava/io/PrintStream;\n' + \
+    'invokevirtual java/io/PrintStream/close()V\n' + \
+    'getstatic Program/stdout Ljava/io/PrintStream;\n' + \
+    'invokestatic java/lang/System/setOut(Ljava/io/PrintStream;)V\n' + \
+    'b2:\n' + \
+    'return\n' + \
+    '.end method\n'
+
+def reset():
+    '''Restores the state of the code generator before the first program, so
+       that the next program compiles as in a process of its own.'''
+    global symbol_table, label_generator
+    symbol_table = Symbol_Table()
+    symbol_table.location('Arguments') # local 0 holds the arguments of main
+    label_generator = Label()
+    hoisted.clear()
+    induction_updates.clear()
+    positions.clear()
+    branch_profile.clear()
+    interned.clear()
+    repeated.clear()
+    generated.clear()
+    split_methods.clear()
+    split_sets.clear()
+
+# Initialise symbol table and label generator.
 
-scanner = Scanner(sys.stdin)
 symbol_table = Symbol_Table()
-symbol_table.location('Java Scanner') # fix a location for the Java Scanner
+symbol_table.location('Arguments') # local 0 holds the arguments of main
 label_generator = Label()
+hoisted = {} # loop invariant expressions mapped to their temporary location
+induction_updates = {} # induction variable updates mapped to the updates
+                       # of the strength reduced products of the variable
+positions = {} # parsed statements mapped to the line and column where they
+               # start in the source, and conditions to those of their
+               # operator
+branch_profile = {} # conditions mapped to the numbers of their false and
+                    # true outcomes in a profiled run
+interned = {} # kinds and fields of the expressions made by the parser mapped
+              # to the expression
+repeated = set() # expressions the parser has shared between several places
+generated = {} # repeated expressions mapped to their code and the value of
+               # hoisted_version it was generated with, for the current
+               # symbol_table
+hoisted_version = 0 # changed whenever hoisted changes
+unroll_factor = 4 # how often the body of a loop with known trip count is
+                  # repeated per iteration, 1 disables unrolling
+switch_threshold = 3 # if-chains with this many cases become a switch
+output_buffer_size = 65536 # bytes of output buffered by the generated class
+input_buffer_size = 65536 # bytes of input read at once by the generated class
+method_size_limit = 32000 # bytes of code per method, which keeps all branch
+                          # offsets within the 16 bits of the JVM jumps and the
+                          # methods well below the JVM limit of 64 KB
+split_methods = [] # pairs of name and code of the methods split off from main
+split_sets = {} # names of split methods mapped to the sets of locations that
+                # they and the split methods they call use and assign
+refitting = False # whether Statements_AST.fitted generates a statement again
+batch_chunk_size = 1000 # programs of a batch selected by one dispatch method
+reports = False # whether optimisation reports are written to stderr
+code_workers = 1 # processes that generate the code of top-level statements
+forked = None # Statements_AST whose code the workers of parallel_code generate,
+              # with the first and bounds of Statement_Symbol_Table
+
+if __name__ == '__main__':
+    import argparse
+    import os
+
+    import instrumentation
+    arguments = argparse.ArgumentParser(
+        description='Compiles the program on stdin to Jasmin assembler.')
+    arguments.add_argument('--unroll', type=int, default=unroll_factor,
+                           metavar='N', help='unroll loops with a constant '
+                           'trip count N times (default %(default)s)')
+    arguments.add_argument('--report', action='store_true',
+                           help='report optimisations and their effect on '
+                           'code size to stderr')
+    arguments.add_argument('--batch', nargs='+', metavar='FILE',
+                           help='compile the programs in the files into one '
+                           'class instead')
+    arguments.add_argument('--branch-profile', metavar='FILE',
+                           help='lay out branches and order the operands of '
+                           'and and or by the outcomes of conditions in the '
+                           'branch profile FILE of profiler.py')
+    arguments.add_argument('--workers', type=int, default=code_workers,
+                           metavar='N', help='generate the code of the '
+                           'top-level statements in N processes (default '
+                           '%(default)s)')
+    arguments.add_argument('--profile', action='store_true',
+                           help='report time and memory per phase and counts '
+                           'of tokens, nodes, labels and symbols as JSON to '
+                           'stderr')
+    options = arguments.parse_args()
+    unroll_factor = options.unroll
+    reports = options.report
+    code_workers = options.workers
+
+    if options.batch:
+        programs = []
+        for file_name in options.batch:
+            with open(file_name) as input_file:
+                ast = parse(input_file, file_name)
+            programs.append((os.path.splitext(file_name)[0], ast))
+        print(batch_code(programs), end='')
+        sys.exit()
+
+    profile = instrumentation.Profile('compiler.py', options.profile)
+    source = sys.stdin.read()
+    if options.profile:
+        # The parser scans while it parses, so scanning is measured in a pass
+        # of its own.
+        with profile.phase('scan'):
+            profile.values['tokens'] = \
+                instrumentation.tokens(Scanner(io.StringIO(source)))
+    scanner = Scanner(io.StringIO(source))
+
+    # Uncomment the following to test the scanner without the parser.
+    # Show all tokens in the input.
+    #
+    # token = scanner.lookahead()
+    # while token != None:
+    #     if token in [Token.NUM, Token.ID]:
+    #         token, value = scanner.consume(token)
+    #         print(token, value)
+    #     else:
+    #         print(scanner.consume(token))
+    #     token = scanner.lookahead()
+    # sys.exit()
+
+    # Call the parser.
+
+    with profile.phase('parse'):
+        ast = program()
+    if scanner.lookahead() != None:
+        print('syntax error: end of input expected but token ' +
+              repr(scanner.lookahead()) + ' found')
+        sys.exit()
+    if options.branch_profile:
+        # A stale profile only costs the optimisations it would enable.
+        sites = load_branch_profile(options.branch_profile, ast)
+        if sites == None:
+            print('compiler.py: ' + options.branch_profile + ' cannot be ' +
+                  'used as branch profile, compiling without it',
+                  file=sys.stderr)
+        elif sites[1]:
+            print('compiler.py: ' + str(sites[1]) + ' of ' +
+                  str(sum(sites)) + ' sites in ' + options.branch_profile +
+                  ' do not match the program and are ignored',
+                  file=sys.stderr)
+
+    # Uncomment the following to test the parser without the code generator.
+    # Show the syntax tree with levels indicated by indentation.
+    #
+    # print(ast.indented(0), end='')
+    # sys.exit()
+
+    # Call the code generator.
+
+    # Translate the abstract syntax tree to JVM bytecode.
+    # It can be assembled to a class file by Jasmin: http://jasmin.sourceforge.net/
 
-# Uncomment the following to test the scanner without the parser.
-# Show all tokens in the input.
-#
-# token = scanner.lookahead()
-# while token != None:
-#     if token in [Token.NUM, Token.ID]:
-#         token, value = scanner.consume(token)
-#         print(token, value)
-#     else:
-#         print(scanner.consume(token))
-#     token = scanner.lookahead()
-# sys.exit()
-
-# Call the parser.
-
-ast = program()
-if scanner.lookahead() != None:
-    print('syntax error: end of input expected but token ' +
-          repr(scanner.lookahead()) + ' found')
-    sys.exit()
-
-# Uncomment the following to test the parser without the code generator.
-# Show the syntax tree with levels indicated by indentation.
-#
-# print(ast.indented(0), end='')
-# sys.exit()
-
-# Call the code generator.
-
-# Translate the abstract syntax tree to JVM bytecode.
-# It can be assembled to a class file by Jasmin: http://jasmin.sourceforge.net/
-
-print(ast.code(), end='')
+    with profile.phase('code'):
+        code = ast.code()
+    with profile.phase('output'):
+        print(code, end='')
+    if options.profile:
+        profile.values.update(input_bytes=len(source.encode()),
+                              nodes=instrumentation.nodes(ast),
+                              shared_nodes=len(repeated),
+                              labels=label_generator.current_label,
+                              symbols=symbol_table.size(),
+                              output_bytes=len(code.encode()))
+        profile.report()
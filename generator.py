@@ -0,0 +1,170 @@
+import random
+
+# Generates random programs of a controllable shape, for example to measure
+# how the time of the scanner, the parsers and the code generator grows with
+# the size of programs. The same seed and options give the same program:
+#     python3 generator.py --seed 1 --statements 1000 > program
+# or, with one of the shapes used by compile_benchmark.py,
+#     python3 generator.py --shape deep --size 1000 > program
+# Options:
+#     --seed N          seed of the random numbers
+#     --statements N    number of statements at the outermost level
+#     --depth N         nesting of if and while statements in each of them
+#     --expression N    operators in each arithmetic expression
+#     --identifiers N   number of different variables
+#     --booleans N      and and or operators in each condition, which only
+#                       compiler.py can parse
+#     --shape NAME      shape of the program instead: flat, deep, expression,
+#                       identifiers or boolean
+#     --size N          size of the program of the shape (default 1000)
+
+# Identifiers consist of letters only. Starting them with v keeps them apart
+# from the keywords.
+def identifier(number):
+    '''Returns the name of the variable with the given number.'''
+    name = 'v'
+    while True:
+        name += 'abcdefghijklmnopqrstuvwxyz'[number % 26]
+        number //= 26
+        if number == 0:
+            return name
+
+class Generator:
+    '''The interface comprises the constructor and the method program. An
+       expression with n operators is a balanced tree in parentheses, so
+       that even huge expressions do not nest deeply. The variables are
+       assigned before they are used, and loops count a variable of their
+       own down to zero, so the programs terminate.'''
+
+    def __init__(self, seed=0, statements=100, depth=2, expression=3,
+                 identifiers=10, booleans=0):
+        self.random = random.Random(seed)
+        self.statements = statements
+        self.depth = depth
+        self.expression_size = expression
+        self.booleans = booleans
+        self.variables = [identifier(i) for i in range(max(identifiers, 1))]
+        self.loops = 0
+
+    def variable(self):
+        return self.random.choice(self.variables)
+
+    def expression(self, operators):
+        if operators == 0:
+            if self.random.random() < 0.5:
+                return str(self.random.randint(0, 1000))
+            return self.variable()
+        left = self.random.randint(0, operators - 1)
+        return '(' + self.expression(left) + ' ' + \
+               self.random.choice('+-*/') + ' ' + \
+               self.expression(operators - 1 - left) + ')'
+
+    def comparison(self):
+        return self.expression(self.expression_size // 2) + ' ' + \
+               self.random.choice(['<', '=', '>', '<=', '!=', '>=']) + ' ' + \
+               self.expression(self.expression_size - \
+                               self.expression_size // 2)
+
+    def condition(self, operators):
+        if operators == 0:
+            if self.booleans and self.random.random() < 0.2:
+                return 'not ' + self.comparison()
+            return self.comparison()
+        left = self.random.randint(0, operators - 1)
+        return '(' + self.condition(left) + ' ' + \
+               self.random.choice(['and', 'or']) + ' ' + \
+               self.condition(operators - 1 - left) + ')'
+
+    def simple_statement(self):
+        choice = self.random.random()
+        if choice < 0.1:
+            return 'read ' + self.variable()
+        elif choice < 0.3:
+            return 'write ' + self.expression(self.expression_size)
+        return self.variable() + ' := ' + self.expression(self.expression_size)
+
+    def statement(self, depth):
+        '''Returns a statement with depth levels of if and while statements
+           nested in it.'''
+        if depth == 0:
+            return self.simple_statement()
+        body = self.simple_statement() + '; ' + self.statement(depth - 1)
+        choice = self.random.random()
+        if choice < 0.4:
+            return 'if ' + self.condition(self.booleans) + ' then ' + body + \
+                   ' end'
+        elif choice < 0.7:
+            return 'if ' + self.condition(self.booleans) + ' then ' + body + \
+                   ' else ' + self.simple_statement() + ' end'
+        # The counter is not one of the variables, which the body may
+        # assign.
+        counter = 'u' + identifier(self.loops)[1:]
+        self.loops += 1
+        return counter + ' := ' + str(self.random.randint(0, 3)) + \
+               '; while ' + counter + ' > 0 do ' + body + '; ' + counter + \
+               ' := ' + counter + ' - 1 end'
+
+    def program(self):
+        '''Returns the text of the program, one outermost statement per
+           line.'''
+        lines = [name + ' := ' + str(i) + ';'
+                 for i, name in enumerate(self.variables)]
+        lines += [self.statement(self.depth) + ';'
+                  for i in range(self.statements)]
+        lines.append('write ' + self.variables[0])
+        return '\n'.join(lines) + '\n'
+
+# The shapes map a size to the options of a program of the shape, so that the
+# number of tokens grows linearly with the size.
+shapes = {
+    'flat': lambda size: { 'statements':size, 'depth':0 },
+    'deep': lambda size: { 'statements':10, 'depth':max(size // 10, 1) },
+    'expression': lambda size: { 'statements':4, 'depth':0,
+                                 'expression':size },
+    'identifiers': lambda size: { 'statements':size, 'depth':0,
+                                  'identifiers':size },
+    'boolean': lambda size: { 'statements':max(size // 8, 1), 'depth':1,
+                              'booleans':8 },
+}
+
+def program(seed=0, **options):
+    '''Returns a program generated with the options of Generator.'''
+    return Generator(seed, **options).program()
+
+if __name__ == '__main__':
+    import argparse
+    arguments = argparse.ArgumentParser(
+        description='Prints a random program of the given shape.')
+    arguments.add_argument('--seed', type=int, default=0, metavar='N',
+                           help='seed of the random numbers (default '
+                           '%(default)s)')
+    arguments.add_argument('--statements', type=int, default=100, metavar='N',
+                           help='number of statements at the outermost level '
+                           '(default %(default)s)')
+    arguments.add_argument('--depth', type=int, default=2, metavar='N',
+                           help='nesting of if and while statements in each '
+                           'of them (default %(default)s)')
+    arguments.add_argument('--expression', type=int, default=3, metavar='N',
+                           help='operators in each arithmetic expression '
+                           '(default %(default)s)')
+    arguments.add_argument('--identifiers', type=int, default=10, metavar='N',
+                           help='number of different variables (default '
+                           '%(default)s)')
+    arguments.add_argument('--booleans', type=int, default=0, metavar='N',
+                           help='and and or operators in each condition '
+                           '(default %(default)s)')
+    arguments.add_argument('--shape', choices=sorted(shapes),
+                           help='shape of the program instead')
+    arguments.add_argument('--size', type=int, default=1000, metavar='N',
+                           help='size of the program of the shape (default '
+                           '%(default)s)')
+    options = arguments.parse_args()
+
+    if options.shape:
+        print(program(options.seed, **shapes[options.shape](options.size)),
+              end='')
+    else:
+        print(program(options.seed, statements=options.statements,
+                      depth=options.depth, expression=options.expression,
+                      identifiers=options.identifiers,
+                      booleans=options.booleans), end='')
@@ -0,0 +1,94 @@
+import contextlib
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+# Measurements for the --profile option of scanner.py, parser.py, compiler.py,
+# ply_scanner.py and ply_parser.py. Each phase of a run, such as scanning,
+# parsing or code generation, is measured in wall and CPU time and in the
+# peak of memory allocated by Python above the memory in use when the phase
+# starts. The measurements are written to stderr as one JSON object:
+#     { "tool": "compiler.py",
+#       "phases": [ { "name": "scan", "wall_s": 0.01, "cpu_s": 0.01,
+#                     "peak_bytes": 1234 }, ... ],
+#       "tokens": 1000, "tokens_per_second": 100000.0, ... }
+# Tracing the memory slows down Python code that allocates much, so times
+# measured with --profile are higher than without. If the environment variable
+# PROFILE_MEMORY is 0, memory is not traced and peak_bytes is null, which
+# keeps the times close to those of runs without --profile.
+
+trace_memory = os.environ.get('PROFILE_MEMORY') != '0'
+
+class Profile:
+    '''The interface comprises the constructor, the method phase, the
+       dictionary values of further measurements by name, and the method
+       report. If enabled is False, nothing is measured or reported.'''
+
+    def __init__(self, tool, enabled=True):
+        self.tool = tool
+        self.enabled = enabled
+        self.phases = []
+        self.values = {}
+        if enabled and trace_memory:
+            tracemalloc.start()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        '''Measures the code executed in the with statement as phase
+           name.'''
+        if not self.enabled:
+            yield
+            return
+        if trace_memory:
+            tracemalloc.reset_peak()
+            memory = tracemalloc.get_traced_memory()[0]
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.phases.append({
+                'name':name,
+                'wall_s':round(time.perf_counter() - wall, 6),
+                'cpu_s':round(time.process_time() - cpu, 6),
+                'peak_bytes':tracemalloc.get_traced_memory()[1] - memory
+                              if trace_memory else None })
+
+    def report(self, output_file=sys.stderr):
+        '''Writes the measurements as JSON to output_file.'''
+        if not self.enabled:
+            return
+        result = { 'tool':self.tool, 'phases':self.phases }
+        result.update(self.values)
+        scan = [phase['wall_s'] for phase in self.phases
+                if phase['name'] == 'scan']
+        if 'tokens' in self.values and scan:
+            result['tokens_per_second'] = round(self.values['tokens'] /
+                                                max(scan[0], 1e-9), 1)
+        print(json.dumps(result), file=output_file)
+
+def tokens(scanner):
+    '''Consumes all tokens of scanner, an instance of one of the Scanner
+       classes, and returns their number.'''
+    count = 0
+    while scanner.lookahead() != None:
+        scanner.consume(scanner.lookahead())
+        count += 1
+    return count
+
+def nodes(tree):
+    '''Returns a dictionary of the number of nodes of the abstract syntax
+       tree by class. Nodes are the objects whose class name ends in _AST,
+       including those in lists, in the attributes of nodes.'''
+    counts = {}
+    work = [tree]
+    while work:
+        node = work.pop()
+        if isinstance(node, (list, tuple)):
+            work.extend(node)
+        elif type(node).__name__.endswith('_AST'):
+            name = type(node).__name__
+            counts[name] = counts.get(name, 0) + 1
+            work.extend(vars(node).values())
+    return dict(sorted(counts.items()))
@@ -0,0 +1,210 @@
+import re
+import sys
+import time
+
+import compiler
+from compiler import Token
+
+# Executes the abstract syntax trees of compiler.py directly, with the 32-bit
+# integer semantics of the JVM: arithmetic wraps around and division rounds
+# towards zero. Run a program on the integers in stdin with
+#     python3 interpreter.py program < input
+# Options:
+#     --stats   report executed statements per second to stderr
+
+class Interpreter:
+    '''The interface comprises the constructor and the method run.
+       The tree is lowered once to nested tuples whose first element is one
+       of the node kinds below, with identifiers replaced by the locations
+       a Symbol_Table assigns to them. Execution then dispatches on the
+       kind instead of looking up attributes and methods of the nodes.'''
+
+    # The following enumerates all node kinds of the lowered tree.
+    NUM, VAR, ADD, SUB, MUL, DIV = range(6)
+    LESS, EQ, GRTR, LEQ, NEQ, GEQ, AND, OR, NOT = range(6, 15)
+    ASSIGN, WRITE, READ, IF, WHILE = range(15, 20)
+
+    operator = { '+':ADD, '-':SUB, '*':MUL, '/':DIV,
+                 '<':LESS, '=':EQ, '>':GRTR, '<=':LEQ, '!=':NEQ, '>=':GEQ,
+                 Token.AND:AND, Token.OR:OR, Token.NOT:NOT }
+
+    def __init__(self, tree):
+        '''tree is a Program_AST. Variables are numbered sequentially
+           starting with 0, in the order of their first occurrence.'''
+        self.symbol_table = compiler.Symbol_Table()
+        self.program = self.lower(tree.program)
+        # number of statements executed by the last run
+        self.executed = 0
+
+    def lower(self, tree):
+        '''Returns the lowered form of tree.'''
+        if isinstance(tree, compiler.Statements_AST):
+            return tuple(self.lower(st) for st in tree.statements)
+        elif isinstance(tree, compiler.Assign_AST):
+            loc = self.symbol_table.location(tree.identifier.identifier)
+            return (self.ASSIGN, loc, self.lower(tree.expression))
+        elif isinstance(tree, compiler.Write_AST):
+            return (self.WRITE, self.lower(tree.expression))
+        elif isinstance(tree, compiler.Read_AST):
+            loc = self.symbol_table.location(tree.identifier.identifier)
+            return (self.READ, loc)
+        elif isinstance(tree, compiler.If_AST):
+            return (self.IF, self.lower(tree.condition),
+                    self.lower(tree.then), ())
+        elif isinstance(tree, compiler.If_Else_AST):
+            return (self.IF, self.lower(tree.condition),
+                    self.lower(tree.then), self.lower(tree.again))
+        elif isinstance(tree, compiler.While_AST):
+            return (self.WHILE, self.lower(tree.condition),
+                    self.lower(tree.body))
+        elif isinstance(tree, compiler.Number_AST):
+            return (self.NUM, wrap(int(tree.number)))
+        elif isinstance(tree, compiler.Identifier_AST):
+            return (self.VAR, self.symbol_table.location(tree.identifier))
+        elif isinstance(tree, compiler.Boolean_AST) and tree.right == None:
+            return (self.NOT, self.lower(tree.left))
+        else: # Expression_AST, Comparison_AST or Boolean_AST with two operands
+            return (self.operator[tree.op],
+                    self.lower(tree.left), self.lower(tree.right))
+
+    def evaluators(self, slots):
+        '''Returns a pair of functions for the variables in the list slots:
+           value(e) evaluates the lowered expression e, test(c) the lowered
+           condition c.'''
+        NUM, VAR, ADD, SUB, MUL = self.NUM, self.VAR, self.ADD, self.SUB, self.MUL
+        LESS, EQ, GRTR, LEQ, NEQ, GEQ = self.LESS, self.EQ, self.GRTR, \
+                                       self.LEQ, self.NEQ, self.GEQ
+        AND, OR = self.AND, self.OR
+
+        def value(e):
+            kind = e[0]
+            if kind == VAR:
+                return slots[e[1]]
+            if kind == NUM:
+                return e[1]
+            a = value(e[1])
+            b = value(e[2])
+            if kind == ADD:
+                r = a + b
+            elif kind == SUB:
+                r = a - b
+            elif kind == MUL:
+                r = a * b
+            else:
+                r = abs(a) // abs(b)
+                if (a < 0) != (b < 0):
+                    r = -r
+            if -2147483648 <= r <= 2147483647:
+                return r
+            return wrap(r)
+
+        def test(c):
+            kind = c[0]
+            if kind == AND:
+                return test(c[1]) and test(c[2])
+            if kind == OR:
+                return test(c[1]) or test(c[2])
+            if kind > GEQ: # NOT
+                return not test(c[1])
+            a = value(c[1])
+            b = value(c[2])
+            if kind == LESS:
+                return a < b
+            if kind == EQ:
+                return a == b
+            if kind == GRTR:
+                return a > b
+            if kind == LEQ:
+                return a <= b
+            if kind == NEQ:
+                return a != b
+            return a >= b
+
+        return value, test
+
+    def run(self, inputs, output):
+        '''Executes the program. Read statements take their values from the
+           iterator inputs, write statements append their values to the list
+           output. Variables that are read before they are assigned hold 0.
+           Raises ZeroDivisionError on division by zero and EOFError if
+           inputs is exhausted.'''
+        slots = [0] * self.symbol_table.size()
+        value, test = self.evaluators(slots)
+        executed = 0
+        ASSIGN, WRITE, READ, IF = self.ASSIGN, self.WRITE, self.READ, self.IF
+        write = output.append
+
+        def execute(block):
+            nonlocal executed
+            executed += len(block)
+            for st in block:
+                kind = st[0]
+                if kind == ASSIGN:
+                    slots[st[1]] = value(st[2])
+                elif kind == IF:
+                    if test(st[1]):
+                        execute(st[2])
+                    else:
+                        execute(st[3])
+                elif kind == WRITE:
+                    write(value(st[1]))
+                elif kind == READ:
+                    for number in inputs:
+                        slots[st[1]] = number
+                        break
+                    else:
+                        raise EOFError('no input left for read')
+                else: # WHILE
+                    condition, body = st[1], st[2]
+                    while test(condition):
+                        execute(body)
+
+        try:
+            execute(self.program)
+        finally:
+            self.executed = executed
+
+def wrap(value):
+    '''Returns value reduced to the range of 32-bit two's complement
+       integers, as by the JVM.'''
+    return ((value + 2147483648) & 0xFFFFFFFF) - 2147483648
+
+def checked(number):
+    '''Returns number. Raises ValueError if it does not fit in 32 bits, where
+       the reader of the generated class throws an InputMismatchException.'''
+    if not -2147483648 <= number <= 2147483647:
+        raise ValueError('integer out of range: ' + str(number))
+    return number
+
+def integers(input_file):
+    '''Returns an iterator over the integers in input_file. Like the reader
+       of the generated class, it skips everything up to the next digit, or
+       minus sign followed by a digit. It raises ValueError when it comes to
+       an integer that does not fit in 32 bits.'''
+    for match in re.finditer(r'-?[0-9]+', input_file.read()):
+        yield checked(int(match.group()))
+
+if __name__ == '__main__':
+    import argparse
+    arguments = argparse.ArgumentParser(
+        description='Runs a program on the integers in stdin.')
+    arguments.add_argument('program', help='file with the program')
+    arguments.add_argument('--stats', action='store_true',
+                           help='report executed statements per second '
+                           'to stderr')
+    options = arguments.parse_args()
+
+    with open(options.program) as program_file:
+        interpreter = Interpreter(compiler.parse(program_file))
+    output = []
+    start = time.perf_counter()
+    try:
+        interpreter.run(integers(sys.stdin), output)
+    finally:
+        elapsed = time.perf_counter() - start
+        sys.stdout.write(''.join(str(number) + '\n' for number in output))
+        if options.stats:
+            print(str(interpreter.executed) + ' statements in ' +
+                  '%.3f' % elapsed + ' s, ' +
+                  '%.0f' % (interpreter.executed / max(elapsed, 1e-9)) +
+                  ' statements/s', file=sys.stderr)
@@ -0,0 +1,493 @@
+import re
+import sys
+
+import interpreter
+import python_backend
+
+# An assembler for the Jasmin code that compiler.py generates and an emulator
+# of the JVM for the instructions and library calls in it, so that generated
+# code can be run and measured without Java. Run a class on stdin with
+#     python3 compiler.py < program > Program.j
+#     python3 jvm.py Program.j [argument ...] < input
+# Options:
+#     --stats            report executed instructions by opcode and the
+#                        maximum stack depth to stderr
+#     --no-intrinsics    execute the runtime methods of the generated class
+#                        instead of modelling them
+
+class Java_Exception(Exception):
+    '''An exception thrown in the emulated code. class_name is the name of
+       its Java class.'''
+    def __init__(self, class_name, message=''):
+        Exception.__init__(self, class_name + (': ' + message if message
+                                               else ''))
+        self.class_name = class_name
+
+class Method:
+    '''A method of an assembled class. code is a list of instructions, each
+       a tuple of the opcode and its operands. Labels are replaced by the
+       index of the instruction they mark. catches is a list of tuples
+       (start, end, handler, class name). hits counts how often each
+       instruction has been executed.'''
+    def __init__(self, name, locals, stack, code, catches):
+        self.name = name
+        self.locals = locals
+        self.stack = stack
+        self.code = code
+        self.catches = catches
+        self.hits = [0] * len(code)
+
+def assemble(text):
+    '''Returns a pair of the class name and a dictionary that maps the name
+       and descriptor of each method of the Jasmin class in text, such as
+       'main([Ljava/lang/String;)V', to its Method.'''
+    class_name = None
+    methods = {}
+    lines = text.split('\n')
+    i = 0
+    while i < len(lines):
+        line = lines[i].strip()
+        i += 1
+        if line.startswith('.class'):
+            class_name = line.split()[-1]
+        elif line.startswith('.method'):
+            name = line.split()[-1]
+            locals, stack = 0, 0
+            code, labels, catches = [], {}, []
+            while not lines[i].strip().startswith('.end method'):
+                line = lines[i].strip()
+                i += 1
+                if not line or line.startswith(';'):
+                    continue
+                parts = line.split()
+                if line.endswith(':'):
+                    labels[line[:-1]] = len(code)
+                elif parts[0] == '.limit':
+                    if parts[1] == 'locals':
+                        locals = int(parts[2])
+                    else:
+                        stack = int(parts[2])
+                elif parts[0] == '.catch':
+                    catches.append((parts[3], parts[5], parts[7], parts[1]))
+                elif parts[0] in ['tableswitch', 'lookupswitch']:
+                    table = []
+                    while lines[i].startswith(' ') and lines[i].strip() and \
+                          not lines[i].strip().startswith('.'):
+                        table.append(lines[i].split())
+                        i += 1
+                    default = table.pop()[-1]
+                    if parts[0] == 'tableswitch':
+                        targets = [entry[0] for entry in table]
+                        code.append((parts[0], int(parts[1]), targets, default))
+                    else:
+                        targets = dict((int(entry[0]), entry[2])
+                                       for entry in table)
+                        code.append((parts[0], targets, default))
+                else:
+                    code.append(instruction(line))
+            i += 1
+            resolve = lambda label: labels[label]
+            for number, ins in enumerate(code):
+                op = ins[0]
+                if op == 'goto' or op.startswith('if'):
+                    code[number] = (op, resolve(ins[1]))
+                elif op == 'tableswitch':
+                    code[number] = (op, ins[1], [resolve(l) for l in ins[2]],
+                                    resolve(ins[3]))
+                elif op == 'lookupswitch':
+                    code[number] = (op, dict((k, resolve(l))
+                                             for k, l in ins[1].items()),
+                                    resolve(ins[2]))
+            catches = [(resolve(start), resolve(end), resolve(handler), kind)
+                       for start, end, handler, kind in catches]
+            methods[name] = Method(name, locals, stack, code, catches)
+    return class_name, methods
+
+def instruction(line):
+    '''Returns the tuple of opcode and operands for a line of Jasmin code.
+       Numbers are converted to int, member references use / throughout and
+       string constants lose their quotes.'''
+    op, _, rest = line.partition(' ')
+    if op == 'ldc' and rest.startswith('"'):
+        return (op, re.sub(r'\\(.)', r'\1', rest[1:-1]))
+    operands = []
+    for operand in rest.split():
+        if re.fullmatch(r'-?[0-9]+', operand):
+            operands.append(int(operand))
+        else:
+            operands.append(operand.replace('.', '/'))
+    return tuple([op] + operands)
+
+def argument_count(descriptor):
+    '''Returns the number of arguments in a method descriptor.'''
+    parameters = descriptor[descriptor.index('(') + 1:descriptor.index(')')]
+    return len(re.findall(r'\[*(L[^;]*;|[IZBCSJFD])', parameters))
+
+class Input_Stream:
+    '''An InputStream over the bytes data.'''
+    def __init__(self, data):
+        self.data = data
+        self.position = 0
+    def read(self, count):
+        result = self.data[self.position:self.position + count]
+        self.position += len(result)
+        return result
+
+class Print_Stream:
+    '''A PrintStream that writes to the binary file output.'''
+    def __init__(self, output):
+        self.output = output
+    def write(self, data):
+        self.output.write(data)
+
+class Machine:
+    '''The interface comprises the constructor, the method run and the
+       statistics counts(), executed() and max_stack.'''
+
+    # runtime methods of the generated class that are modelled unless
+    # intrinsics is False
+    runtime = ['write(I)V', 'flush()V', 'read()I']
+
+    def __init__(self, text, intrinsics=True):
+        self.class_name, self.methods = assemble(text)
+        self.intrinsics = intrinsics
+        # the largest operand stack of any method invocation so far
+        self.max_stack = 0
+
+    def counts(self):
+        '''Returns a dictionary of the number of executed instructions by
+           opcode.'''
+        result = {}
+        for method in self.methods.values():
+            for ins, hits in zip(method.code, method.hits):
+                if hits:
+                    result[ins[0]] = result.get(ins[0], 0) + hits
+        return result
+
+    def executed(self):
+        '''Returns the number of executed instructions.'''
+        return sum(sum(method.hits) for method in self.methods.values())
+
+    def run(self, input_data, output, arguments=()):
+        '''Runs main with the strings arguments. System.in reads the bytes
+           input_data and System.out writes to the binary file output.
+           Exceptions that main throws are raised as Java_Exception.'''
+        self.fields = {}
+        self.system_in = Input_Stream(input_data)
+        self.system_out = Print_Stream(output)
+        self.call(self.methods['main([Ljava/lang/String;)V'],
+                  [list(arguments)])
+
+    def call(self, method, args):
+        '''Executes method with the list of arguments args and returns its
+           result, or None for a void method.'''
+        code = method.code
+        hits = method.hits
+        locals = args + [None] * (method.locals - len(args))
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        pc = 0
+        while True:
+            ins = code[pc]
+            op = ins[0]
+            hits[pc] += 1
+            pc += 1
+            try:
+                if op == 'iload':
+                    value = locals[ins[1]]
+                    if value == None:
+                        raise Java_Exception('java/lang/VerifyError',
+                                             'local ' + str(ins[1]) +
+                                             ' read before assignment')
+                    push(value)
+                elif op == 'istore':
+                    locals[ins[1]] = pop()
+                elif op == 'sipush' or op == 'bipush':
+                    push(ins[1])
+                elif op.startswith('if_icmp'):
+                    b = pop()
+                    a = pop()
+                    if compare[op[7:]](a, b):
+                        pc = ins[1]
+                elif op in arithmetic:
+                    b = pop()
+                    a = pop()
+                    if op in ['idiv', 'irem'] and b == 0:
+                        raise Java_Exception('java/lang/ArithmeticException',
+                                             '/ by zero')
+                    push(interpreter.wrap(arithmetic[op](a, b)))
+                elif op == 'goto':
+                    pc = ins[1]
+                elif op == 'iinc':
+                    locals[ins[1]] = interpreter.wrap(locals[ins[1]] + ins[2])
+                elif op.startswith('iconst_'):
+                    push(-1 if op == 'iconst_m1' else int(op[7:]))
+                elif op == 'ldc':
+                    push(ins[1])
+                elif op in ['ifeq', 'ifne', 'iflt', 'ifgt', 'ifle', 'ifge']:
+                    if compare[op[2:]](pop(), 0):
+                        pc = ins[1]
+                elif op == 'if_acmpeq' or op == 'if_acmpne':
+                    b = pop()
+                    a = pop()
+                    if (a is b) == (op == 'if_acmpeq'):
+                        pc = ins[1]
+                elif op == 'dup':
+                    push(stack[-1])
+                elif op == 'pop':
+                    pop()
+                elif op == 'pop2':
+                    pop()
+                    pop()
+                elif op == 'ineg':
+                    push(interpreter.wrap(-pop()))
+                elif op == 'tableswitch':
+                    value = pop()
+                    if ins[1] <= value < ins[1] + len(ins[2]):
+                        pc = ins[2][value - ins[1]]
+                    else:
+                        pc = ins[3]
+                elif op == 'lookupswitch':
+                    pc = ins[1].get(pop(), ins[2])
+                elif op == 'aload' or op == 'aload_0':
+                    push(locals[0 if op == 'aload_0' else ins[1]])
+                elif op == 'astore':
+                    locals[ins[1]] = pop()
+                elif op == 'getstatic':
+                    push(self.get_static(ins[1], ins[2]))
+                elif op == 'putstatic':
+                    self.fields[ins[1]] = pop()
+                elif op == 'newarray':
+                    size = pop()
+                    push(bytearray(size) if ins[1] == 'byte' else [0] * size)
+                elif op == 'arraylength':
+                    push(len(pop()))
+                elif op == 'baload':
+                    index = pop()
+                    value = pop()[index]
+                    push(value - 256 if value > 127 else value)
+                elif op == 'bastore':
+                    value = pop()
+                    index = pop()
+                    pop()[index] = value & 0xFF
+                elif op == 'aaload' or op == 'iaload':
+                    index = pop()
+                    push(pop()[index])
+                elif op == 'iastore':
+                    value = pop()
+                    index = pop()
+                    pop()[index] = value
+                elif op in ['invokestatic', 'invokevirtual', 'invokespecial',
+                            'invokenonvirtual']:
+                    count = argument_count(ins[1])
+                    if op != 'invokestatic':
+                        count += 1 # the object
+                    args = stack[len(stack) - count:]
+                    del stack[len(stack) - count:]
+                    result = self.invoke(ins[1], args)
+                    if not ins[1].endswith('V'):
+                        push(result)
+                elif op == 'new':
+                    push(New(ins[1]))
+                elif op == 'athrow':
+                    thrown = pop()
+                    raise getattr(thrown, 'exception', thrown)
+                elif op == 'ireturn':
+                    return pop()
+                elif op == 'return':
+                    return None
+                else:
+                    raise Java_Exception('java/lang/VerifyError',
+                                         'unsupported instruction ' + op)
+                if len(stack) > self.max_stack:
+                    self.max_stack = len(stack)
+            except Java_Exception as exception:
+                for start, end, handler, kind in method.catches:
+                    if start <= pc - 1 < end and \
+                       kind in [exception.class_name, 'java/lang/Throwable',
+                                'all']:
+                        del stack[:]
+                        push(exception)
+                        pc = handler
+                        break
+                else:
+                    raise
+
+    def get_static(self, field, descriptor):
+        if field == 'java/lang/System/in':
+            return self.system_in
+        elif field == 'java/lang/System/out':
+            return self.system_out
+        return self.fields.get(field, 0 if descriptor == 'I' else None)
+
+    def invoke(self, reference, args):
+        '''Executes the method named by reference, such as
+           'java/io/PrintStream/println(Ljava/lang/String;)V', with the
+           arguments args, the object first for instance methods.'''
+        owner = reference[:reference.rindex('/', 0, reference.index('('))]
+        signature = reference[len(owner) + 1:]
+        if owner == self.class_name:
+            if self.intrinsics and signature in self.runtime:
+                return self.runtime_method(signature, args)
+            return self.call(self.methods[signature], args)
+        if reference in library:
+            return library[reference](self, *args)
+        raise Java_Exception('java/lang/NoSuchMethodError', reference)
+
+    def runtime_method(self, signature, args):
+        '''Models the runtime methods of the generated class. write outputs
+           its argument at once, so there is nothing for flush to do.'''
+        if signature == 'write(I)V':
+            self.get_static('java/lang/System/out', None).write(
+                (str(args[0]) + '\n').encode())
+        elif signature == 'read()I':
+            return self.next_int(self.get_static('java/lang/System/in', None))
+
+    def next_int(self, stream):
+        '''Returns the next integer of stream as the reader of the generated
+           class does: everything up to the next digit, or minus sign
+           followed by a digit, is skipped, and integers that do not fit in
+           32 bits are rejected.'''
+        match = re.compile(rb'-?[0-9]+').search(stream.data, stream.position)
+        if match == None:
+            stream.position = len(stream.data)
+            raise Java_Exception('java/util/NoSuchElementException')
+        stream.position = match.end()
+        value = int(match.group())
+        if interpreter.wrap(value) != value:
+            raise Java_Exception('java/util/InputMismatchException')
+        return value
+
+class New:
+    '''An object created by new before its constructor has run.'''
+    def __init__(self, class_name):
+        self.class_name = class_name
+
+def construct(obj, value):
+    '''Makes the object obj, created by new, behave like value.'''
+    obj.__class__ = value.__class__
+    obj.__dict__ = value.__dict__
+
+def report(machine, exception):
+    print('Exception in thread "main" ' + str(exception), file=sys.stderr)
+
+def opened(name, mode):
+    try:
+        return open(name, mode)
+    except OSError as error:
+        raise Java_Exception('java/io/FileNotFoundException', str(error))
+
+def file_input(machine, obj, name):
+    with opened(name, 'rb') as input_file:
+        construct(obj, Input_Stream(input_file.read()))
+
+def exception(machine, obj, *message):
+    # The layout of exceptions differs from that of other objects, so the
+    # object created by new holds the exception that athrow raises.
+    obj.exception = Java_Exception(obj.class_name)
+
+def scanner(machine, obj, stream):
+    construct(obj, Input_Stream(stream.data[stream.position:]))
+    stream.position = len(stream.data)
+
+def read_into(stream, data):
+    chunk = stream.read(len(data))
+    data[:len(chunk)] = chunk
+    return len(chunk) if chunk else -1
+
+def set_in(machine, stream):
+    machine.system_in = stream
+
+def set_out(machine, stream):
+    machine.system_out = stream
+
+def close(machine, stream):
+    if isinstance(stream, Print_Stream) and stream.output != None:
+        stream.output.close()
+
+# Library methods that the generated code calls, mapped to functions of the
+# machine and the arguments.
+library = {
+    'java/lang/Object/<init>()V': lambda machine, obj: None,
+    'java/lang/String/valueOf(I)Ljava/lang/String;':
+        lambda machine, value: str(value),
+    'java/io/PrintStream/println(Ljava/lang/String;)V':
+        lambda machine, stream, text: stream.write((text + '\n').encode()),
+    'java/io/PrintStream/write([BII)V':
+        lambda machine, stream, data, offset, length:
+            stream.write(bytes(data[offset:offset + length])),
+    'java/io/PrintStream/flush()V': lambda machine, stream: None,
+    'java/io/PrintStream/close()V': close,
+    'java/io/PrintStream/<init>(Ljava/io/OutputStream;)V':
+        lambda machine, obj, stream: construct(obj, stream),
+    'java/io/FileOutputStream/<init>(Ljava/lang/String;)V':
+        lambda machine, obj, name: construct(obj, Print_Stream(
+            opened(name, 'wb'))),
+    'java/io/FileInputStream/<init>(Ljava/lang/String;)V': file_input,
+    'java/io/InputStream/read([B)I':
+        lambda machine, stream, data: read_into(stream, data),
+    'java/io/InputStream/close()V': lambda machine, stream: None,
+    'java/util/Scanner/<init>(Ljava/io/InputStream;)V': scanner,
+    'java/util/Scanner/nextInt()I':
+        lambda machine, stream: machine.next_int(stream),
+    'java/util/NoSuchElementException/<init>()V': exception,
+    'java/util/InputMismatchException/<init>()V': exception,
+    'java/lang/System/arraycopy(Ljava/lang/Object;ILjava/lang/Object;II)V':
+        lambda machine, source, start, target, position, length:
+            target.__setitem__(slice(position, position + length),
+                               source[start:start + length]),
+    'java/lang/System/setIn(Ljava/io/InputStream;)V': set_in,
+    'java/lang/System/setOut(Ljava/io/PrintStream;)V': set_out,
+    'java/lang/Integer/parseInt(Ljava/lang/String;)I':
+        lambda machine, text: int(text),
+    'java/lang/String/concat(Ljava/lang/String;)Ljava/lang/String;':
+        lambda machine, text, other: text + other,
+    'java/lang/Throwable/printStackTrace()V': report,
+}
+
+compare = { 'eq':lambda a, b: a == b, 'ne':lambda a, b: a != b,
+            'lt':lambda a, b: a < b, 'gt':lambda a, b: a > b,
+            'le':lambda a, b: a <= b, 'ge':lambda a, b: a >= b }
+
+arithmetic = {
+    'iadd':lambda a, b: a + b, 'isub':lambda a, b: a - b,
+    'imul':lambda a, b: a * b, 'idiv':python_backend.div,
+    'irem':lambda a, b: a - python_backend.div(a, b) * b,
+    'ishl':lambda a, b: a << (b & 31), 'ishr':lambda a, b: a >> (b & 31),
+    'iushr':lambda a, b: (a & 0xFFFFFFFF) >> (b & 31),
+}
+
+if __name__ == '__main__':
+    import argparse
+    arguments = argparse.ArgumentParser(
+        description='Runs a Jasmin class generated by compiler.py on stdin.')
+    arguments.add_argument('jasmin', help='file with the Jasmin class')
+    arguments.add_argument('arguments', nargs='*',
+                           help='arguments of the main method')
+    arguments.add_argument('--stats', action='store_true',
+                           help='report executed instructions by opcode and '
+                           'the maximum stack depth to stderr')
+    arguments.add_argument('--no-intrinsics', action='store_true',
+                           help='execute the runtime methods of the generated '
+                           'class instead of modelling them')
+    options = arguments.parse_args()
+
+    with open(options.jasmin) as jasmin_file:
+        machine = Machine(jasmin_file.read(), not options.no_intrinsics)
+    try:
+        machine.run(sys.stdin.buffer.read(), sys.stdout.buffer,
+                    options.arguments)
+    except Java_Exception as exception:
+        sys.stdout.flush()
+        report(machine, exception)
+        sys.exit(1)
+    finally:
+        if options.stats:
+            sys.stdout.flush()
+            counts = machine.counts()
+            for op in sorted(counts, key=lambda op: -counts[op]):
+                print('%-16s %d' % (op, counts[op]), file=sys.stderr)
+            print('%-16s %d' % ('total', machine.executed()), file=sys.stderr)
+            print('%-16s %d' % ('max stack', machine.max_stack),
+                  file=sys.stderr)
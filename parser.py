@@ -1,6 +1,10 @@
+import argparse
+import io
 import re
 import sys
 
+import instrumentation
+
 class Scanner:
     '''The interface comprises the methods lookahead and consume.
        Other methods should not be called from outside of this class.'''
@@ -389,9 +393,24 @@ def identifier():
     value = scanner.consume(Token.ID)[1]
     return Identifier_AST(value)
 
+arguments = argparse.ArgumentParser(
+    description='Shows the abstract syntax tree of the program on stdin.')
+arguments.add_argument('--profile', action='store_true',
+                       help='report time and memory per phase and counts of '
+                       'tokens and nodes as JSON to stderr')
+options = arguments.parse_args()
+profile = instrumentation.Profile('parser.py', options.profile)
+source = sys.stdin.read()
+if options.profile:
+    # The parser scans while it parses, so scanning is measured in a pass of
+    # its own.
+    with profile.phase('scan'):
+        profile.values['tokens'] = \
+            instrumentation.tokens(Scanner(io.StringIO(source)))
+
 # Initialise scanner.
 
-scanner = Scanner(sys.stdin)
+scanner = Scanner(io.StringIO(source))
 
 # Uncomment the following to test the scanner without the parser.
 # Show all tokens in the input.
@@ -408,7 +427,8 @@ scanner = Scanner(sys.stdin)
 
 # Call the parser.
 
-ast = program()
+with profile.phase('parse'):
+    ast = program()
 if scanner.lookahead() != None:
     print('syntax error: end of input expected but token ' +
           repr(scanner.lookahead()) + ' found')
@@ -416,4 +436,8 @@ if scanner.lookahead() != None:
 
 # Show the syntax tree with levels indicated by indentation.
 
-print(ast.indented(0), end='')
+with profile.phase('output'):
+    print(ast.indented(0), end='')
+if options.profile:
+    profile.values['nodes'] = instrumentation.nodes(ast)
+profile.report()
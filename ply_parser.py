@@ -9,10 +9,13 @@ package can be installed with the following command:
     pip3 install ply
 This requires Internet access to download the package.
 """
+import argparse
 import ply.lex as lex
 import ply.yacc as yacc
 import sys
 
+import instrumentation
+
 """
 PLY's scanner works by matching regular expressions to the tokens.
 Regular expressions were used in the superquiz, but if anyone needs
@@ -368,11 +371,31 @@ def p_error(p):
     sys.exit()
 
 
-scanner = lex.lex()
+arguments = argparse.ArgumentParser(
+    description='Shows the abstract syntax tree of the program on stdin.')
+arguments.add_argument('--profile', action='store_true',
+                       help='report time and memory per phase and counts of '
+                       'tokens and nodes as JSON to stderr')
+options = arguments.parse_args()
+profile = instrumentation.Profile('ply_parser.py', options.profile)
+
+# Build the scanner and the parser from the rules above.
+
+with profile.phase('tables'):
+    scanner = lex.lex()
+    parser = yacc.yacc()
+source = sys.stdin.read()
+if options.profile:
+    # The parser scans while it parses, so scanning is measured in a pass of
+    # its own.
+    with profile.phase('scan'):
+        lexer = scanner.clone()
+        lexer.input(source)
+        profile.values['tokens'] = sum(1 for token in lexer)
 
 # Uncomment the following to test the scanner without the parser.
 # Show all tokens in the input.
-# scanner.input(sys.stdin.read())
+# scanner.input(source)
 
 # for token in scanner:
 #     if token.type in ['NUM', 'ID']:
@@ -383,9 +406,13 @@ scanner = lex.lex()
 
 # Call the parser.
 
-parser = yacc.yacc()
-ast = parser.parse(sys.stdin.read(), lexer=scanner)
+with profile.phase('parse'):
+    ast = parser.parse(source, lexer=scanner)
 
 # Show the syntax tree with levels indicated by indentation.
 
-print(ast.indented(0), end='')
+with profile.phase('output'):
+    print(ast.indented(0), end='')
+if options.profile:
+    profile.values['nodes'] = instrumentation.nodes(ast)
+profile.report()
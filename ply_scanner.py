@@ -10,9 +10,12 @@ package can be installed with the following command:
 This requires Internet access to download the package.
 """
 
+import argparse
 import ply.lex as lex
 import sys
 
+import instrumentation
+
 """
 PLY's scanner works by matching regular expressions to the tokens.
 Regular expressions were used in the superquiz, but if anyone needs
@@ -111,13 +114,31 @@ def t_error(t):
     print("lexical error: illegal character '{}'".format(t.value[0]))
     t.lexer.skip(1)
 
-# Show all tokens in the input.
-
-scanner = lex.lex()
-scanner.input(sys.stdin.read())
-
-for token in scanner:
-    if token.type in ['NUM', 'ID']:
-        print(token.type, token.value)
-    else:
-        print(token.type)
+arguments = argparse.ArgumentParser(
+    description='Shows the tokens of the program on stdin.')
+arguments.add_argument('--profile', action='store_true',
+                       help='report time and memory per phase and counts of '
+                       'tokens as JSON to stderr')
+options = arguments.parse_args()
+profile = instrumentation.Profile('ply_scanner.py', options.profile)
+
+# Build the scanner from the rules above.
+
+with profile.phase('tables'):
+    scanner = lex.lex()
+
+# Show all tokens in the input. They are shown as they are scanned, so the
+# time of the scan includes that of the output.
+
+source = sys.stdin.read()
+with profile.phase('scan'):
+    scanner.input(source)
+    count = 0
+    for token in scanner:
+        if token.type in ['NUM', 'ID']:
+            print(token.type, token.value)
+        else:
+            print(token.type)
+        count += 1
+profile.values['tokens'] = count
+profile.report()
@@ -0,0 +1,241 @@
+import json
+import os
+import sys
+import time
+
+import compiler
+import interpreter
+
+# Runs a program in the interpreter of interpreter.py and records how often
+# each statement is executed and how long it takes, to find the hot loops of
+# a program. Run a program on the integers in stdin with
+#     python3 profiler.py program < input
+# The output of the program goes to stdout and an annotated listing of the
+# program to stderr, which shows for each line the execution count and the
+# time of the statements that start on it.
+# Options:
+#     --listing FILE   write the annotated listing to FILE instead
+#     --folded FILE    write the time of each statement as folded stacks to
+#                      FILE, the input of flame graph tools such as
+#                      flamegraph.pl: one line per statement with the
+#                      statements enclosing it and its time in microseconds
+#     --branches FILE  write the numbers of false and true outcomes of each
+#                      condition to FILE, a branch profile for the option
+#                      --branch-profile of compiler.py
+
+class Profiler(interpreter.Interpreter):
+    '''The interface comprises the constructor, the method run, the list
+       statements of the statement nodes in the order of their first
+       occurrence and the lists counts, times and self_times that run sets,
+       indexed like statements: the number of executions of each statement,
+       the seconds spent in it and the seconds spent in it but not in the
+       statements nested in it. The times include the time to measure the
+       nested statements. Likewise, the list conditions holds the
+       comparisons and the nodes of and, or and not, and outcomes the
+       numbers of their false and true outcomes.'''
+
+    def __init__(self, tree):
+        '''tree is a Program_AST.'''
+        self.statements = []
+        self.parents = [] # number of the enclosing statement, or None
+        self.enclosing = []
+        self.conditions = []
+        interpreter.Interpreter.__init__(self, tree)
+        self.counts = [0] * len(self.statements)
+        self.times = [0.0] * len(self.statements)
+        self.self_times = [0.0] * len(self.statements)
+        self.outcomes = [[0, 0] for condition in self.conditions]
+
+    def lower(self, tree):
+        '''Returns the lowered form of tree. Statements and conditions carry
+           their number as last element.'''
+        if isinstance(tree, (compiler.Comparison_AST, compiler.Boolean_AST)):
+            number = len(self.conditions)
+            self.conditions.append(tree)
+            return interpreter.Interpreter.lower(self, tree) + (number,)
+        if isinstance(tree, (compiler.Assign_AST, compiler.Write_AST,
+                             compiler.Read_AST, compiler.If_AST,
+                             compiler.If_Else_AST, compiler.While_AST)):
+            number = len(self.statements)
+            self.statements.append(tree)
+            self.parents.append(self.enclosing[-1] if self.enclosing
+                                else None)
+            self.enclosing.append(number)
+            lowered = interpreter.Interpreter.lower(self, tree)
+            self.enclosing.pop()
+            return lowered + (number,)
+        return interpreter.Interpreter.lower(self, tree)
+
+    def evaluators(self, slots):
+        '''Returns the functions of Interpreter.evaluators, with a test that
+           counts the outcomes of each condition.'''
+        value, compare = interpreter.Interpreter.evaluators(self, slots)
+        AND, OR, NOT = self.AND, self.OR, self.NOT
+        outcomes = self.outcomes
+
+        def test(c):
+            kind = c[0]
+            if kind == AND:
+                result = test(c[1]) and test(c[2])
+            elif kind == OR:
+                result = test(c[1]) or test(c[2])
+            elif kind == NOT:
+                result = not test(c[1])
+            else:
+                result = compare(c)
+            outcomes[c[-1]][result] += 1
+            return result
+
+        return value, test
+
+    def run(self, inputs, output):
+        '''Executes the program like Interpreter.run and measures each
+           statement.'''
+        slots = [0] * self.symbol_table.size()
+        value, test = self.evaluators(slots)
+        ASSIGN, WRITE, READ, IF = self.ASSIGN, self.WRITE, self.READ, self.IF
+        write = output.append
+        counts, times = self.counts, self.times
+        clock = time.perf_counter
+
+        def execute(block):
+            for st in block:
+                start = clock()
+                kind = st[0]
+                if kind == ASSIGN:
+                    slots[st[1]] = value(st[2])
+                elif kind == IF:
+                    if test(st[1]):
+                        execute(st[2])
+                    else:
+                        execute(st[3])
+                elif kind == WRITE:
+                    write(value(st[1]))
+                elif kind == READ:
+                    for number in inputs:
+                        slots[st[1]] = number
+                        break
+                    else:
+                        raise EOFError('no input left for read')
+                else: # WHILE
+                    condition, body = st[1], st[2]
+                    while test(condition):
+                        execute(body)
+                times[st[-1]] += clock() - start
+                counts[st[-1]] += 1
+
+        try:
+            execute(self.program)
+        finally:
+            self.self_times = times[:]
+            for number, parent in enumerate(self.parents):
+                if parent != None:
+                    self.self_times[parent] -= times[number]
+
+    def frame(self, number):
+        '''Returns the name of statement number in listings and stacks: its
+           kind, the variable it assigns, if any, and its position.'''
+        tree = self.statements[number]
+        if isinstance(tree, compiler.Assign_AST):
+            name = 'assign ' + tree.identifier.identifier
+        elif isinstance(tree, compiler.Read_AST):
+            name = 'read ' + tree.identifier.identifier
+        elif isinstance(tree, compiler.Write_AST):
+            name = 'write'
+        elif isinstance(tree, compiler.While_AST):
+            name = 'while'
+        else:
+            name = 'if'
+        line, column = compiler.positions.get(tree, (0, 0))
+        return name + ' ' + str(line) + ':' + str(column)
+
+    def listing(self, source):
+        '''Returns the program text source with the execution count, the time
+           in milliseconds and the share of the total time of the statements
+           that start on each line in front of it. The count is the largest
+           of these statements, the times are added up.'''
+        lines = {} # line: [count, seconds]
+        for number, tree in enumerate(self.statements):
+            line = compiler.positions.get(tree, (0, 0))[0]
+            entry = lines.setdefault(line, [0, 0.0])
+            entry[0] = max(entry[0], self.counts[number])
+            entry[1] += self.self_times[number]
+        total = max(sum(self.self_times), 1e-9)
+        result = '%10s %10s %6s %5s\n' % ('count', 'ms', '%', 'line')
+        for line, text in enumerate(source.splitlines(), 1):
+            if line in lines:
+                count, seconds = lines[line]
+                result += '%10d %10.3f %6.1f ' % (count, seconds * 1000,
+                                                  seconds / total * 100)
+            else:
+                result += ' ' * 29
+            result += '%5d  %s\n' % (line, text)
+        return result
+
+    def folded(self, root):
+        '''Returns the self time of each executed statement in microseconds
+           as folded stacks: lines of the frames from root to the statement,
+           separated by semicolons, followed by the time.'''
+        result = ''
+        for number in range(len(self.statements)):
+            microseconds = round(self.self_times[number] * 1000000)
+            if microseconds <= 0:
+                continue
+            stack = []
+            parent = number
+            while parent != None:
+                stack.append(self.frame(parent))
+                parent = self.parents[parent]
+            result += ';'.join([root] + stack[::-1]) + ' ' + \
+                      str(microseconds) + '\n'
+        return result
+
+    def branches(self):
+        '''Returns the branch profile of the last run, as described by
+           compiler.load_branch_profile.'''
+        sites = {}
+        for condition, outcomes in zip(self.conditions, self.outcomes):
+            if condition in compiler.positions:
+                sites[compiler.site(condition)] = {
+                    'condition':repr(condition), 'outcomes':outcomes }
+        return { 'format':1, 'sites':sites }
+
+if __name__ == '__main__':
+    import argparse
+    arguments = argparse.ArgumentParser(
+        description='Runs a program on the integers in stdin and reports the '
+        'execution count and time of each statement.')
+    arguments.add_argument('program', help='file with the program')
+    arguments.add_argument('--listing', metavar='FILE',
+                           help='write the annotated listing to FILE instead '
+                           'of stderr')
+    arguments.add_argument('--folded', metavar='FILE',
+                           help='write the time of each statement as folded '
+                           'stacks to FILE')
+    arguments.add_argument('--branches', metavar='FILE',
+                           help='write the outcomes of each condition to '
+                           'FILE, a branch profile for compiler.py')
+    options = arguments.parse_args()
+
+    with open(options.program) as program_file:
+        source = program_file.read()
+    with open(options.program) as program_file:
+        profiler = Profiler(compiler.parse(program_file, options.program))
+    output = []
+    try:
+        profiler.run(interpreter.integers(sys.stdin), output)
+    finally:
+        sys.stdout.write(''.join(str(number) + '\n' for number in output))
+        if options.listing:
+            with open(options.listing, 'w') as listing_file:
+                listing_file.write(profiler.listing(source))
+        else:
+            sys.stderr.write(profiler.listing(source))
+        if options.folded:
+            with open(options.folded, 'w') as folded_file:
+                folded_file.write(profiler.folded(
+                    os.path.basename(options.program)))
+        if options.branches:
+            with open(options.branches, 'w') as branches_file:
+                json.dump(profiler.branches(), branches_file, indent=1)
+                branches_file.write('\n')
@@ -0,0 +1,193 @@
+import hashlib
+import io
+import marshal
+import os
+import sys
+import time
+
+import compiler
+import interpreter
+from compiler import Token
+
+# Translates the abstract syntax trees of compiler.py to a Python function
+# and runs it, with the 32-bit integer semantics of the JVM. Run a program on
+# the integers in stdin with
+#     python3 python_backend.py program < input
+# Options:
+#     --source      print the generated Python source instead
+#     --cache DIR   directory of the code object cache
+#     --no-cache    compile without the cache
+#     --stats       report compile and run time to stderr
+
+# The program becomes the function program(read, write, div). Its variables
+# are local variables of the function, so CPython accesses them by index, and
+# while statements become while statements.
+# Addition, subtraction and multiplication modulo 2**32 do not depend on
+# whether their operands are reduced first. Values are therefore only reduced
+# to 32 bits where it matters: when they are assigned or written, compared,
+# or divided.
+
+def translate(tree):
+    '''Returns the Python source of the function program(read, write, div)
+       that executes the Program_AST tree. read() returns the next input,
+       write(value) outputs value and div(a, b) divides rounding towards
+       zero. Identifiers are prefixed with v_ so that they cannot clash with
+       Python keywords or the parameters.'''
+    names = []
+    for node in compiler.walk(tree):
+        if isinstance(node, compiler.Identifier_AST) and \
+           'v_' + node.identifier not in names:
+            names.append('v_' + node.identifier)
+    result = 'def program(read, write, div):\n'
+    if names:
+        result += compiler.indent(' = '.join(names) + ' = 0', 1)
+    return result + statements(tree.program, 1)
+
+def statements(tree, level):
+    '''Returns the Python source of Statements_AST tree, indented by level.'''
+    result = ''
+    for st in tree.statements:
+        if isinstance(st, compiler.Assign_AST):
+            result += compiler.indent('v_' + st.identifier.identifier + ' = ' +
+                                      exact(st.expression), level)
+        elif isinstance(st, compiler.Write_AST):
+            result += compiler.indent('write(' + exact(st.expression) + ')',
+                                      level)
+        elif isinstance(st, compiler.Read_AST):
+            result += compiler.indent('v_' + st.identifier.identifier +
+                                      ' = read()', level)
+        elif isinstance(st, compiler.While_AST):
+            result += compiler.indent('while ' + condition(st.condition) + ':',
+                                      level) + \
+                      statements(st.body, level + 1)
+        else: # If_AST or If_Else_AST
+            result += compiler.indent('if ' + condition(st.condition) + ':',
+                                      level) + \
+                      statements(st.then, level + 1)
+            if isinstance(st, compiler.If_Else_AST):
+                result += compiler.indent('else:', level) + \
+                          statements(st.again, level + 1)
+    return result
+
+def condition(tree):
+    '''Returns the Python source of the condition tree.'''
+    if isinstance(tree, compiler.Comparison_AST):
+        op = { '<':'<', '=':'==', '>':'>', '<=':'<=', '!=':'!=', '>=':'>=' }
+        return exact(tree.left) + ' ' + op[tree.op] + ' ' + exact(tree.right)
+    elif tree.op == Token.NOT:
+        return '(not ' + condition(tree.left) + ')'
+    op = { Token.AND:'and', Token.OR:'or' }
+    return '(' + condition(tree.left) + ' ' + op[tree.op] + ' ' + \
+           condition(tree.right) + ')'
+
+def exact(tree):
+    '''Returns the Python source of expression tree, reduced to 32 bits.'''
+    if isinstance(tree, (compiler.Number_AST, compiler.Identifier_AST)):
+        return loose(tree)
+    return '((' + loose(tree) + ' + 2147483648 & 4294967295) - 2147483648)'
+
+def loose(tree):
+    '''Returns the Python source of expression tree, which may evaluate to
+       any integer that is congruent to its value modulo 2**32.'''
+    if isinstance(tree, compiler.Number_AST):
+        return str(interpreter.wrap(int(tree.number)))
+    elif isinstance(tree, compiler.Identifier_AST):
+        return 'v_' + tree.identifier
+    elif tree.op == '/':
+        return 'div(' + exact(tree.left) + ', ' + exact(tree.right) + ')'
+    return '(' + loose(tree.left) + ' ' + tree.op + ' ' + loose(tree.right) + ')'
+
+def div(a, b):
+    '''Returns a / b rounded towards zero, as by the JVM.'''
+    q = abs(a) // abs(b)
+    return q if (a < 0) == (b < 0) else -q
+
+def translator_version():
+    '''Returns a hash of the source of the translator: this module and
+       compiler.py, which parses the programs.'''
+    result = hashlib.sha256()
+    for file_name in [__file__, compiler.__file__]:
+        with open(file_name, 'rb') as source_file:
+            result.update(source_file.read())
+    return result.hexdigest()
+
+def load(source, cache=None):
+    '''Returns the code object of the module that defines the function
+       program for the program source. If cache is the name of a directory,
+       code objects are stored there with marshal, keyed by a hash of source,
+       the Python version and translator_version, and are reused if they are
+       already there.'''
+    if cache != None:
+        key = hashlib.sha256((sys.implementation.cache_tag + '\n' +
+                              translator_version() + '\n' +
+                              source).encode()).hexdigest()
+        path = os.path.join(cache, key + '.marshal')
+        try:
+            with open(path, 'rb') as code_file:
+                return marshal.load(code_file)
+        except (OSError, EOFError, ValueError, TypeError):
+            pass
+    with io.StringIO(source) as input_file:
+        python = translate(compiler.parse(input_file))
+    code = compile(python, '<program>', 'exec')
+    if cache != None:
+        os.makedirs(cache, exist_ok=True)
+        # write to a file of its own first, so that no process can read a
+        # partially written code object
+        temporary = path + '.' + str(os.getpid())
+        with open(temporary, 'wb') as code_file:
+            marshal.dump(code, code_file)
+        os.replace(temporary, path)
+    return code
+
+def run(code, inputs, output):
+    '''Executes the code object returned by load. Read statements take their
+       values from the iterator inputs, write statements append their values
+       to the list output. Raises ZeroDivisionError on division by zero and
+       EOFError if inputs is exhausted.'''
+    namespace = {}
+    exec(code, namespace)
+    try:
+        namespace['program'](inputs.__next__, output.append, div)
+    except StopIteration:
+        raise EOFError('no input left for read')
+
+cache_directory = os.path.join(os.path.expanduser('~'), '.cache',
+                               'python_compiler')
+
+if __name__ == '__main__':
+    import argparse
+    arguments = argparse.ArgumentParser(
+        description='Runs a program on the integers in stdin by translating '
+        'it to Python.')
+    arguments.add_argument('program', help='file with the program')
+    arguments.add_argument('--source', action='store_true',
+                           help='print the generated Python source instead')
+    arguments.add_argument('--cache', default=cache_directory, metavar='DIR',
+                           help='directory of the code object cache '
+                           '(default %(default)s)')
+    arguments.add_argument('--no-cache', action='store_true',
+                           help='compile without the cache')
+    arguments.add_argument('--stats', action='store_true',
+                           help='report compile and run time to stderr')
+    options = arguments.parse_args()
+
+    with open(options.program) as program_file:
+        source = program_file.read()
+    if options.source:
+        with io.StringIO(source) as input_file:
+            print(translate(compiler.parse(input_file)), end='')
+        sys.exit()
+    start = time.perf_counter()
+    code = load(source, None if options.no_cache else options.cache)
+    loaded = time.perf_counter()
+    output = []
+    try:
+        run(code, interpreter.integers(sys.stdin), output)
+    finally:
+        finished = time.perf_counter()
+        sys.stdout.write(''.join(str(number) + '\n' for number in output))
+        if options.stats:
+            print('compiled in ' + '%.3f' % (loaded - start) + ' s, ' +
+                  'ran in ' + '%.3f' % (finished - loaded) + ' s',
+                  file=sys.stderr)
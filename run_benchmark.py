@@ -0,0 +1,145 @@
+import glob
+import importlib.util
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# Runs the workloads of the benchmark corpus with every available execution
+# path on the same input, checks that their outputs agree and reports the time
+# of each, so that optimisations can be judged by the time programs take:
+#     python3 run_benchmark.py
+# A workload is a program benchmarks/NAME.prog with its input in
+# benchmarks/NAME.in. The time of a run is the wall time of the process that
+# executes the program. The Jasmin code for jvm.py and java is generated by
+# compiler.py beforehand, outside of the time, while python_backend.py and
+# c_backend.py compile the program when it is not in their caches, which the
+# first of the repeated runs fills. The exit status is 1 if an output differs
+# from that of the interpreter or a run fails.
+# Options:
+#     --workloads NAME ...  workloads to run (default all)
+#     --backends NAME ...   execution paths to use (default all available)
+#     --repeat N            runs per measurement, of which the fastest counts
+
+directory = os.path.dirname(os.path.abspath(__file__))
+corpus = os.path.join(directory, 'benchmarks')
+
+def tool(name):
+    return [sys.executable, os.path.join(directory, name)]
+
+# execution path: function of the program file and the directory of its
+# Jasmin class to the command that runs the program on stdin
+backends = {
+    'interpreter': lambda program, classes: tool('interpreter.py') + [program],
+    'python':      lambda program, classes: tool('python_backend.py') +
+                                            [program],
+    'vm':          lambda program, classes: tool('vm.py') + [program],
+    'tiered':      lambda program, classes: tool('tiered.py') + [program],
+    'vector':      lambda program, classes: tool('vector.py') + [program],
+    'c':           lambda program, classes: tool('c_backend.py') + [program],
+    'jvm':         lambda program, classes: tool('jvm.py') +
+                                            [os.path.join(classes,
+                                                          'Program.j')],
+    'java':        lambda program, classes: ['java', '-cp', classes,
+                                             'Program'],
+}
+
+def available():
+    '''Returns the names of the execution paths that can run here: vector
+       needs NumPy, c a C compiler, and java a JVM and the Jasmin jar named
+       by the environment variable JASMIN.'''
+    names = [name for name in backends
+             if name not in ['vector', 'c', 'java']]
+    if importlib.util.find_spec('numpy'):
+        names.insert(names.index('jvm'), 'vector')
+    if shutil.which('cc'):
+        names.append('c')
+    if shutil.which('java') and os.path.isfile(os.environ.get('JASMIN', '')):
+        names.append('java')
+    return names
+
+def workloads():
+    '''Returns the sorted names of the workloads of the corpus.'''
+    return sorted(os.path.splitext(os.path.basename(name))[0]
+                  for name in glob.glob(os.path.join(corpus, '*.prog')))
+
+def prepare(program, classes, names):
+    '''Generates the Jasmin code of program in the directory classes, and
+       assembles it if java is in names.'''
+    with open(program) as program_file, \
+         open(os.path.join(classes, 'Program.j'), 'w') as jasmin_file:
+        subprocess.run(tool('compiler.py'), stdin=program_file,
+                       stdout=jasmin_file, check=True)
+    if 'java' in names:
+        subprocess.run(['java', '-jar', os.environ['JASMIN'], '-d', classes,
+                        os.path.join(classes, 'Program.j')],
+                       stdout=subprocess.DEVNULL, check=True)
+
+def run(command, input_data):
+    '''Returns the output of command run on input_data, or None if it
+       fails, and the time it took.'''
+    start = time.perf_counter()
+    result = subprocess.run(command, input=input_data, capture_output=True,
+                            cwd=directory)
+    elapsed = time.perf_counter() - start
+    return (result.stdout if result.returncode == 0 else None), elapsed
+
+def measure(name, names, repeat=3):
+    '''Runs the workload name with the execution paths names. Returns a
+       dictionary that maps each of them to a pair of its output, as a list
+       of numbers, or None if it fails, and its fastest time.'''
+    program = os.path.join(corpus, name + '.prog')
+    with open(os.path.join(corpus, name + '.in'), 'rb') as input_file:
+        input_data = input_file.read()
+    results = {}
+    with tempfile.TemporaryDirectory() as classes:
+        prepare(program, classes, names)
+        for backend in names:
+            # The vector executor takes the inputs of a run from one line.
+            data = b' '.join(input_data.split()) + b'\n' \
+                   if backend == 'vector' else input_data
+            runs = [run(backends[backend](program, classes), data)
+                    for i in range(repeat)]
+            output = runs[0][0]
+            results[backend] = (output.split() if output != None else None,
+                                min(elapsed for output, elapsed in runs))
+    return results
+
+if __name__ == '__main__':
+    import argparse
+    arguments = argparse.ArgumentParser(
+        description='Runs the benchmark corpus with every execution path.')
+    arguments.add_argument('--workloads', nargs='+', default=workloads(),
+                           choices=workloads(), metavar='NAME',
+                           help='workloads to run (default all)')
+    arguments.add_argument('--backends', nargs='+', default=available(),
+                           choices=list(backends), metavar='NAME',
+                           help='execution paths to use (default '
+                           '%(default)s)')
+    arguments.add_argument('--repeat', type=int, default=3, metavar='N',
+                           help='runs per measurement, of which the fastest '
+                           'counts (default %(default)s)')
+    options = arguments.parse_args()
+
+    # The output of the interpreter is the reference for the others.
+    names = ['interpreter'] + [name for name in options.backends
+                               if name != 'interpreter']
+    print('%-12s' % 'seconds' + ''.join('%12s' % name for name in names))
+    failed = False
+    for workload in options.workloads:
+        results = measure(workload, names, options.repeat)
+        expected = results['interpreter'][0]
+        line = '%-12s' % workload
+        for name in names:
+            output, elapsed = results[name]
+            if output == None:
+                line += '%12s' % 'FAILED'
+            elif output != expected:
+                line += '%12s' % 'DIFFERS'
+            else:
+                line += '%12.3f' % elapsed
+            failed = failed or output == None or output != expected
+        print(line, flush=True)
+    sys.exit(1 if failed else 0)
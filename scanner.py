@@ -1,6 +1,9 @@
+import argparse
 import re
 import sys
 
+import instrumentation
+
 class Scanner:
     '''The interface comprises the methods lookahead and consume.
        Other methods should not be called from outside of this class.'''
@@ -144,17 +147,28 @@ class Token:
         (ID,    '[a-z]+'),
     ]
 
-# Initialise scanner.
-
-scanner = Scanner(sys.stdin)
+arguments = argparse.ArgumentParser(
+    description='Shows the tokens of the program on stdin.')
+arguments.add_argument('--profile', action='store_true',
+                       help='report time and memory per phase and counts of '
+                       'tokens as JSON to stderr')
+options = arguments.parse_args()
+profile = instrumentation.Profile('scanner.py', options.profile)
 
-# Show all tokens in the input.
+# Initialise scanner and show all tokens in the input. They are shown as they
+# are scanned, so the time of the scan includes that of the output.
 
-token = scanner.lookahead()
-while token != None:
-    if token in [Token.NUM, Token.ID]:
-        token, value = scanner.consume(token)
-        print(token, value)
-    else:
-        print(scanner.consume(token))
+with profile.phase('scan'):
+    scanner = Scanner(sys.stdin)
+    count = 0
     token = scanner.lookahead()
+    while token != None:
+        if token in [Token.NUM, Token.ID]:
+            token, value = scanner.consume(token)
+            print(token, value)
+        else:
+            print(scanner.consume(token))
+        count += 1
+        token = scanner.lookahead()
+profile.values['tokens'] = count
+profile.report()
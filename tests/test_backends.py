@@ -0,0 +1,180 @@
+import glob
+import io
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import compiler
+import interpreter
+import jvm
+import python_backend
+import tiered
+import vm
+
+# Tests that the execution paths agree with the generated class, run by the
+# emulator of jvm.py, on the output of programs and on whether they stop
+# early. The vector executor needs NumPy and the C backend a C compiler;
+# they are left out where these are missing. Run with
+#     python3 -m unittest discover tests
+# and with the environment variable SLOW_TESTS set to run the slow paths on
+# the benchmark corpus as well.
+
+try:
+    import vector
+except ImportError:
+    vector = None
+
+def tree(source):
+    '''Returns the Program_AST of the program source.'''
+    compiler.reset()
+    return compiler.parse(io.StringIO(source))
+
+def on_integers(run, input_data):
+    '''Returns the output of run, a function of an iterator over integers and
+       a list for the output, on the integers in the bytes input_data as a
+       list and whether it stops early.'''
+    output = []
+    try:
+        run(interpreter.integers(io.StringIO(input_data.decode())), output)
+        stopped = False
+    except (ZeroDivisionError, EOFError, ValueError):
+        stopped = True
+    return output, stopped
+
+def run_jvm(source, input_data):
+    compiler.reset()
+    machine = jvm.Machine(compiler.parse(io.StringIO(source)).code())
+    output = io.BytesIO()
+    try:
+        machine.run(input_data, output)
+        stopped = False
+    except jvm.Java_Exception:
+        stopped = True
+    return [int(line) for line in output.getvalue().split()], stopped
+
+def run_vector(source, input_data):
+    lane = [int(number)
+            for number in re.findall(r'-?[0-9]+', input_data.decode())]
+    outputs, status = vector.Executor(tree(source)).run([lane])
+    return outputs[0], status[0] != vector.RUNNING
+
+def run_c(source, input_data):
+    import c_backend
+    with tempfile.TemporaryDirectory() as directory:
+        binary = c_backend.build(c_backend.translate(tree(source)), directory)
+        result = subprocess.run([binary], input=input_data,
+                                capture_output=True)
+    return [int(line) for line in result.stdout.split()], \
+           result.returncode != 0
+
+# execution path: function of a program source and the bytes of its input to
+# its output as a list of integers and whether it stops early
+backends = {
+    'interpreter': lambda source, input_data: on_integers(
+        interpreter.Interpreter(tree(source)).run, input_data),
+    'vm':          lambda source, input_data: on_integers(
+        vm.Program(tree(source)).run, input_data),
+    'tiered':      lambda source, input_data: on_integers(
+        tiered.Tiered(tree(source), 2).run, input_data),
+    'python':      lambda source, input_data: on_integers(
+        lambda inputs, output: python_backend.run(
+            python_backend.load(source), inputs, output), input_data),
+    'jvm':         run_jvm,
+}
+if vector != None:
+    backends['vector'] = run_vector
+if shutil.which('cc'):
+    backends['c'] = run_c
+
+corpus = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))), 'benchmarks')
+
+# execution paths that take minutes for the benchmark corpus, and are only
+# run on it if the environment variable SLOW_TESTS is set: the emulator and
+# the vector executor with a single lane
+slow = ['jvm', 'vector']
+
+def workload(name):
+    '''Returns the program and the bytes of the input of the workload name of
+       the benchmark corpus.'''
+    with open(os.path.join(corpus, name + '.prog')) as program_file, \
+         open(os.path.join(corpus, name + '.in'), 'rb') as input_file:
+        return program_file.read(), input_file.read()
+
+class Agreement_Test(unittest.TestCase):
+
+    def assertAgree(self, source, input_data, expected):
+        '''Checks that every execution path gives the pair expected of output
+           and whether the program stops early.'''
+        for name, backend in backends.items():
+            with self.subTest(backend=name):
+                self.assertEqual(backend(source, input_data), expected)
+
+    def test_lone_minus_separates_numbers(self):
+        self.assertAgree('read x; write x; read x; write x; read x; write x',
+                         b'- 5 x- -7 --3', ([5, -7, -3], False))
+
+    def test_integer_beyond_32_bits_stops(self):
+        self.assertAgree('read x; write x; read x; write x',
+                         b'1 2147483648 2', ([1], True))
+        self.assertAgree('read x; write x', b'2147483648 1 2', ([], True))
+        self.assertAgree('read x; write x; read x; write x',
+                         b'-2147483648 2147483647',
+                         ([-2147483648, 2147483647], False))
+
+class Corpus_Test(unittest.TestCase):
+
+    def test_workloads_agree(self):
+        # run_benchmark.py makes the same check with the time of each path
+        for name in sorted(os.path.splitext(os.path.basename(path))[0]
+                           for path in glob.glob(os.path.join(corpus,
+                                                              '*.prog'))):
+            source, input_data = workload(name)
+            expected = backends['interpreter'](source, input_data)
+            self.assertFalse(expected[1], name)
+            for backend in backends:
+                if backend == 'interpreter' or \
+                   backend in slow and not os.environ.get('SLOW_TESTS'):
+                    continue
+                with self.subTest(workload=name, backend=backend):
+                    self.assertEqual(
+                        backends[backend](source, input_data), expected)
+
+    @unittest.skipIf(vector == None, 'no NumPy')
+    def test_vector_lanes(self):
+        # each pair of the gcd workload is a lane of its own
+        source, input_data = workload('gcd')
+        numbers = [int(number) for number in input_data.split()[1:]]
+        lanes = [[1] + numbers[i:i + 2] for i in range(0, len(numbers), 2)]
+        lanes += [[1, 12], [1, 12, 0], [2, 12, 18], [1, 5, 2147483648]]
+        result = vector.Executor(tree(source)).run(lanes)
+        self.assertEqual(result, vector.one_at_a_time(tree(source), lanes))
+        self.assertEqual(result[1][-4:],
+                         [vector.END_OF_INPUT, vector.RUNNING,
+                          vector.END_OF_INPUT, vector.INPUT_MISMATCH])
+
+@unittest.skipUnless(shutil.which('cc'), 'no C compiler')
+class C_Backend_Test(unittest.TestCase):
+
+    def test_arithmetic_of_32_bits(self):
+        # overflow of +, - and *, division rounding towards zero,
+        # -2147483648 / -1 and a stop at division by zero
+        source = 'read x; read y; write x + y; write x - y - y; ' + \
+                 'write x * y; write 0 - x / 7; ' + \
+                 'write (0 - x - 1) / (0 - 1); write (0 - 7) / 2; ' + \
+                 'write x / (y - y); write 1'
+        input_data = b'2147483647 -2147483647'
+        self.assertEqual(run_c(source, input_data),
+                         run_jvm(source, input_data))
+        self.assertEqual(run_c(source, input_data),
+                         ([0, 2147483645, -1, -306783378, -2147483648, -3],
+                          True))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import compile_benchmark
+
+# Tests of the regression check of compile_benchmark.py on made-up results,
+# without measuring anything. Run with
+#     python3 -m unittest discover tests
+
+def result(exponent, seconds=1.0):
+    return { 'sizes':[1000, 2000], 'seconds':[seconds / 2, seconds],
+             'exponent':exponent }
+
+class Regressions_Test(unittest.TestCase):
+
+    def test_fit(self):
+        self.assertAlmostEqual(compile_benchmark.fit([250, 500, 1000],
+                                                     [1.0, 4.0, 16.0]), 2.0)
+        self.assertAlmostEqual(compile_benchmark.fit([250, 500, 1000],
+                                                     [1.0, 2.0, 4.0]), 1.0)
+
+    def test_exponents_above_the_maximum_regress(self):
+        results = { 'scanner/flat':result(1.0), 'scanner/deep':result(1.9),
+                    'parser/deep':result(1.4) }
+        # even if the baseline has the same exponent
+        baseline = { 'scanner/deep':result(1.9) }
+        self.assertEqual(
+            sorted(compile_benchmark.regressions(results, baseline, 1.3)),
+            ['parser/deep', 'scanner/deep'])
+
+    def test_allowed_exponents_are_compared_with_the_baseline(self):
+        results = { 'scanner/deep':result(1.9), 'parser/deep':result(2.0),
+                    'parser/flat':result(1.5) }
+        baseline = { 'scanner/deep':result(1.8), 'parser/deep':result(1.6) }
+        self.assertEqual(
+            sorted(compile_benchmark.regressions(
+                results, baseline, 1.3,
+                ['scanner/deep', 'parser/deep', 'parser/flat'])),
+            ['parser/deep'])
+
+    def test_times_do_not_matter(self):
+        results = { 'scanner/flat':result(1.0, 100.0) }
+        baseline = { 'scanner/flat':result(1.0, 0.001) }
+        self.assertEqual(
+            compile_benchmark.regressions(results, baseline, 1.3), {})
+
+if __name__ == '__main__':
+    unittest.main()
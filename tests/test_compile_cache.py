@@ -0,0 +1,131 @@
+import concurrent.futures
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import compile_all
+import compile_cache
+import compiler
+
+# Tests of the cache of compile_cache.py, each in a directory of its own.
+# Run with
+#     python3 -m unittest discover tests
+
+def compile_many(directory, first):
+    '''Runs in a worker process: compiles 40 of 10 small programs, starting
+       with number first, with the cache in directory.'''
+    cache = compile_cache.Cache(directory)
+    for i in range(40):
+        cache.compile('write ' + str((first + i) % 10))
+
+class Cache_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = compile_cache.Cache(self.directory.name)
+        self.options = compiler.unroll_factor, compiler.switch_threshold, \
+                       compiler.method_size_limit
+
+    def tearDown(self):
+        compiler.unroll_factor, compiler.switch_threshold, \
+            compiler.method_size_limit = self.options
+        self.directory.cleanup()
+
+    def test_hit_and_miss(self):
+        source = 'read x; write x + 1'
+        self.assertEqual(self.cache.get(source), None)
+        code, error = self.cache.compile(source)
+        self.assertEqual((code, error),
+                         (compile_all.compile_source(source), None))
+        self.assertEqual(self.cache.compile(source), (code, None))
+        self.assertEqual(self.cache.get('write 2'), None)
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries'],
+                          stats['bytes']), (1, 3, 1, len(code.encode())))
+
+    def test_failures_are_not_cached(self):
+        code, error = self.cache.compile('write')
+        self.assertEqual(code, None)
+        self.assertNotEqual(error, None)
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+    def test_eviction_to_90_percent(self):
+        sources = ['write ' + str(i) for i in range(10)]
+        size = len(compile_all.compile_source(sources[0]).encode())
+        self.cache.limit = 5 * size
+        start = time.time() - 100
+        for i, source in enumerate(sources[:5]):
+            self.cache.compile(source)
+            # the modification times order the entries by their last use
+            os.utime(os.path.join(self.cache.entries,
+                                  self.cache.key(source)),
+                     (start + i, start + i))
+        self.assertEqual(self.cache.stats()['evicted'], 0)
+        self.cache.get(sources[0]) # now the most recently used
+        self.cache.compile(sources[5])
+        stats = self.cache.stats()
+        # 6 entries exceed the limit, and 4 are at most 90 percent of it
+        self.assertEqual((stats['entries'], stats['evicted'], stats['bytes']),
+                         (4, 2, 4 * size))
+        for source in [sources[0], sources[3], sources[4], sources[5]]:
+            self.assertNotEqual(self.cache.get(source), None, source)
+        for source in sources[1:3]:
+            self.assertEqual(self.cache.get(source), None, source)
+
+    def test_key_changes_with_options(self):
+        source = 'x := 0; while x < 10 do write x; x := x + 1 end'
+        keys = [self.cache.key(source)]
+        compiler.unroll_factor += 1
+        keys.append(self.cache.key(source))
+        compiler.switch_threshold += 1
+        keys.append(self.cache.key(source))
+        compiler.method_size_limit -= 1
+        keys.append(self.cache.key(source))
+        self.assertEqual(len(set(keys)), 4)
+        self.assertEqual(self.cache.key(source), keys[-1])
+        self.assertNotEqual(self.cache.key(source + ' '), keys[-1])
+
+    def test_options_are_not_mixed_up(self):
+        source = 'x := 0; while x < 10 do write x; x := x + 1 end'
+        compiler.unroll_factor = 1
+        rolled = self.cache.compile(source)[0]
+        compiler.unroll_factor = 4
+        unrolled = self.cache.compile(source)[0]
+        self.assertNotEqual(rolled, unrolled)
+        self.assertEqual(unrolled, compile_all.compile_source(source))
+        compiler.unroll_factor = 1
+        self.assertEqual(self.cache.get(source), rolled)
+
+    def test_processes_share_the_cache(self):
+        with concurrent.futures.ProcessPoolExecutor(4) as pool:
+            for result in [pool.submit(compile_many, self.directory.name, i)
+                           for i in range(8)]:
+                result.result()
+        stats = self.cache.stats()
+        # each program misses at least once and may miss in several
+        # processes at once, but is entered once
+        self.assertEqual(stats['hits'] + stats['misses'], 8 * 40)
+        self.assertGreaterEqual(stats['misses'], 10)
+        self.assertEqual(stats['entries'], 10)
+        self.assertEqual(stats['bytes'],
+                         sum(entry.stat().st_size
+                             for entry in os.scandir(self.cache.entries)))
+        # no temporary files of put are left
+        self.assertEqual([entry.name
+                          for entry in os.scandir(self.cache.entries)
+                          if '.' in entry.name], [])
+
+    def test_clear(self):
+        self.cache.compile('write 1')
+        self.cache.clear()
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries'],
+                          stats['bytes']), (0, 0, 0, 0))
+        self.assertEqual(self.cache.get('write 1'), None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,390 @@
+import contextlib
+import glob
+import io
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import compiler
+import generator
+import interpreter
+import jvm
+
+# Tests of compiler.py. Generated classes are run by the emulator of jvm.py
+# without its models of the runtime methods, so that the code of the
+# runtime methods is tested as well. Run with
+#     python3 -m unittest discover tests
+# Tests that take minutes run only if the environment variable SLOW_TESTS is
+# set.
+
+def compile_program(source):
+    '''Returns the Jasmin code of the program source.'''
+    compiler.reset()
+    return compiler.parse(io.StringIO(source)).code()
+
+def run(code, input_data):
+    '''Runs the Jasmin class code on the bytes input_data and returns the
+       output as a list of integers and the name of the class of the
+       exception it throws, or None.'''
+    machine = jvm.Machine(code, intrinsics=False)
+    output = io.BytesIO()
+    try:
+        machine.run(input_data, output)
+        thrown = None
+    except jvm.Java_Exception as exception:
+        thrown = exception.class_name
+    return [int(line) for line in output.getvalue().split()], thrown
+
+class Read_Test(unittest.TestCase):
+
+    program = 'read x; write x; read x; write x; read x; write x'
+
+    def test_lone_minus_separates_numbers(self):
+        self.assertEqual(run(compile_program(self.program), b'- 5 x- -7 --3'),
+                         ([5, -7, -3], None))
+        self.assertEqual(run(compile_program(self.program), b'4 - -'),
+                         ([4], 'java/util/NoSuchElementException'))
+
+    def test_limits_of_32_bits(self):
+        self.assertEqual(run(compile_program(self.program),
+                             b'2147483647 -2147483648 -0'),
+                         ([2147483647, -2147483648, 0], None))
+        for number in [b'2147483648', b'-2147483649', b'99999999999']:
+            self.assertEqual(run(compile_program(self.program), number),
+                             ([], 'java/util/InputMismatchException'))
+
+def interpret(source, input_data):
+    '''Returns the output of the program source run by the interpreter on
+       the bytes input_data like run, with the name of the class of the
+       exception that the generated class would throw.'''
+    compiler.reset()
+    program = interpreter.Interpreter(compiler.parse(io.StringIO(source)))
+    output = []
+    try:
+        program.run(interpreter.integers(io.StringIO(input_data.decode())),
+                    output)
+        thrown = None
+    except ZeroDivisionError:
+        thrown = 'java/lang/ArithmeticException'
+    except EOFError:
+        thrown = 'java/util/NoSuchElementException'
+    return output, thrown
+
+class Loop_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.options = compiler.unroll_factor, compiler.reports
+
+    def tearDown(self):
+        compiler.unroll_factor, compiler.reports = self.options
+
+    def loops(self):
+        '''Returns programs with a loop over i for each kind of comparison,
+           step and number of iterations, whose body uses products of i and
+           a constant, which are strength-reduced, and an invariant.'''
+        result = []
+        for start, op, limit, step in [(0, '<', 'N', 1), (0, '<=', 'N', 1),
+                                       (0, '<', 'N', 3), (0, '!=', 'N', 1),
+                                       ('N', '>', 0, -1), ('N', '>=', 1, -2)]:
+            for trips in [0, 1, 2, 3, 5, 7, 8, 9, 13, 16, 17]:
+                n = str(trips * abs(step))
+                result.append(
+                    'read a; i := ' + str(start).replace('N', n) +
+                    '; s := 0; while i ' + op + ' ' +
+                    str(limit).replace('N', n) + ' do s := s + i * 3 + ' +
+                    '(a * 7); write i * 5 - s; i := i ' +
+                    ('+ ' + str(step) if step > 0 else '- ' + str(-step)) +
+                    ' end; write s; write i')
+        return result
+
+    def test_unroll_factors(self):
+        compiler.reports = True
+        for factor in range(1, 9):
+            compiler.unroll_factor = factor
+            for source in self.loops():
+                with contextlib.redirect_stderr(io.StringIO()) as messages:
+                    code = compile_program(source)
+                self.assertEqual(run(code, b'11'), interpret(source, b'11'),
+                                 (factor, source))
+                # every loop has a constant trip count
+                self.assertEqual('unrolled by' in messages.getvalue(),
+                                 factor > 1, (factor, source))
+
+    def test_unknown_trip_count(self):
+        # the induction variable does not start at a known value, so the
+        # loop is not unrolled but its products are still strength-reduced
+        source = 'read n; read i; s := 0; while i < n do ' + \
+                 's := s + i * 4; write s; i := i + 2 end; write i'
+        for factor in [1, 4]:
+            compiler.unroll_factor = factor
+            for input_data in [b'9 0', b'10 1', b'3 5', b'-2147483648 7']:
+                self.assertEqual(run(compile_program(source), input_data),
+                                 interpret(source, input_data))
+
+    def test_nested_loops(self):
+        source = 'j := 0; while j < 6 do i := 0; while i < 5 do ' + \
+                 'write i * 2 + j * 3; i := i + 1 end; j := j + 1 end'
+        for factor in range(1, 9):
+            compiler.unroll_factor = factor
+            self.assertEqual(run(compile_program(source), b''),
+                             interpret(source, b''))
+
+class Switch_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.threshold = compiler.switch_threshold
+
+    def tearDown(self):
+        compiler.switch_threshold = self.threshold
+
+    def chain(self, values):
+        '''Returns a program that reads x and writes a number for each of
+           values in an if-chain on x, and 0 for other values.'''
+        result = 'read x; '
+        for i, value in enumerate(values):
+            result += 'if x = ' + str(value) + ' then write ' + str(i + 1) + \
+                      ' else '
+        return result + 'write 0' + ' end' * len(values)
+
+    def check(self, values, instruction):
+        source = self.chain(values)
+        code = compile_program(source)
+        for other in ['tableswitch', 'lookupswitch']:
+            self.assertEqual(other in code, other == instruction, other)
+        for value in sorted(set(values) | {min(values) - 1, max(values) + 1,
+                                           -2147483648, 2147483647}):
+            if value > 2147483647:
+                continue
+            input_data = str(value).encode()
+            self.assertEqual(run(code, input_data),
+                             interpret(source, input_data), value)
+
+    def test_dense_cases_use_tableswitch(self):
+        self.check([1, 2, 3, 4, 5], 'tableswitch')
+        self.check([3, 1, 2, 6, 4], 'tableswitch')
+        self.check([0, 1, 3], 'tableswitch')
+
+    def test_sparse_cases_use_lookupswitch(self):
+        self.check([1, 100, 10000], 'lookupswitch')
+        self.check([0, 1000, 2147483647], 'lookupswitch')
+
+    def test_repeated_case_takes_the_first(self):
+        self.check([1, 2, 3, 1, 4], 'tableswitch')
+
+    def test_short_chains_stay_if_statements(self):
+        self.check([1, 2], None)
+        compiler.switch_threshold = 2
+        # for two cases the cost model prefers lookupswitch
+        self.check([1, 2], 'lookupswitch')
+
+class Split_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.limit = compiler.method_size_limit
+
+    def tearDown(self):
+        compiler.method_size_limit = self.limit
+
+    def program(self):
+        '''Returns a program with 600 identifiers, whose locations need wide
+           instructions from 256 on, that are assigned at the top level and
+           in a loop.'''
+        names = ['v' + chr(ord('a') + i // 26) + chr(ord('a') + i % 26)
+                 for i in range(600)]
+        return '; '.join(name + ' := ' + str(i)
+                         for i, name in enumerate(names)) + \
+               '; i := 0; while i < 3 do ' + \
+               '; '.join(names[j] + ' := ' + names[j] + ' + ' + names[j + 1]
+                         for j in range(0, 598, 2)) + \
+               '; i := i + 1 end; ' + \
+               '; '.join('write ' + name for name in names[::7])
+
+    def large_program(self, statements):
+        '''Returns a program with 400 identifiers and about statements
+           statements, half of them at the top level and half in the body of
+           a loop that runs twice, with if and while statements among them
+           and a write of every seventh.'''
+        names = [generator.identifier(i) for i in range(400)]
+        result = []
+        for i in range(statements):
+            a, b, c = names[i % 400], names[(i * 7 + 1) % 400], \
+                      names[(i * 13 + 2) % 400]
+            if i % 50 == 0:
+                result.append('i := 3; while i > 0 do ' + a + ' := ' + a +
+                              ' + i * ' + b + '; i := i - 1 end')
+            elif i % 10 == 0:
+                result.append('if ' + a + ' < ' + b + ' then ' + c + ' := ' +
+                              c + ' - ' + a + '; write ' + c + ' else ' + b +
+                              ' := ' + b + ' + 1 end')
+            elif i % 7 == 0:
+                result.append('write ' + a)
+            else:
+                result.append(a + ' := ' + b + ' + ' + c + ' * ' +
+                              str(i % 9 + 1))
+        half = statements // 2
+        return '; '.join([name + ' := ' + str(i)
+                          for i, name in enumerate(names)] +
+                         ['read ' + names[0]] + result[:half] +
+                         ['j := 2; while j > 0 do ' +
+                          '; '.join(result[half:]) + '; j := j - 1 end'])
+
+    def check_methods(self, code):
+        '''Checks that the methods of the class code are within
+           method_size_limit and returns the number of levels of methods
+           that main calls, counting main.'''
+        calls = {}
+        for method in code.split('.method ')[1:]:
+            body = method[:method.index('.end method')]
+            instructions = [line for line in body.split('\n')[1:]
+                            if not line.startswith('.')]
+            self.assertLessEqual(compiler.code_size('\n'.join(instructions)),
+                                 compiler.method_size_limit,
+                                 method.split('\n')[0])
+            name = method.split('(')[0].split()[-1]
+            calls[name] = re.findall(r'invokestatic Program/(m[0-9]+)\(\)V',
+                                     body)
+        def levels(name):
+            return 1 + max([levels(callee) for callee in calls[name]] + [0])
+        return levels('main')
+
+    def test_methods_within_limit(self):
+        compiler.method_size_limit = 2000
+        code = compile_program(self.program())
+        self.assertIn('invokestatic Program/m1()V', code)
+        self.check_methods(code)
+
+    def test_same_output(self):
+        compiler.method_size_limit = 2000
+        split = run(compile_program(self.program()), b'')
+        compiler.method_size_limit = 10 ** 9
+        self.assertEqual(split, run(compile_program(self.program()), b''))
+
+    def check_large_program(self, statements, limit):
+        '''Checks the methods and the output of large_program(statements)
+           compiled with method_size_limit limit, which must need at least
+           three levels of methods, against the program compiled without
+           splitting and against the interpreter.'''
+        source = self.large_program(statements)
+        compiler.method_size_limit = limit
+        code = compile_program(source)
+        self.assertGreaterEqual(self.check_methods(code), 3)
+        # the locations from 256 on need wide instructions
+        self.assertTrue(any(int(loc) > 255 for loc in
+                            re.findall(r'iload ([0-9]+)', code)))
+        split = run(code, b'5')
+        compiler.method_size_limit = 10 ** 9
+        self.assertEqual(split, run(compile_program(source), b'5'))
+        compiler.reset()
+        output = []
+        interpreter.Interpreter(compiler.parse(io.StringIO(source))).run(
+            iter([5]), output)
+        self.assertEqual(split, (output, None))
+
+    def test_large_program(self):
+        self.check_large_program(6000, 1000)
+
+    @unittest.skipUnless(os.environ.get('SLOW_TESTS'),
+                         'set SLOW_TESTS to run it')
+    def test_million_statements(self):
+        self.check_large_program(1000000, compiler.method_size_limit)
+
+class Parallel_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.options = compiler.code_workers, compiler.reports, \
+                       compiler.method_size_limit
+
+    def tearDown(self):
+        compiler.code_workers, compiler.reports, \
+            compiler.method_size_limit = self.options
+
+    def programs(self):
+        '''Returns generated programs of every shape, the program of
+           Split_Test and the programs of the benchmark corpus.'''
+        result = [generator.program(seed, **generator.shapes[shape](60))
+                  for seed, shape in enumerate(sorted(generator.shapes))]
+        result.append(Split_Test().program())
+        for name in sorted(glob.glob(os.path.join(
+                os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                'benchmarks', '*.prog'))):
+            with open(name) as program_file:
+                result.append(program_file.read())
+        return result
+
+    def compiled(self, source, workers):
+        '''Returns the code of the program source generated by workers
+           processes and the reports written meanwhile.'''
+        compiler.code_workers = workers
+        with contextlib.redirect_stderr(io.StringIO()) as messages:
+            code = compile_program(source)
+        return code, messages.getvalue()
+
+    def check(self):
+        for source in self.programs():
+            self.assertEqual(self.compiled(source, 3),
+                             self.compiled(source, 1), source[:60])
+
+    def test_same_code(self):
+        self.check()
+
+    def test_same_code_with_split_methods(self):
+        compiler.method_size_limit = 1000
+        self.check()
+
+    def test_same_reports(self):
+        compiler.reports = True
+        self.check()
+        compiler.method_size_limit = 1000
+        self.check()
+
+    def test_command_line(self):
+        directory = os.path.dirname(os.path.dirname(os.path.abspath(
+            __file__)))
+        # the loops with a constant trip count are reported as unrolled
+        source = (generator.program(1, **generator.shapes['deep'](60)) +
+                  '; i := 0; while i < 10 do write i; i := i + 1 end; ' +
+                  'j := 0; while j < 3 do write j; j := j + 1 end').encode()
+        outputs = [subprocess.run([sys.executable,
+                                   os.path.join(directory, 'compiler.py'),
+                                   '--report', '--workers', workers],
+                                  input=source, capture_output=True,
+                                  check=True)
+                   for workers in ['1', '3']]
+        self.assertEqual((outputs[0].stdout, outputs[0].stderr),
+                         (outputs[1].stdout, outputs[1].stderr))
+        self.assertNotEqual(outputs[0].stderr, b'')
+
+class Branch_Profile_Test(unittest.TestCase):
+
+    def test_malformed_outcomes_are_ignored(self):
+        compiler.reset()
+        tree = compiler.parse(io.StringIO(
+            'read x; if x < 3 then write 1 end; if x > 5 then write 2 end; '
+            'if x = 4 then write 3 end; if x = 7 then write 4 end; '
+            'if x = 8 then write 5 end'))
+        conditions = [node for node in compiler.walk(tree)
+                      if isinstance(node, compiler.Comparison_AST)]
+        sites = {}
+        for node, outcomes in zip(conditions,
+                                  [[3, 4], None, [5], ['a', 'b'], [-1, 2]]):
+            sites[compiler.site(node)] = {'condition':repr(node)}
+            if outcomes != None:
+                sites[compiler.site(node)]['outcomes'] = outcomes
+        with tempfile.NamedTemporaryFile('w', suffix='.json',
+                                         delete=False) as profile_file:
+            json.dump({'format':1, 'sites':sites}, profile_file)
+        try:
+            self.assertEqual(
+                compiler.load_branch_profile(profile_file.name, tree), (1, 4))
+        finally:
+            os.remove(profile_file.name)
+        self.assertEqual(compiler.branch_profile, {conditions[0]:[3, 4]})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,244 @@
+import sys
+import time
+
+import compiler
+import interpreter
+import python_backend
+
+# Executes the abstract syntax trees of compiler.py in two tiers, with the
+# 32-bit integer semantics of the JVM. Programs start in the interpreter of
+# interpreter.py, which counts how often the body of each while loop is
+# repeated. A loop that is repeated threshold times is translated to Python
+# source as by python_backend.py, with the variables it uses as local
+# variables, and the rest of the loop runs as compiled code. Later executions
+# of the loop start in compiled code right away. Run a program on the
+# integers in stdin with
+#     python3 tiered.py program < input
+# Options:
+#     --threshold N   repetitions of a loop body before the loop is compiled
+#     --stats         report tier transitions and time per tier to stderr
+
+class Tiered(interpreter.Interpreter):
+    '''The interface comprises the constructor, the method run and the
+       counters it sets: back_edges, the number of interpreted repetitions
+       of each loop, transitions, a list of the numbers of the loops in the
+       order they were compiled, and times, the seconds spent interpreting,
+       compiling and in compiled code. Loops are numbered in the order of
+       their first occurrence.'''
+
+    def __init__(self, tree, threshold=100):
+        '''tree is a Program_AST.'''
+        self.loops = [] # While_AST of each loop
+        self.threshold = threshold
+        interpreter.Interpreter.__init__(self, tree)
+        self.back_edges = [0] * len(self.loops)
+        self.transitions = []
+        self.times = { 'interpreted':0.0, 'compiling':0.0, 'compiled':0.0 }
+
+    def lower(self, tree):
+        '''Returns the lowered form of tree. While statements carry the
+           number of the loop as fourth element.'''
+        if isinstance(tree, compiler.While_AST):
+            number = len(self.loops)
+            self.loops.append(tree)
+            return (self.WHILE, self.lower(tree.condition),
+                    self.lower(tree.body), number)
+        return interpreter.Interpreter.lower(self, tree)
+
+    def run(self, inputs, output):
+        '''Executes the program. Read statements take their values from the
+           iterator inputs, write statements append their values to the list
+           output. Variables that are read before they are assigned hold 0.
+           Raises ZeroDivisionError on division by zero and EOFError if
+           inputs is exhausted.'''
+        slots = [0] * self.symbol_table.size()
+        value, test = self.evaluators(slots)
+        ASSIGN, WRITE, READ, IF = self.ASSIGN, self.WRITE, self.READ, self.IF
+        write = output.append
+        read = inputs.__next__
+        compiled = [None] * len(self.loops)
+        back_edges = self.back_edges
+        threshold = self.threshold
+        times = self.times
+        start = time.perf_counter()
+
+        def execute(block):
+            for st in block:
+                kind = st[0]
+                if kind == ASSIGN:
+                    slots[st[1]] = value(st[2])
+                elif kind == IF:
+                    if test(st[1]):
+                        execute(st[2])
+                    else:
+                        execute(st[3])
+                elif kind == WRITE:
+                    write(value(st[1]))
+                elif kind == READ:
+                    for number in inputs:
+                        slots[st[1]] = number
+                        break
+                    else:
+                        raise EOFError('no input left for read')
+                else: # WHILE
+                    condition, body, number = st[1], st[2], st[3]
+                    if compiled[number] == None:
+                        while test(condition):
+                            execute(body)
+                            back_edges[number] += 1
+                            if back_edges[number] >= threshold:
+                                entered = time.perf_counter()
+                                compiled[number] = self.compile(st)
+                                self.transitions.append(number)
+                                times['compiling'] += time.perf_counter() - \
+                                                      entered
+                                break
+                        else:
+                            continue
+                    # The compiled loop starts with the test of the condition,
+                    # so it also continues a loop left by the interpreter.
+                    entered = time.perf_counter()
+                    try:
+                        compiled[number](slots, read, write,
+                                         python_backend.div)
+                    except StopIteration:
+                        raise EOFError('no input left for read')
+                    finally:
+                        times['compiled'] += time.perf_counter() - entered
+
+        try:
+            execute(self.program)
+        finally:
+            times['interpreted'] = time.perf_counter() - start - \
+                                   times['compiling'] - times['compiled']
+
+    def compile(self, loop):
+        '''Returns the function that executes the lowered while statement
+           loop on the list of variables slots.'''
+        namespace = {}
+        exec(compile(self.source(loop), '<loop ' + str(loop[3]) + '>', 'exec'),
+             namespace)
+        return namespace['loop']
+
+    def source(self, loop):
+        '''Returns the Python source of the function
+           loop(slots, read, write, div) that executes the lowered while
+           statement loop. The variables of the loop are loaded from slots
+           into local variables s0, s1, ... first and those assigned stored
+           back at the end.'''
+        used, assigned = set(), set()
+        def variables(e):
+            '''Adds the variables of e, a lowered node or block.'''
+            if e and e[0] == self.VAR:
+                used.add(e[1])
+            elif e and e[0] in [self.ASSIGN, self.READ]:
+                assigned.add(e[1])
+            for element in e:
+                if isinstance(element, tuple):
+                    variables(element)
+        variables(loop)
+        result = 'def loop(slots, read, write, div):\n'
+        for loc in sorted(used | assigned):
+            result += compiler.indent('s' + str(loc) + ' = slots[' +
+                                      str(loc) + ']', 1)
+        result += self.statements((loop,), 1)
+        for loc in sorted(assigned):
+            result += compiler.indent('slots[' + str(loc) + '] = s' +
+                                      str(loc), 1)
+        return result
+
+    def statements(self, block, level):
+        '''Returns the Python source of the lowered statements in block,
+           indented by level.'''
+        if not block:
+            return compiler.indent('pass', level)
+        result = ''
+        for st in block:
+            kind = st[0]
+            if kind == self.ASSIGN:
+                result += compiler.indent('s' + str(st[1]) + ' = ' +
+                                          self.exact(st[2]), level)
+            elif kind == self.WRITE:
+                result += compiler.indent('write(' + self.exact(st[1]) + ')',
+                                          level)
+            elif kind == self.READ:
+                result += compiler.indent('s' + str(st[1]) + ' = read()',
+                                          level)
+            elif kind == self.IF:
+                result += compiler.indent('if ' + self.condition(st[1]) + ':',
+                                          level) + \
+                          self.statements(st[2], level + 1)
+                if st[3]:
+                    result += compiler.indent('else:', level) + \
+                              self.statements(st[3], level + 1)
+            else: # WHILE
+                result += compiler.indent('while ' + self.condition(st[1]) +
+                                          ':', level) + \
+                          self.statements(st[2], level + 1)
+        return result
+
+    def condition(self, c):
+        '''Returns the Python source of the lowered condition c.'''
+        kind = c[0]
+        if kind == self.NOT:
+            return '(not ' + self.condition(c[1]) + ')'
+        elif kind in [self.AND, self.OR]:
+            return '(' + self.condition(c[1]) + \
+                   (' and ' if kind == self.AND else ' or ') + \
+                   self.condition(c[2]) + ')'
+        op = { self.LESS:'<', self.EQ:'==', self.GRTR:'>', self.LEQ:'<=',
+               self.NEQ:'!=', self.GEQ:'>=' }
+        return self.exact(c[1]) + ' ' + op[kind] + ' ' + self.exact(c[2])
+
+    def exact(self, e):
+        '''Returns the Python source of the lowered expression e, reduced to
+           32 bits.'''
+        if e[0] in [self.NUM, self.VAR]:
+            return self.loose(e)
+        return '((' + self.loose(e) + ' + 2147483648 & 4294967295) - ' + \
+               '2147483648)'
+
+    def loose(self, e):
+        '''Returns the Python source of the lowered expression e, which may
+           evaluate to any integer that is congruent to its value modulo
+           2**32.'''
+        kind = e[0]
+        if kind == self.NUM:
+            return str(e[1])
+        elif kind == self.VAR:
+            return 's' + str(e[1])
+        elif kind == self.DIV:
+            return 'div(' + self.exact(e[1]) + ', ' + self.exact(e[2]) + ')'
+        op = { self.ADD:'+', self.SUB:'-', self.MUL:'*' }
+        return '(' + self.loose(e[1]) + ' ' + op[kind] + ' ' + \
+               self.loose(e[2]) + ')'
+
+if __name__ == '__main__':
+    import argparse
+    arguments = argparse.ArgumentParser(
+        description='Runs a program on the integers in stdin, compiling hot '
+        'loops to Python.')
+    arguments.add_argument('program', help='file with the program')
+    arguments.add_argument('--threshold', type=int, default=100, metavar='N',
+                           help='repetitions of a loop body before the loop '
+                           'is compiled (default %(default)s)')
+    arguments.add_argument('--stats', action='store_true',
+                           help='report tier transitions and time per tier '
+                           'to stderr')
+    options = arguments.parse_args()
+
+    with open(options.program) as program_file:
+        tiered = Tiered(compiler.parse(program_file), options.threshold)
+    output = []
+    try:
+        tiered.run(interpreter.integers(sys.stdin), output)
+    finally:
+        sys.stdout.write(''.join(str(number) + '\n' for number in output))
+        if options.stats:
+            for number in tiered.transitions:
+                print('loop ' + str(number) + ' while ' +
+                      repr(tiered.loops[number].condition) + ' compiled after ' +
+                      str(tiered.back_edges[number]) + ' repetitions',
+                      file=sys.stderr)
+            for tier, seconds in tiered.times.items():
+                print(tier + ' ' + '%.3f' % seconds + ' s', file=sys.stderr)
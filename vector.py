@@ -0,0 +1,241 @@
+import sys
+import time
+
+import numpy
+
+import compiler
+import interpreter
+
+# Runs a program of compiler.py on many independent sets of inputs at once,
+# with the 32-bit integer semantics of the JVM. Each set of inputs is a lane.
+# Every variable is a NumPy array of 32-bit integers with one element per
+# lane, so each operation of the program is executed for all lanes together.
+# Run a program on the lanes in stdin, one line of integers per lane, with
+#     python3 vector.py program < lanes
+# Each line of output holds the output of a lane, followed by the error that
+# stopped it, if any. NumPy is needed by this module only.
+# Options:
+#     --stats     report lanes per second to stderr
+#     --compare   also run each lane on its own with interpreter.py, check
+#                 that the results agree and report both times to stderr
+
+# The following enumerates the reasons for which a lane stops early.
+RUNNING, DIVISION_BY_ZERO, END_OF_INPUT, INPUT_MISMATCH = range(4)
+
+errors = ['', 'division by zero', 'no input left for read',
+          'integer out of range']
+
+class Executor:
+    '''The interface comprises the constructor and the method run.
+       The tree is lowered as by interpreter.Interpreter. Statements are
+       executed under a mask of the lanes they apply to: an if statement
+       runs its branches under the lanes for which the condition holds and
+       does not hold, and a while statement repeats its body for the lanes
+       whose condition still holds until there are none left.'''
+
+    def __init__(self, tree):
+        '''tree is a Program_AST.'''
+        lowered = interpreter.Interpreter(tree)
+        self.size = lowered.symbol_table.size()
+        self.program = lowered.program
+
+    def run(self, lanes):
+        '''Executes the program for each list of inputs in lanes. Returns a
+           pair of a list with the output of each lane, a list of integers,
+           and a list with the error that stopped each lane, one of RUNNING,
+           DIVISION_BY_ZERO, END_OF_INPUT and INPUT_MISMATCH, for a read of
+           an integer that does not fit in 32 bits. A lane that stops keeps
+           the output it wrote before.'''
+        I = interpreter.Interpreter
+        count = len(lanes)
+        # the inputs of a lane end before its first integer out of range
+        lengths = [len(values) for values in lanes]
+        for lane, values in enumerate(lanes):
+            for index, number in enumerate(values):
+                if not -2147483648 <= number <= 2147483647:
+                    lengths[lane] = index
+                    break
+        mismatched = numpy.array([length < len(values)
+                                  for length, values in zip(lengths, lanes)],
+                                 bool)
+        width = max(lengths + [1])
+        inputs = numpy.zeros((count, width), numpy.int32)
+        for lane, values in enumerate(lanes):
+            inputs[lane, :lengths[lane]] = values[:lengths[lane]]
+        lengths = numpy.array(lengths, numpy.int64)
+        position = numpy.zeros(count, numpy.int64)
+        slots = numpy.zeros((self.size, count), numpy.int32)
+        status = numpy.zeros(count, numpy.int8)
+        written = [] # pairs of the lanes that wrote and the values
+
+        def stop(lanes, error):
+            '''Stops the lanes in the mask lanes with error.'''
+            status[lanes & (status == RUNNING)] = error
+
+        def value(e, mask):
+            '''Returns the values of expression e, which are only meaningful
+               for the lanes in mask. Stops lanes in mask that divide by
+               zero.'''
+            kind = e[0]
+            if kind == I.VAR:
+                return slots[e[1]]
+            if kind == I.NUM:
+                return numpy.int32(e[1])
+            a = value(e[1], mask)
+            b = value(e[2], mask)
+            if kind == I.ADD:
+                return a + b
+            if kind == I.SUB:
+                return a - b
+            if kind == I.MUL:
+                return a * b
+            # division rounds towards zero, and -2**31 / -1 wraps around
+            zero = numpy.broadcast_to(b == 0, (count,))
+            stop(mask & zero, DIVISION_BY_ZERO)
+            a = numpy.asarray(a, numpy.int64)
+            b = numpy.where(zero, 1, b).astype(numpy.int64)
+            q = numpy.abs(a) // numpy.abs(b)
+            return numpy.where((a < 0) != (b < 0), -q, q).astype(numpy.int32)
+
+        def test(c, mask):
+            '''Returns the mask of the lanes in mask for which condition c
+               holds. The right operand of and and or is only evaluated for
+               the lanes that the left operand does not decide.'''
+            kind = c[0]
+            if kind == I.AND:
+                left = test(c[1], mask)
+                return test(c[2], left)
+            if kind == I.OR:
+                left = test(c[1], mask)
+                return left | test(c[2], mask & ~left)
+            if kind == I.NOT:
+                return mask & ~test(c[1], mask) & (status == RUNNING)
+            a = value(c[1], mask)
+            b = value(c[2], mask)
+            if kind == I.LESS:
+                result = a < b
+            elif kind == I.EQ:
+                result = a == b
+            elif kind == I.GRTR:
+                result = a > b
+            elif kind == I.LEQ:
+                result = a <= b
+            elif kind == I.NEQ:
+                result = a != b
+            else:
+                result = a >= b
+            return mask & result & (status == RUNNING)
+
+        def execute(block, mask):
+            for st in block:
+                kind = st[0]
+                if kind == I.ASSIGN:
+                    result = value(st[2], mask)
+                    mask = mask & (status == RUNNING)
+                    slots[st[1]] = numpy.where(mask, result, slots[st[1]])
+                elif kind == I.IF:
+                    then = test(st[1], mask)
+                    mask = mask & (status == RUNNING)
+                    if then.any():
+                        execute(st[2], then)
+                    again = mask & ~then
+                    if st[3] and again.any():
+                        execute(st[3], again)
+                elif kind == I.WRITE:
+                    result = value(st[1], mask)
+                    mask = mask & (status == RUNNING)
+                    lanes = numpy.flatnonzero(mask)
+                    written.append((lanes,
+                                    numpy.broadcast_to(result, (count,))[lanes]))
+                elif kind == I.READ:
+                    stop(mask & (position >= lengths) & mismatched,
+                         INPUT_MISMATCH)
+                    stop(mask & (position >= lengths), END_OF_INPUT)
+                    lanes = numpy.flatnonzero(mask & (status == RUNNING))
+                    slots[st[1], lanes] = inputs[lanes, position[lanes]]
+                    position[lanes] += 1
+                else: # WHILE
+                    loop = test(st[1], mask)
+                    while loop.any():
+                        execute(st[2], loop)
+                        loop = test(st[1], loop)
+                mask = mask & (status == RUNNING)
+                if not mask.any():
+                    return
+
+        with numpy.errstate(over='ignore'):
+            execute(self.program, numpy.ones(count, bool))
+        # Sorting all written values by lane, keeping their order within a
+        # lane, yields the output of each lane as a slice.
+        outputs = [[] for lane in range(count)]
+        if written:
+            lanes = numpy.concatenate([lanes for lanes, values in written])
+            values = numpy.concatenate([values for lanes, values in written])
+            order = numpy.argsort(lanes, kind='stable')
+            ends = numpy.cumsum(numpy.bincount(lanes, minlength=count))
+            values = values[order].tolist()
+            start = 0
+            for lane, end in enumerate(ends.tolist()):
+                outputs[lane] = values[start:end]
+                start = end
+        return outputs, status.tolist()
+
+def one_at_a_time(tree, lanes):
+    '''Returns the same as Executor(tree).run(lanes), running each lane on its
+       own with interpreter.Interpreter.'''
+    program = interpreter.Interpreter(tree)
+    outputs, status = [], []
+    for inputs in lanes:
+        output = []
+        error = RUNNING
+        try:
+            program.run((interpreter.checked(number) for number in inputs),
+                        output)
+        except ZeroDivisionError:
+            error = DIVISION_BY_ZERO
+        except EOFError:
+            error = END_OF_INPUT
+        except ValueError:
+            error = INPUT_MISMATCH
+        outputs.append(output)
+        status.append(error)
+    return outputs, status
+
+if __name__ == '__main__':
+    import argparse
+    import re
+    arguments = argparse.ArgumentParser(
+        description='Runs a program on many sets of inputs at once, one set '
+        'per line of stdin.')
+    arguments.add_argument('program', help='file with the program')
+    arguments.add_argument('--stats', action='store_true',
+                           help='report lanes per second to stderr')
+    arguments.add_argument('--compare', action='store_true',
+                           help='also run each lane on its own with the '
+                           'interpreter, check that the results agree and '
+                           'report both times to stderr')
+    options = arguments.parse_args()
+
+    with open(options.program) as program_file:
+        tree = compiler.parse(program_file)
+    lanes = [[int(number)
+              for number in re.findall(r'-?[0-9]+', line)]
+             for line in sys.stdin]
+    start = time.perf_counter()
+    outputs, status = Executor(tree).run(lanes)
+    elapsed = time.perf_counter() - start
+    for output, error in zip(outputs, status):
+        print(' '.join([str(number) for number in output] +
+                       (['(' + errors[error] + ')'] if error else [])))
+    if options.stats or options.compare:
+        print(str(len(lanes)) + ' lanes in ' + '%.3f' % elapsed + ' s, ' +
+              '%.0f' % (len(lanes) / max(elapsed, 1e-9)) + ' lanes/s',
+              file=sys.stderr)
+    if options.compare:
+        start = time.perf_counter()
+        expected = one_at_a_time(tree, lanes)
+        alone = time.perf_counter() - start
+        print('one at a time ' + '%.3f' % alone + ' s, ' +
+              '%.0f' % (len(lanes) / max(alone, 1e-9)) + ' lanes/s, ' +
+              ('results agree' if expected == (outputs, status)
+               else 'RESULTS DIFFER'), file=sys.stderr)
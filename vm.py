@@ -0,0 +1,261 @@
+import array
+import sys
+import time
+
+import compiler
+import interpreter
+from compiler import Token
+
+# A register-based virtual machine for the abstract syntax trees of
+# compiler.py, with the 32-bit integer semantics of the JVM. Run a program on
+# the integers in stdin with
+#     python3 vm.py program < input
+# Options:
+#     --listing   print the instructions instead
+#     --stats     report executed instructions per second to stderr
+
+# The following enumerates all instructions. Every instruction takes four
+# integers: the operation and three operands, unused operands being 0.
+# Operands are locations of the register file, except for jump targets,
+# which are instruction numbers.
+#     ADD d a b     d := a + b, likewise SUB, MUL and DIV
+#     MOVE d a      d := a
+#     READ d        d := next input
+#     WRITE a       output a
+#     JUMP t        continue at instruction t
+#     JLT a b t     continue at instruction t if a < b, likewise JEQ, JGT,
+#                   JLE, JNE and JGE
+#     HALT          stop execution
+# The compare-and-branch instructions replace a comparison, which would leave
+# a truth value in a register, and a conditional jump on that value.
+ADD, SUB, MUL, DIV, MOVE, READ, WRITE, JUMP, \
+JLT, JEQ, JGT, JLE, JNE, JGE, HALT = range(15)
+
+names = ['ADD', 'SUB', 'MUL', 'DIV', 'MOVE', 'READ', 'WRITE', 'JUMP',
+         'JLT', 'JEQ', 'JGT', 'JLE', 'JNE', 'JGE', 'HALT']
+
+class Program:
+    '''The interface comprises the constructor, listing and the method run.
+       The registers are the locations of a Symbol_Table: the identifiers
+       of the program, the constants it uses under the key '#' followed by
+       the value, and temporaries for the values of subexpressions under
+       the key '$' followed by their nesting depth.'''
+
+    jump = { '<':JLT, '=':JEQ, '>':JGT, '<=':JLE, '!=':JNE, '>=':JGE }
+    negated = { '<':JGE, '=':JNE, '>':JLE, '<=':JGT, '!=':JEQ, '>=':JLT }
+
+    def __init__(self, tree):
+        '''Translates the Program_AST tree to instructions.'''
+        self.symbol_table = compiler.Symbol_Table()
+        self.constants = {} # locations of constants mapped to their value
+        self.code = array.array('i')
+        self.statements(tree.program)
+        self.emit(HALT)
+        # number of instructions executed by the last run
+        self.executed = 0
+
+    def emit(self, op, a=0, b=0, c=0):
+        '''Appends an instruction and returns its number.'''
+        self.code.extend((op, a, b, c))
+        return len(self.code) // 4 - 1
+
+    def patch(self, jumps, target):
+        '''Sets the target of the jump instructions with the numbers in
+           jumps.'''
+        for number in jumps:
+            self.code[4 * number + 3 if self.code[4 * number] != JUMP
+                      else 4 * number + 1] = target
+
+    def here(self):
+        '''Returns the number of the next instruction.'''
+        return len(self.code) // 4
+
+    def statements(self, tree):
+        for st in tree.statements:
+            if isinstance(st, compiler.Assign_AST):
+                loc = self.symbol_table.location(st.identifier.identifier)
+                self.expression(st.expression, 0, loc)
+            elif isinstance(st, compiler.Write_AST):
+                self.emit(WRITE, self.expression(st.expression, 0))
+            elif isinstance(st, compiler.Read_AST):
+                loc = self.symbol_table.location(st.identifier.identifier)
+                self.emit(READ, loc)
+            elif isinstance(st, compiler.While_AST):
+                # The loop is inverted as in While_AST.code().
+                exit = self.condition(st.condition, False)
+                top = self.here()
+                self.statements(st.body)
+                self.patch(self.condition(st.condition, True), top)
+                self.patch(exit, self.here())
+            else: # If_AST or If_Else_AST
+                skip = self.condition(st.condition, False)
+                self.statements(st.then)
+                if isinstance(st, compiler.If_Else_AST):
+                    end = [self.emit(JUMP)]
+                    self.patch(skip, self.here())
+                    self.statements(st.again)
+                    skip = end
+                self.patch(skip, self.here())
+
+    def condition(self, tree, outcome):
+        '''Emits instructions that jump if condition tree evaluates to
+           outcome and fall through otherwise. Returns the numbers of the
+           jump instructions, whose target is still to be set.'''
+        if isinstance(tree, compiler.Comparison_AST):
+            a = self.expression(tree.left, 0)
+            b = self.expression(tree.right, 1)
+            op = self.jump[tree.op] if outcome else self.negated[tree.op]
+            return [self.emit(op, a, b)]
+        elif tree.op == Token.NOT:
+            return self.condition(tree.left, not outcome)
+        elif (tree.op == Token.AND) == outcome:
+            # and jumping if true, or jumping if false: the left operand
+            # decides only if it has the other outcome
+            skip = self.condition(tree.left, not outcome)
+            result = self.condition(tree.right, outcome)
+            self.patch(skip, self.here())
+            return result
+        else:
+            return self.condition(tree.left, outcome) + \
+                   self.condition(tree.right, outcome)
+
+    def expression(self, tree, depth, target=None):
+        '''Emits instructions that compute expression tree and returns the
+           register that holds its value. It is target, if given, and else
+           the register of a variable or constant or the temporary for
+           depth. Subexpressions use the temporaries of deeper levels.'''
+        if isinstance(tree, compiler.Expression_AST):
+            a = self.expression(tree.left, depth + 1)
+            b = self.expression(tree.right, depth + 2)
+            op = { '+':ADD, '-':SUB, '*':MUL, '/':DIV }
+            if target == None:
+                target = self.symbol_table.location('$' + str(depth))
+            self.emit(op[tree.op], target, a, b)
+            return target
+        if isinstance(tree, compiler.Number_AST):
+            value = interpreter.wrap(int(tree.number))
+            result = self.symbol_table.location('#' + str(value))
+            self.constants[result] = value
+        else:
+            result = self.symbol_table.location(tree.identifier)
+        if target != None:
+            self.emit(MOVE, target, result)
+            return target
+        return result
+
+    def listing(self):
+        '''Returns the instructions as text, one per line.'''
+        result = ''
+        for number in range(self.here()):
+            op, a, b, c = self.code[4 * number:4 * number + 4]
+            operands = { MOVE:2, READ:1, WRITE:1, JUMP:1, HALT:0 }
+            result += str(number) + ': ' + \
+                      ' '.join([names[op]] +
+                               [str(x) for x in (a, b, c)[:operands.get(op, 3)]])
+            result += '\n'
+        return result
+
+    def run(self, inputs, output):
+        '''Executes the program. Read statements take their values from the
+           iterator inputs, write statements append their values to the list
+           output. Variables that are read before they are assigned hold 0.
+           Raises ZeroDivisionError on division by zero and EOFError if
+           inputs is exhausted.'''
+        # Indexing a list of tuples and unpacking a tuple are cheaper in
+        # CPython than reading four elements of the array.
+        code = self.code
+        instructions = [tuple(code[i:i + 4]) for i in range(0, len(code), 4)]
+        registers = [0] * self.symbol_table.size()
+        for loc, value in self.constants.items():
+            registers[loc] = value
+        write = output.append
+        pc = 0
+        executed = 0
+        try:
+            while True:
+                op, a, b, c = instructions[pc]
+                executed += 1
+                pc += 1
+                if op <= MUL:
+                    if op == ADD:
+                        r = registers[b] + registers[c]
+                    elif op == SUB:
+                        r = registers[b] - registers[c]
+                    else:
+                        r = registers[b] * registers[c]
+                    if -2147483648 <= r <= 2147483647:
+                        registers[a] = r
+                    else:
+                        registers[a] = interpreter.wrap(r)
+                elif op >= JLT:
+                    if op == JLT:
+                        if registers[a] < registers[b]:
+                            pc = c
+                    elif op == JGE:
+                        if registers[a] >= registers[b]:
+                            pc = c
+                    elif op == JNE:
+                        if registers[a] != registers[b]:
+                            pc = c
+                    elif op == JEQ:
+                        if registers[a] == registers[b]:
+                            pc = c
+                    elif op == JGT:
+                        if registers[a] > registers[b]:
+                            pc = c
+                    elif op == JLE:
+                        if registers[a] <= registers[b]:
+                            pc = c
+                    else: # HALT
+                        break
+                elif op == JUMP:
+                    pc = a
+                elif op == MOVE:
+                    registers[a] = registers[b]
+                elif op == DIV:
+                    x, y = registers[b], registers[c]
+                    r = abs(x) // abs(y)
+                    if (x < 0) != (y < 0):
+                        r = -r
+                    registers[a] = interpreter.wrap(r)
+                elif op == WRITE:
+                    write(registers[a])
+                else: # READ
+                    for number in inputs:
+                        registers[a] = number
+                        break
+                    else:
+                        raise EOFError('no input left for read')
+        finally:
+            self.executed = executed
+
+if __name__ == '__main__':
+    import argparse
+    arguments = argparse.ArgumentParser(
+        description='Runs a program on the integers in stdin in a register '
+        'machine.')
+    arguments.add_argument('program', help='file with the program')
+    arguments.add_argument('--listing', action='store_true',
+                           help='print the instructions instead')
+    arguments.add_argument('--stats', action='store_true',
+                           help='report executed instructions per second '
+                           'to stderr')
+    options = arguments.parse_args()
+
+    with open(options.program) as program_file:
+        machine = Program(compiler.parse(program_file))
+    if options.listing:
+        print(machine.listing(), end='')
+        sys.exit()
+    output = []
+    start = time.perf_counter()
+    try:
+        machine.run(interpreter.integers(sys.stdin), output)
+    finally:
+        elapsed = time.perf_counter() - start
+        sys.stdout.write(''.join(str(number) + '\n' for number in output))
+        if options.stats:
+            print(str(machine.executed) + ' instructions in ' +
+                  '%.3f' % elapsed + ' s, ' +
+                  '%.0f' % (machine.executed / max(elapsed, 1e-9)) +
+                  ' instructions/s', file=sys.stderr)